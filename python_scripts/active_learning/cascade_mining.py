@@ -0,0 +1,189 @@
+# This script runs the mining scan of find_FPsample.py as a two-stage cascade.
+# Most archive images are blurred or contain no black bunches, so running the full detector on every image wastes
+# most of the scan. Each image is decoded once and then:
+#   1. Gate: the Laplacian blur score (qua_classifier.blur_score) and a nano-model pass at gate_img_size (160 px).
+#      Blurred images and images whose best gate confidence is below gate_low are dropped; images whose best gate
+#      confidence is at or above gate_high are accepted without a second stage.
+#   2. Only the uncertain images in between go to the full detector (small or large model at 640).
+# Accepted images are moved to output_folder, as in find_FPsample.py.
+#
+# calibrate() tunes the thresholds on a calibration folder: it runs the full detector on every image as the baseline,
+# sweeps the gate thresholds and picks the ones that send the fewest images to the full detector while keeping
+# target_recall of the baseline's positive images. The chosen thresholds are saved to thresholds_path and used by the scan.
+
+import os
+import sys
+import json
+import time
+import numpy as np
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+from active_learning import find_FPsample
+from data_processing_annotation.qua_classifier import blur_score
+
+# Path to YOLOv5 directory, gate and full models, and dataset
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+gate_weights = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project\exp7\weights\best.pt"  # Nano
+full_weights = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_small\exp12\weights\best.pt"  # Small (or Large)
+root_folder = r"D:\UniDoc\y2s1\SEGP\dataset\archive"
+output_folder = r"D:\UniDoc\y2s1\SEGP\dataset\false_negative"
+calibration_folder = r"D:\UniDoc\y2s1\SEGP\dataset\cascade_calibration\img"
+thresholds_path = 'cascade_thresholds.json'
+gate_img_size = 160
+full_img_size = 640
+batch_size = 32
+
+# Gate thresholds (replaced by the calibrated values when thresholds_path exists)
+blur_threshold = 100.0  # Laplacian variance below which an image counts as blurred
+gate_low = 0.05  # Best gate confidence below this: dropped as empty
+gate_high = 0.6  # Best gate confidence at or above this: accepted without the full detector
+full_conf = 0.4  # Same confidence threshold as find_FPsample.py
+target_recall = 0.98  # Share of the full detector's positive images the cascade must keep
+target_accept_precision = 0.95  # Share of gate-accepted images the full detector also finds positive
+
+# Function to load the calibrated thresholds if they exist
+def load_thresholds(path=None):
+    global blur_threshold, gate_low, gate_high
+    path = path or thresholds_path
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            thresholds = json.load(f)
+        blur_threshold, gate_low, gate_high = thresholds['blur_threshold'], thresholds['gate_low'], thresholds['gate_high']
+        print(f"Using calibrated thresholds from {path}: blur {blur_threshold:.1f}, low {gate_low:.3f}, high {gate_high:.3f}")
+
+# Function to load the gate and full models
+def load_models():
+    gate = detector.load_raw_model(gate_weights, yolov5_directory)
+    full = detector.load_raw_model(full_weights, yolov5_directory)
+    return gate, full
+
+# Function to get the best detection confidence of every image in a batch
+def best_confidences(model, arrays, img_size, conf_thres):
+    results, _ = detector.detect_batch(model, arrays, img_size, conf_thres)
+    return np.array([float(d[:, 4].max()) if len(d) else 0.0 for d in results])
+
+# Function to score a batch with the gate: blur score and best nano confidence at gate_img_size
+def gate_scores(gate, arrays):
+    with instrumentation.stage('gate'):
+        blur = np.array([blur_score(array) for array in arrays])
+        confidences = best_confidences(gate, arrays, gate_img_size, 0.01)
+    return blur, confidences
+
+# Function to split a batch into dropped / accepted / uncertain with the current thresholds
+def gate_decisions(blur, confidences, blur_threshold, gate_low, gate_high):
+    dropped = (blur < blur_threshold) | (confidences < gate_low)
+    accepted = ~dropped & (confidences >= gate_high)
+    uncertain = ~dropped & ~accepted
+    return dropped, accepted, uncertain
+
+# Function to run the cascade on one batch of image paths, returns a boolean 'has bunches' per image and stage counts
+def cascade_batch(gate, full, image_paths):
+    arrays = [detector.decode_image(path) for path in image_paths]
+    blur, confidences = gate_scores(gate, arrays)
+    dropped, accepted, uncertain = gate_decisions(blur, confidences, blur_threshold, gate_low, gate_high)
+    positive = accepted.copy()
+    if uncertain.any():
+        with instrumentation.stage('full_detector'):
+            indices = np.where(uncertain)[0]
+            full_confidences = best_confidences(full, [arrays[i] for i in indices], full_img_size, full_conf)
+            positive[indices] = full_confidences >= full_conf
+    return positive, {'dropped': int(dropped.sum()), 'accepted': int(accepted.sum()), 'uncertain': int(uncertain.sum())}
+
+# Function to run the cascade mining scan over every img folder below root_folder
+def cascade_process_all_images(root_folder=None, output_folder=None):
+    root_folder = root_folder or globals()['root_folder']
+    output_folder = output_folder or globals()['output_folder']
+    load_thresholds()
+    gate, full = load_models()
+    os.makedirs(output_folder, exist_ok=True)
+
+    totals = {'images': 0, 'dropped': 0, 'accepted': 0, 'uncertain': 0, 'moved': 0}
+    for img_folder in find_FPsample.find_img_folders(root_folder):
+        image_paths = detector.list_images(img_folder)
+        print(f"\nProcessing {len(image_paths)} images in folder: {img_folder}")
+        for i in range(0, len(image_paths), batch_size):
+            batch_paths = image_paths[i:i + batch_size]
+            positive, counts = cascade_batch(gate, full, batch_paths)
+            for image_path in np.array(batch_paths)[positive]:
+                find_FPsample.move_processed_image(str(image_path), output_folder)
+            totals['images'] += len(batch_paths)
+            totals['moved'] += int(positive.sum())
+            for stage, count in counts.items():
+                totals[stage] += count
+
+    for stage, count in totals.items():
+        instrumentation.count(f'cascade_{stage}', count)
+    if totals['images']:
+        print(f"\n{totals['images']} images: {totals['dropped']} dropped by the gate, {totals['accepted']} accepted by the gate, "
+              f"{totals['uncertain']} ({totals['uncertain'] / totals['images']:.0%}) sent to the full detector, {totals['moved']} moved")
+    return totals
+
+# Function to sweep the gate thresholds on calibration scores
+# Returns every setting that meets target_recall and target_accept_precision, cheapest (fewest full-detector calls) first
+def sweep_thresholds(blur, confidences, baseline_positive):
+    positives = max(int(baseline_positive.sum()), 1)
+    blur_candidates = [0.0] + list(np.percentile(blur, [1, 2, 5, 10, 15, 20, 30]))
+    low_candidates = [0.0, 0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.3]
+    high_candidates = [0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.01]  # 1.01: the gate never accepts on its own
+    settings = []
+    for blur_threshold in blur_candidates:
+        for low in low_candidates:
+            for high in high_candidates:
+                if high <= low:
+                    continue
+                dropped, accepted, uncertain = gate_decisions(blur, confidences, blur_threshold, low, high)
+                recall = 1.0 - (dropped & baseline_positive).sum() / positives
+                accept_precision = (accepted & baseline_positive).sum() / accepted.sum() if accepted.any() else 1.0
+                if recall >= target_recall and accept_precision >= target_accept_precision:
+                    settings.append({'blur_threshold': float(blur_threshold), 'gate_low': low, 'gate_high': high,
+                                     'recall': float(recall), 'accept_precision': float(accept_precision),
+                                     'full_fraction': float(uncertain.mean()), 'dropped_fraction': float(dropped.mean())})
+    return sorted(settings, key=lambda s: (s['full_fraction'], -s['recall']))
+
+# Function to calibrate the gate thresholds against the full detector on a calibration folder
+def calibrate(calibration_folder=None, thresholds_path=None):
+    calibration_folder = calibration_folder or globals()['calibration_folder']
+    thresholds_path = thresholds_path or globals()['thresholds_path']
+    gate, full = load_models()
+    image_paths = detector.list_images(calibration_folder)
+    print(f"Calibrating on {len(image_paths)} images from {calibration_folder}")
+
+    blur, confidences, baseline = [], [], []
+    gate_seconds = full_seconds = 0.0
+    for i in range(0, len(image_paths), batch_size):
+        arrays = [detector.decode_image(path) for path in image_paths[i:i + batch_size]]
+        start = time.perf_counter()
+        batch_blur, batch_confidences = gate_scores(gate, arrays)
+        gate_seconds += time.perf_counter() - start
+        start = time.perf_counter()
+        baseline.append(best_confidences(full, arrays, full_img_size, full_conf) >= full_conf)
+        full_seconds += time.perf_counter() - start
+        blur.append(batch_blur)
+        confidences.append(batch_confidences)
+    blur, confidences, baseline = np.concatenate(blur), np.concatenate(confidences), np.concatenate(baseline)
+
+    settings = sweep_thresholds(blur, confidences, baseline)
+    print(f"Full detector baseline: {int(baseline.sum())} of {len(baseline)} images with bunches")
+    if not settings:
+        print(f"No gate setting reaches recall {target_recall:.1%}; keep running the full detector on every image.")
+        return None
+    best = settings[0]
+    # Estimated scan time per image: gate on every image plus the full detector on the uncertain share
+    gate_per_image, full_per_image = gate_seconds / len(baseline), full_seconds / len(baseline)
+    best['speedup'] = full_per_image / (gate_per_image + best['full_fraction'] * full_per_image)
+    best['calibration_images'] = len(baseline)
+    with open(thresholds_path, 'w') as f:
+        json.dump(best, f, indent=4)
+
+    print(f"Chosen thresholds: blur {best['blur_threshold']:.1f}, low {best['gate_low']}, high {best['gate_high']}")
+    print(f"Recall vs full detector: {best['recall']:.1%} (loss {1 - best['recall']:.1%}), "
+          f"gate-accept precision {best['accept_precision']:.1%}")
+    print(f"Full detector runs on {best['full_fraction']:.0%} of images, {best['dropped_fraction']:.0%} dropped; "
+          f"estimated speedup {best['speedup']:.1f}x. Saved to {thresholds_path}")
+    return best
+
+if __name__ == '__main__':
+    cascade_process_all_images()
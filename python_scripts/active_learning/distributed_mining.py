@@ -0,0 +1,188 @@
+# This script runs the mining scan of find_FPsample.py on many workers at once.
+# plan() splits the images of every 'img' folder below root_folder into work units of unit_size images and puts them
+# in a SQLite work queue (work_queue.py). Any number of workers, on this machine or on other hosts that see the same
+# queue file and archive, then claim units, run the detector and store per-image results in the queue's results table.
+# Crashed workers lose their lease and their units are handed out again; failing units are retried up to max_attempts.
+# Image paths are stored relative to root_folder with '/' separators, so each host can mount the archive under its own
+# path, and Windows and Linux workers can share one queue.
+#
+# Typical use:
+#   python distributed_mining.py                 -> plan + run local_workers processes on this machine
+#   bbunch distributed-mine plan <root> <db>     -> create the queue once
+#   bbunch distributed-mine work <root> <db>     -> start a worker (run on as many hosts as available)
+#   bbunch distributed-mine collect <root> <db> <output>  -> move the images with detections, as find_FPsample.py does
+
+import os
+import sys
+import time
+import multiprocessing
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+from active_learning import work_queue
+from active_learning.find_FPsample import find_img_folders
+
+# Path to YOLOv5 directory, trained weights, and dataset
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+weights_path = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_small\exp9\weights\best.pt"
+root_folder = r"D:\UniDoc\y2s1\SEGP\dataset\archive"
+output_folder = r"D:\UniDoc\y2s1\SEGP\dataset\false_negative"
+queue_path = r"D:\UniDoc\y2s1\SEGP\dataset\mining_queue.sqlite"
+img_size = 640
+conf_thres = 0.4
+batch_size = 32
+unit_size = 256  # Images per work unit
+local_workers = 4
+shared_model = True  # Local CPU workers share one frozen copy of the weights (shared_worker_pool.py) instead of loading their own
+
+# Function to turn a queued relative path ('/' separated) into a path on this host
+def local_path(root_folder, relative_path):
+    return os.path.join(root_folder, relative_path.replace('/', os.sep))
+
+# Function to create the work units for every img folder below root_folder
+def plan(root_folder=None, queue_path=None, unit_size=None):
+    root_folder = root_folder or globals()['root_folder']
+    queue_path = queue_path or globals()['queue_path']
+    unit_size = unit_size or globals()['unit_size']
+    connection = work_queue.connect(queue_path)
+    if connection.execute("SELECT COUNT(*) FROM units").fetchone()[0]:
+        print(f"{queue_path} already holds work units; delete it to plan again.")
+        return 0
+
+    units = []
+    with instrumentation.stage('plan'):
+        for img_folder in find_img_folders(root_folder):
+            files = [os.path.relpath(path, root_folder).replace(os.sep, '/') for path in detector.list_images(img_folder)]
+            units += [{'files': files[i:i + unit_size]} for i in range(0, len(files), unit_size)]
+    work_queue.add_units(connection, units)
+    connection.close()
+    print(f"Planned {len(units)} work units in {queue_path}")
+    return len(units)
+
+# Function to run the detector on one unit, returns {relative path: [detections, best confidence]}
+def process_unit(model, root_folder, payload):
+    results = {}
+    files = payload['files']
+    for i in range(0, len(files), batch_size):
+        batch = files[i:i + batch_size]
+        paths, readable = [], []
+        for relative_path in batch:
+            path = local_path(root_folder, relative_path)
+            if os.path.exists(path):  # Already moved by an earlier collect
+                paths.append(path)
+                readable.append(relative_path)
+        if not paths:
+            continue
+        detections, _ = detector.detect_batch(model, paths, img_size, conf_thres)
+        for relative_path, boxes in zip(readable, detections):
+            results[relative_path] = [len(boxes), round(float(boxes[:, 4].max()), 4) if len(boxes) else 0.0]
+    return results
+
+# Function to run one worker until the queue has no open units left
+def run_worker(root_folder=None, queue_path=None, threads=0, settings=None, model=None):
+    # Settings passed by run_local; a spawned process starts again from this module's defaults
+    if settings:
+        globals().update(settings)
+    root_folder = root_folder or globals()['root_folder']
+    queue_path = queue_path or globals()['queue_path']
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+    worker = work_queue.worker_name()
+    connection = work_queue.connect(queue_path)
+    model = model or detector.load_raw_model(weights_path, yolov5_directory)
+    images = units = 0
+    start = time.perf_counter()
+    while True:
+        claimed = work_queue.claim_unit(connection, worker)
+        if claimed is None:
+            if not work_queue.has_open_units(connection):
+                break
+            # Other workers still hold leases; wait in case one of them expires
+            time.sleep(min(work_queue.lease_seconds / 4, 10))
+            continue
+
+        unit_id, payload = claimed
+        keeper = work_queue.LeaseKeeper(queue_path, unit_id, worker)
+        keeper.start()
+        try:
+            results = process_unit(model, root_folder, payload)
+        except Exception as e:
+            keeper.stop()
+            print(f"[{worker}] unit {unit_id} failed: {e}")
+            work_queue.fail_unit(connection, unit_id, worker, f"{type(e).__name__}: {e}")
+            continue
+        keeper.stop()
+        if work_queue.complete_unit(connection, unit_id, worker, results):
+            images += len(results)
+            units += 1
+        else:
+            print(f"[{worker}] lost the lease of unit {unit_id}; its results were discarded")
+
+    elapsed = time.perf_counter() - start
+    connection.close()
+    instrumentation.count('units_done', units)
+    print(f"[{worker}] finished {units} units, {images} images in {elapsed:.1f}s ({images / max(elapsed, 1e-9):.1f} images/s)")
+    return images
+
+# Function to run several workers on this machine, splitting the CPU threads between them
+def run_local(workers=None, root_folder=None, queue_path=None):
+    workers = workers or local_workers
+    queue_path = queue_path or globals()['queue_path']
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    settings = {name: globals()[name] for name in ('yolov5_directory', 'weights_path', 'img_size', 'conf_thres', 'batch_size')}
+    model = None
+    # Sharing only pays off on CPU; with a GPU every worker loads its own copy onto it as before
+    device = detector.get_device()
+    if shared_model and device == 'cpu':
+        from active_learning.shared_worker_pool import load_shared_model
+        model = load_shared_model(weights_path, yolov5_directory, device)
+    # Forked workers map the parent's weight pages; spawned ones receive the shared-memory tensors
+    use_fork = model is not None and 'fork' in multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if use_fork else 'spawn')
+    processes = [context.Process(target=run_worker, args=(root_folder, queue_path, threads, settings, model)) for _ in range(workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    connection = work_queue.connect(queue_path)
+    status = work_queue.queue_status(connection)
+    images = len(work_queue.read_results(connection))
+    connection.close()
+    print(f"{workers} workers x {threads} threads: {images} images in {elapsed:.1f}s ({images / max(elapsed, 1e-9):.1f} images/s)")
+    print(f"Queue: {status}")
+    return images / max(elapsed, 1e-9)
+
+# Function to move the images with detections to the output folder, as find_FPsample.py does
+def collect(root_folder=None, queue_path=None, output_folder=None):
+    from active_learning.find_FPsample import move_processed_image
+    root_folder = root_folder or globals()['root_folder']
+    queue_path = queue_path or globals()['queue_path']
+    output_folder = output_folder or globals()['output_folder']
+    os.makedirs(output_folder, exist_ok=True)
+    connection = work_queue.connect(queue_path)
+    results = work_queue.read_results(connection)
+    status = work_queue.queue_status(connection)
+    connection.close()
+
+    moved = 0
+    for relative_path, (detections, _) in sorted(results.items()):
+        path = local_path(root_folder, relative_path)
+        if detections and os.path.exists(path):
+            move_processed_image(path, output_folder)
+            moved += 1
+    print(f"{len(results)} images scanned, {moved} with detections moved to {output_folder}")
+    if status['failed']:
+        print(f"Warning: {status['failed']} units failed; see the error column of the units table in {queue_path}")
+    return moved
+
+if __name__ == '__main__':
+    plan()
+    run_local()
+    collect()
@@ -0,0 +1,195 @@
+# This script runs several trained detectors (YOLOv5 nano/small/large and YOLOv8 small) together with optional
+# flip/scale test-time augmentation, and fuses their boxes with weighted box fusion (WBF).
+# Each batch of images is decoded and letterboxed once; every model and augmentation reuses that batch tensor,
+# so adding a model or an augmentation costs one forward pass and not another round of JPEG decoding.
+# The fused boxes are written as YOLO label files with confidences, to be used as pseudo-labels in the active-learning loop.
+
+import os
+import sys
+import numpy as np
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+
+# Path to YOLOv5 directory, trained weights, and dataset
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+weights_paths = [
+    r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project\exp7\weights\best.pt",  # Nano
+    r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_small\exp12\weights\best.pt",  # Small
+    r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_large\exp\weights\best.pt",  # Large
+]
+yolov8_weights_paths = []  # e.g. yolov8_training_project_small/runs/train/custom_model/weights/best.pt
+image_folder = r"D:\UniDoc\y2s1\SEGP\dataset\archive\img"
+output_folder = r"D:\UniDoc\y2s1\SEGP\dataset\ensemble_labels"
+img_size = 640
+batch_size = 16
+
+# Test-time augmentation: input scales to run and whether to add a horizontally flipped copy
+tta_scales = [1.0]
+tta_flip = False
+
+# Thresholds: each model/augmentation keeps low-confidence boxes so WBF can combine weak agreeing votes
+run_conf_thres = 0.1
+run_iou_thres = 0.45
+wbf_iou_thres = 0.55
+conf_thres = 0.4  # Applied to the fused boxes
+max_det = 100
+
+# Function to load all the ensemble members
+def load_models(weights_paths=None, yolov8_weights_paths=None, yolov5_directory=None, device=None):
+    device = device or detector.get_device()
+    models = [detector.load_raw_model(path, yolov5_directory or globals()['yolov5_directory'], device)
+              for path in (weights_paths if weights_paths is not None else globals()['weights_paths'])]
+    models += [detector.load_yolov8_model(path, device)
+               for path in (yolov8_weights_paths if yolov8_weights_paths is not None else globals()['yolov8_weights_paths'])]
+    return models
+
+# Function to resize a batch tensor by a scale factor, padding the sides up to a multiple of the stride
+# Returns the tensor and the (x, y) ratios actually applied, which differ slightly from scale after rounding the size
+def scale_tensor(tensor, scale, stride=32):
+    import torch.nn.functional as F
+    if scale == 1.0:
+        return tensor, (1.0, 1.0)
+    height, width = tensor.shape[2:]
+    new_height, new_width = int(height * scale), int(width * scale)
+    tensor = F.interpolate(tensor, size=(new_height, new_width), mode='bilinear', align_corners=False)
+    pad_height = (stride - new_height % stride) % stride
+    pad_width = (stride - new_width % stride) % stride
+    return F.pad(tensor, (0, pad_width, 0, pad_height), value=detector.PAD_VALUE / 255.0), (new_width / width, new_height / height)
+
+# Function to run every model and augmentation on one batch tensor
+# Returns, for every image, a list with one (n, 6) array per model/augmentation run, in letterboxed coordinates
+def run_members(models, tensor, scales, flip):
+    import torch
+    runs_per_image = [[] for _ in range(tensor.shape[0])]
+    width = tensor.shape[3]
+    for scale in scales:
+        with instrumentation.stage('tta_transform'):
+            scaled, (ratio_x, ratio_y) = scale_tensor(tensor, scale)
+            # The flipped copy rides in the same forward pass as the original
+            inputs = torch.cat([scaled, scaled.flip(3)]) if flip else scaled
+        for model in models:
+            predictions = detector.forward(model, inputs.to(detector.model_device(model)))
+            detections = detector.non_max_suppression(predictions, run_conf_thres, run_iou_thres, max_det)
+            for i, boxes in enumerate(detections):
+                boxes = boxes.cpu().numpy()
+                image_index = i % tensor.shape[0]
+                if i >= tensor.shape[0]:
+                    # Undo the flip: mirror x coordinates around the scaled width
+                    scaled_width = scaled.shape[3]
+                    boxes[:, [0, 2]] = scaled_width - boxes[:, [2, 0]]
+                boxes[:, [0, 2]] /= ratio_x
+                boxes[:, [1, 3]] /= ratio_y
+                boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+                runs_per_image[image_index].append(boxes)
+    return runs_per_image
+
+# Function to compute the IoU matrix of a set of boxes, one coordinate column at a time (float32 is enough here)
+def pairwise_iou(boxes):
+    x1, y1, x2, y2 = boxes.astype(np.float32).T
+    width = np.maximum(np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]), 0)
+    height = np.maximum(np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]), 0)
+    intersection = width * height
+    areas = (x2 - x1) * (y2 - y1)
+    return intersection / np.maximum(areas[:, None] + areas[None, :] - intersection, 1e-9)
+
+# Function to pick the cluster seeds of WBF: going down the scores, a box starts a new cluster unless it overlaps an
+# earlier seed by more than iou_thres. overlaps[i, j] is True when box j scores higher than box i and overlaps it.
+# Iterating "seed = no overlapping earlier seed" from all boxes fixes one more box per pass in the worst case, but
+# settles after a few passes on real detections, and every pass is a single matrix operation
+def cluster_seeds(overlaps):
+    seeds = np.ones(len(overlaps), dtype=bool)
+    while True:
+        updated = ~(overlaps & seeds[None, :]).any(axis=1)
+        if (updated == seeds).all():
+            return seeds
+        seeds = updated
+
+# Function to fuse the boxes of several runs (Solovyev et al., "Weighted boxes fusion", 2021)
+# runs: list of (n, 6) arrays [x1, y1, x2, y2, conf, cls]; weights: optional weight per run
+# Clusters are formed against their seed box (the highest-scoring member) instead of the running fused box, so the
+# whole fusion is a few matrix operations per image instead of a Python loop over the boxes
+def weighted_boxes_fusion(runs, weights=None, iou_thres=0.55, skip_box_thres=0.0):
+    weights = np.ones(len(runs)) if weights is None else np.asarray(weights, dtype=np.float64)
+    non_empty = [(run, weight) for run, weight in zip(runs, weights) if len(run)]
+    if not non_empty:
+        return np.zeros((0, 6), dtype=np.float32)
+
+    boxes = np.concatenate([run[:, :4] for run, _ in non_empty]).astype(np.float64)
+    scores = np.concatenate([run[:, 4] * weight for run, weight in non_empty])
+    classes = np.concatenate([run[:, 5] for run, _ in non_empty])
+    keep = scores >= skip_box_thres
+    order = np.argsort(-scores[keep], kind='stable')
+    boxes, scores, classes = boxes[keep][order], scores[keep][order], classes[keep][order]
+    if not len(boxes):
+        return np.zeros((0, 6), dtype=np.float32)
+
+    # Sorted IoU matrix, restricted to pairs of the same class
+    ious = pairwise_iou(boxes)
+    ious[classes[:, None] != classes[None, :]] = 0
+    seeds = np.flatnonzero(cluster_seeds(np.tril(ious > iou_thres, k=-1)))
+
+    # Every box joins the seed it overlaps most; a seed has IoU 1 with itself and every other box overlaps a seed
+    cluster = ious[:, seeds].argmax(axis=1)
+    score_sums = np.bincount(cluster, weights=scores, minlength=len(seeds))
+    members = np.bincount(cluster, minlength=len(seeds))
+    fused_boxes = np.column_stack([np.bincount(cluster, weights=boxes[:, j] * scores, minlength=len(seeds))
+                                   for j in range(4)]) / np.maximum(score_sums, 1e-12)[:, None]
+
+    # Boxes found by only some of the runs get their confidence scaled down
+    confidence = score_sums / members
+    confidence *= np.minimum(members, weights.sum()) / weights.sum()
+    fused = np.column_stack([fused_boxes, confidence, classes[seeds]])
+    return fused[np.argsort(-fused[:, 4], kind='stable')].astype(np.float32)
+
+# Function to run the ensemble on a list of images
+# Returns the fused detections of each image in original pixel coordinates and each image's (height, width)
+def ensemble_detect(models, images, scales=None, flip=None, member_weights=None):
+    scales = scales or tta_scales
+    flip = tta_flip if flip is None else flip
+    stride = max(detector.model_stride(model) for model in models)
+    size = int(np.ceil(img_size / stride) * stride)
+
+    batch, meta = detector.preprocess_batch(images, size)
+    tensor = detector.to_tensor(batch)
+    runs_per_image = run_members(models, tensor, scales, flip)
+
+    # Member weights are per model; every augmentation of a model shares its weight
+    # (runs are ordered scale -> model -> original/flipped, as appended by run_members)
+    run_weights = None
+    if member_weights is not None:
+        run_weights = [weight for _ in scales for weight in member_weights for _ in range(2 if flip else 1)]
+
+    results = []
+    with instrumentation.stage('wbf'):
+        for runs, image_meta in zip(runs_per_image, meta):
+            fused = weighted_boxes_fusion(runs, run_weights, wbf_iou_thres)
+            fused = fused[fused[:, 4] >= conf_thres][:max_det]
+            results.append(detector.scale_boxes(fused, image_meta))
+    instrumentation.count('images_detected', len(images))
+    return results, [m['shape'] for m in meta]
+
+# Function to run the ensemble over a folder and write YOLO labels with confidences
+def ensemble_detect_folder(image_folder=image_folder, output_folder=output_folder, models=None, scales=None, flip=None):
+    models = models or load_models()
+    os.makedirs(output_folder, exist_ok=True)
+    image_paths = detector.list_images(image_folder)
+    labeled = 0
+    for i in range(0, len(image_paths), batch_size):
+        batch_paths = image_paths[i:i + batch_size]
+        print(f"Processing batch {i // batch_size + 1} with {len(batch_paths)} images...")
+        results, shapes = ensemble_detect(models, batch_paths, scales, flip)
+        for image_path, detections, shape in zip(batch_paths, results, shapes):
+            if not len(detections):
+                continue
+            label_path = os.path.join(output_folder, os.path.splitext(os.path.basename(image_path))[0] + '.txt')
+            with open(label_path, 'w') as f:
+                f.write('\n'.join(detector.to_yolo_lines(detections, shape)) + '\n')
+            labeled += 1
+    print(f"Wrote labels for {labeled} of {len(image_paths)} images to {output_folder}")
+    return labeled
+
+if __name__ == '__main__':
+    ensemble_detect_folder()
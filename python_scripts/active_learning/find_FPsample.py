@@ -3,12 +3,18 @@
 # It searches for 'img' folders recursively, runs inference on images in batches, and moves images with detections to a specified output folder.
 # The script uses GPU acceleration, custom confidence thresholds, and parallel preprocessing for efficient processing.
 
+import io
 import os
-import torch
+import sys
 from PIL import Image
 import shutil
 from concurrent.futures import ThreadPoolExecutor
 
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+
 # Path to YOLOv5 directory, trained weights, and dataset
 yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
 weights_path = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_small\exp9\weights\best.pt"
@@ -16,30 +22,64 @@ img_size = 640
 root_folder = r"D:\UniDoc\y2s1\SEGP\dataset\archive"  # Root folder containing multiple subfolders
 output_folder = r"D:\UniDoc\y2s1\SEGP\dataset\false_negative"  # Folder to store processed images
 
-# Ensure the output folder exists
-os.makedirs(output_folder, exist_ok=True)
-
-# Load YOLOv5 model using Torch Hub
-device = 'cuda' if torch.cuda.is_available() else 'cpu'
-model = torch.hub.load(yolov5_directory, 'custom', path=weights_path, source='local').to(device)
-model.conf = 0.4  # Set confidence threshold
-model.iou = 0.45  # Set IoU threshold
-model.max_det = 100  # Maximum number of detections per image
-model.eval()
+device = None  # Chosen on first use so importing the helpers does not start CUDA
+model = None  # Loaded on first use so the helpers can be imported without the weights
+
+# Function to pick the GPU if available
+def get_device():
+    global device
+    if device is None:
+        import torch
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    return device
+
+# Function to load YOLOv5 model using Torch Hub
+def load_model(weights=None, repo_directory=None):
+    import torch
+    model = torch.hub.load(repo_directory or yolov5_directory, 'custom', path=weights or weights_path, source='local').to(get_device())
+    model.conf = 0.4  # Set confidence threshold
+    model.iou = 0.45  # Set IoU threshold
+    model.max_det = 100  # Maximum number of detections per image
+    model.eval()
+    return model
+
+# Function to return the shared model, loading it the first time it is needed
+def get_model():
+    global model
+    if model is None:
+        model = load_model()
+    return model
 
 # Function to preprocess images
 def preprocess_image(image_path):
-    img = Image.open(image_path).convert('RGB')
-    img = img.resize((img_size, img_size))  # Resize to YOLOv5 input size
+    with instrumentation.stage('decode'):
+        img = Image.open(image_path).convert('RGB')
+    with instrumentation.stage('resize'):
+        # Longest side to the YOLOv5 input size, keeping the aspect ratio; AutoShape letterboxes each batch to the
+        # smallest stride-aligned rectangle, e.g. 640x480 for 4:3 photos instead of a stretched 640x640 square
+        ratio = img_size / max(img.size)
+        img = img.resize((max(1, round(img.width * ratio)), max(1, round(img.height * ratio))))
     return img
 
 # Function to perform batch inference
-def batch_inference(image_paths):
+def batch_inference(image_paths, model=None):
+    if model is None:
+        model = get_model()
     images = [preprocess_image(path) for path in image_paths]
-    results = model(images)  # Perform batch inference
-    return results.pandas().xyxy  # Return detection results as pandas DataFrames
+    with instrumentation.stage('model_call'):
+        results = model(images)  # Perform batch inference
+
+    # YOLOv5 reports its own per-image split of the call in milliseconds: preprocess, forward, NMS
+    if instrumentation.is_enabled():
+        for name, milliseconds in zip(('model_preprocess', 'model_forward', 'nms'), results.t):
+            instrumentation.record(name, milliseconds * results.n / 1e3, calls=results.n)
+        instrumentation.count('images_inferred', len(image_paths))
+
+    with instrumentation.stage('to_pandas'):
+        return results.pandas().xyxy  # Return detection results as pandas DataFrames
 
 # Function to move the processed image to the output folder
+@instrumentation.timed('file_move')
 def move_processed_image(image_path, output_folder):
     try:
         shutil.move(image_path, output_folder)
@@ -57,10 +97,14 @@ def find_img_folders(root_folder):
 
 # Function to process all images in all img folders
 def process_all_images():
-    print(f"Using device: {device}")
+    print(f"Using device: {get_device()}")
+
+    # Ensure the output folder exists
+    os.makedirs(output_folder, exist_ok=True)
 
     # Find all img folders
-    img_folders = find_img_folders(root_folder)
+    with instrumentation.stage('find_img_folders'):
+        img_folders = find_img_folders(root_folder)
     if not img_folders:
         print("No img folders found in the root folder.")
         return
@@ -78,6 +122,8 @@ def process_all_images():
         # Split images into batches
         batch_size = 32  # Adjust based on GPU memory
         image_paths = [os.path.join(img_folder, f) for f in image_files]
+        # Keep images of the same aspect ratio together, so every batch runs at one rectangular shape
+        image_paths = [image_paths[k] for k in detector.bucket_order(image_paths, img_size)]
 
         for i in range(0, len(image_paths), batch_size):
             batch_paths = image_paths[i:i + batch_size]
@@ -92,10 +138,33 @@ def process_all_images():
                 if not result.empty:  # If detections exist
                     print(f"Detections found for {os.path.basename(image_path)}. Moving to output folder.")
                     move_processed_image(image_path, output_folder)
+                    instrumentation.count('images_moved')
                 else:
                     print(f"No detections found for {os.path.basename(image_path)}. Skipping.")
 
     print("\nAll images processed!")
 
+# Function to run the same mining over tar shards (data_processing_annotation/dataset_shards.py)
+# Shards are read sequentially; images with detections are written to the output folder, since there is no file to move
+def process_shards(shard_dir, output_folder=None, batch_size=32):
+    from data_processing_annotation import dataset_shards
+    output_folder = output_folder or globals()['output_folder']
+    print(f"Using device: {get_device()}")
+    os.makedirs(output_folder, exist_ok=True)
+
+    found = 0
+    for keys, extensions, images, _ in dataset_shards.iter_batches(shard_dir, batch_size):
+        # PIL opens the in-memory bytes exactly like a file path
+        results = batch_inference([io.BytesIO(data) for data in images])
+        for key, extension, data, result in zip(keys, extensions, images, results):
+            if not result.empty:
+                with instrumentation.stage('write_image'):
+                    with open(os.path.join(output_folder, os.path.basename(key) + extension), 'wb') as f:
+                        f.write(data)
+                instrumentation.count('images_moved')
+                found += 1
+    print(f"\nAll shards processed! {found} images with detections written to {output_folder}")
+    return found
+
 if __name__ == '__main__':
-    process_all_images()
\ No newline at end of file
+    process_all_images()
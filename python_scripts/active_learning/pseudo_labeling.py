@@ -0,0 +1,172 @@
+# This script pseudo-labels new plantation images with a trained YOLOv5 model.
+# Instead of only moving images that contain detections (find_FPsample.py), it keeps the boxes and writes them as
+# YOLO label files, so annotators only have to check and correct them.
+# Every box is gated on its confidence:
+#   - conf >= accept_conf: the box is kept as a label
+#   - review_conf <= conf < accept_conf: the box is uncertain, and the whole image goes to the needs_review bucket
+#   - conf < review_conf: the box is dropped
+# Labels are buffered in memory and flushed in bulk with atomic writes (temporary file + rename), so an interrupted
+# run never leaves half-written label files. Every flushed image gets one line in manifest.jsonl; a rerun skips the
+# images already listed there, and dataset_split.split_from_manifest builds the train/val split from it.
+#
+# Output layout:
+#   <output_folder>/labels/<name>.txt               accepted images (class cx cy w h)
+#   <output_folder>/needs_review/labels/<name>.txt  uncertain images, all boxes >= review_conf with their confidence
+#   <output_folder>/manifest.jsonl                  one JSON line per image
+
+import os
+import sys
+import json
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+
+# Path to YOLOv5 directory, trained weights, and dataset
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+weights_path = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_small\exp12\weights\best.pt"
+image_folder = r"D:\UniDoc\y2s1\SEGP\dataset\new_batch\img"
+output_folder = r"D:\UniDoc\y2s1\SEGP\dataset\new_batch\pseudo_labels"
+img_size = 640
+batch_size = 16
+rect = True  # Batch images by aspect ratio and run them at stride-aligned rectangles instead of squares
+
+# Confidence gating
+accept_conf = 0.6
+review_conf = 0.3
+iou_thres = 0.45
+max_det = 100
+
+# Number of images buffered before labels and manifest lines are written
+flush_every = 256
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+# Function to decide what happens to the detections of one image
+# Returns the status ('accepted', 'needs_review' or 'empty') and the boxes to write
+def gate_detections(detections, accept_conf=accept_conf, review_conf=review_conf):
+    detections = detections[detections[:, 4] >= review_conf]
+    if not len(detections):
+        return 'empty', detections
+    if (detections[:, 4] < accept_conf).any():
+        return 'needs_review', detections
+    return 'accepted', detections
+
+# Function to write a file atomically: readers see either the old file or the complete new one
+def atomic_write(path, text):
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+# Function to read the images already listed in a manifest
+# A crash in the middle of an append can leave a truncated last line; it is cut off, so the images it listed are
+# labeled again and the next append starts on a fresh line
+def read_manifest(manifest_path):
+    entries = []
+    if not os.path.exists(manifest_path):
+        return entries
+    with open(manifest_path, 'rb') as f:
+        lines = f.read().split(b'\n')
+    offset = 0
+    for i, line in enumerate(lines):
+        if line.strip():
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                if any(rest.strip() for rest in lines[i + 1:]):
+                    raise
+                print(f"Warning: dropping the incomplete last line of {manifest_path}")
+                with open(manifest_path, 'r+b') as f:
+                    f.truncate(offset)
+                return entries
+        offset += len(line) + 1
+    if lines[-1].strip():
+        # Complete entry without its newline
+        with open(manifest_path, 'ab') as f:
+            f.write(b'\n')
+    return entries
+
+# Function to write the buffered labels, then append their manifest lines
+# The manifest is written last so it never lists a label file that is not on disk
+def flush_labels(pending, manifest_path):
+    if not pending:
+        return
+    with instrumentation.stage('write_labels'):
+        for entry, text in pending:
+            if entry['label']:
+                atomic_write(entry['label'], text)
+        with open(manifest_path, 'a') as f:
+            f.write(''.join(json.dumps(entry) + '\n' for entry, _ in pending))
+            f.flush()
+            os.fsync(f.fileno())
+    instrumentation.count('labels_flushed', len(pending))
+    pending.clear()
+
+# Function to build the manifest entry and label text of one image
+def label_entry(image_path, status, boxes, shape, output_folder):
+    name = os.path.splitext(os.path.basename(image_path))[0] + '.txt'
+    entry = {
+        'image': os.path.abspath(image_path),
+        'label': None,
+        'status': status,
+        'boxes': len(boxes),
+        'min_conf': round(float(boxes[:, 4].min()), 4) if len(boxes) else None,
+        'width': int(shape[1]),
+        'height': int(shape[0]),
+    }
+    text = ''
+    if status == 'accepted':
+        entry['label'] = os.path.join(output_folder, 'labels', name)
+        text = '\n'.join(detector.to_yolo_lines(boxes, shape, with_conf=False)) + '\n'
+    elif status == 'needs_review':
+        # Reviewers see the confidence of every box; split_from_manifest drops that column again
+        entry['label'] = os.path.join(output_folder, 'needs_review', 'labels', name)
+        text = '\n'.join(detector.to_yolo_lines(boxes, shape, with_conf=True)) + '\n'
+    return entry, text
+
+# Function to pseudo-label every image in a folder
+def pseudo_label_folder(image_folder=None, output_folder=None, model=None):
+    image_folder = image_folder or globals()['image_folder']
+    output_folder = output_folder or globals()['output_folder']
+    os.makedirs(os.path.join(output_folder, 'labels'), exist_ok=True)
+    os.makedirs(os.path.join(output_folder, 'needs_review', 'labels'), exist_ok=True)
+    manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+
+    # Skip the images a previous run already labeled
+    done = {entry['image'] for entry in read_manifest(manifest_path)}
+    image_paths = [p for p in detector.list_images(image_folder) if os.path.abspath(p) not in done]
+    print(f"{len(image_paths)} images to label ({len(done)} already in the manifest)")
+    if not image_paths:
+        return {}
+
+    model = model or detector.load_raw_model(weights_path, yolov5_directory)
+    if rect:
+        # Keep images of the same aspect ratio together, so every batch runs at one rectangular shape
+        image_paths = [image_paths[k] for k in detector.bucket_order(image_paths, img_size, detector.model_stride(model))]
+    counts = {'accepted': 0, 'needs_review': 0, 'empty': 0}
+    pending = []
+    try:
+        for i in range(0, len(image_paths), batch_size):
+            batch_paths = image_paths[i:i + batch_size]
+            # Detect down to review_conf so the uncertain boxes can be gated
+            results, shapes = detector.detect_batch(model, batch_paths, img_size, review_conf, iou_thres, max_det, rect)
+            for image_path, detections, shape in zip(batch_paths, results, shapes):
+                status, boxes = gate_detections(detections, accept_conf, review_conf)
+                pending.append(label_entry(image_path, status, boxes, shape, output_folder))
+                counts[status] += 1
+            if len(pending) >= flush_every:
+                flush_labels(pending, manifest_path)
+                print(f"Labeled {i + len(batch_paths)} of {len(image_paths)} images")
+    finally:
+        # Keep whatever was labeled before an error or interrupt
+        flush_labels(pending, manifest_path)
+
+    for status, count in counts.items():
+        instrumentation.count(f'images_{status}', count)
+    print(f"Accepted: {counts['accepted']}, needs review: {counts['needs_review']}, no detections: {counts['empty']}")
+    return counts
+
+if __name__ == '__main__':
+    pseudo_label_folder()
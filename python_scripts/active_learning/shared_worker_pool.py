@@ -0,0 +1,220 @@
+# This script runs the find_FPsample.py mining scan on several CPU worker processes that share one copy of the model.
+# Running several copies of a detection script side by side makes every process load its own weights and YOLOv5 imports,
+# so memory grows with every core used. Here the parent loads the model once, freezes it (eval, no gradients) and moves
+# its tensors into shared memory; the workers are forked after the load, so they map the same weight pages read-only
+# instead of holding private copies (where fork is not available, e.g. Windows, the shared tensors are handed to
+# spawned workers instead). Each worker gets an equal share of the cores for torch's intra-op threads, so the workers do
+# not oversubscribe the CPU.
+# scaling_report() runs the same images with a growing number of workers, each time with one model per worker
+# ('private') and with the shared model ('shared'), and reports images/sec with the total RSS and PSS of all processes.
+# RSS counts shared pages once per process, PSS splits them between the processes that map them, so the PSS total is
+# the memory the pool really uses (both read from /proc/<pid>/smaps_rollup, Linux only).
+
+import os
+import sys
+import json
+import time
+import queue
+import multiprocessing
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+from active_learning.find_FPsample import find_img_folders, move_processed_image
+
+# Path to YOLOv5 directory, trained weights, and dataset
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+weights_path = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_small\exp9\weights\best.pt"
+root_folder = r"D:\UniDoc\y2s1\SEGP\dataset\archive"
+output_folder = r"D:\UniDoc\y2s1\SEGP\dataset\false_negative"
+img_size = 640
+conf_thres = 0.4
+batch_size = 8
+workers = 4
+worker_counts = [1, 2, 4, 8, 16]  # Worker counts compared by scaling_report
+memory_interval = 0.5  # Seconds between memory samples
+
+# Function to load the model once, freeze it and move its weights into shared memory
+# Callers pass their own weights and device, so a script's --weights/--yolov5-dir overrides reach the shared copy
+def load_shared_model(weights_path, yolov5_directory, device='cpu'):
+    import torch
+    # Load with one thread so no OpenMP thread pool exists yet when the workers are forked
+    threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+    model = detector.load_raw_model(weights_path, yolov5_directory, device=device)
+    torch.set_num_threads(threads)
+    model.eval()
+    for parameter in model.parameters():
+        parameter.requires_grad_(False)
+    # Buffers too (e.g. anchors), so no tensor of the model is copied into a worker
+    return model.share_memory()
+
+# Function to read the RSS and PSS (bytes) of a process; PSS is None where smaps_rollup is not available
+def process_memory(pid):
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            for line in f:
+                name, _, rest = line.partition(':')
+                if name in ('Rss', 'Pss'):
+                    values[name] = int(rest.split()[0]) * 1024
+    except OSError:
+        pass
+    if 'Rss' not in values:
+        try:
+            import psutil
+            values['Rss'] = psutil.Process(pid).memory_info().rss
+        except Exception:
+            values['Rss'] = 0
+    return values['Rss'], values.get('Pss')
+
+# Function to sum the memory of a set of processes
+def total_memory(pids):
+    rss_total, pss_total = 0, 0
+    for pid in pids:
+        rss, pss = process_memory(pid)
+        rss_total += rss
+        pss_total = None if pss is None or pss_total is None else pss_total + pss
+    return rss_total, pss_total
+
+# Function run by every worker: detect the batches from the task queue until it gets None
+def worker_main(model, tasks, results, threads, settings):
+    import torch
+    # Settings passed by run_pool; a spawned process starts again from this module's defaults
+    globals().update(settings)
+    torch.set_num_threads(threads)
+    if model is None:
+        # Private mode: every worker loads its own copy, like separate script runs
+        model = detector.load_raw_model(weights_path, yolov5_directory, device='cpu')
+    results.put(('ready', os.getpid(), None))
+    while True:
+        paths = tasks.get()
+        if paths is None:
+            break
+        try:
+            detections, _ = detector.detect_batch(model, paths, img_size, conf_thres, rect=True)
+            results.put(('done', os.getpid(), {path: [len(boxes), round(float(boxes[:, 4].max()), 4) if len(boxes) else 0.0]
+                                                for path, boxes in zip(paths, detections)}))
+        except Exception as e:
+            results.put(('failed', os.getpid(), {path: None for path in paths}))
+            print(f"[worker {os.getpid()}] batch failed: {e}")
+
+# Function to detect a list of images on a pool of worker processes
+# Returns {path: [detections, best confidence]} and the run statistics (images/sec, peak memory)
+def run_pool(image_paths, workers=None, shared=True, threads=None):
+    workers = workers or globals()['workers']
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    settings = {name: globals()[name] for name in ('yolov5_directory', 'weights_path', 'img_size', 'conf_thres')}
+    # Fork shares the already loaded pages; spawn hands the shared-memory tensors over instead
+    use_fork = shared and 'fork' in multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('fork' if use_fork else 'spawn')
+    load_start = time.perf_counter()
+    model = load_shared_model(weights_path, yolov5_directory) if shared else None
+
+    tasks, results = context.Queue(), context.Queue()
+    processes = [context.Process(target=worker_main, args=(model, tasks, results, threads, settings)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    # Images are ordered by aspect-ratio bucket, so every batch runs at one rectangular shape
+    ordered = [image_paths[k] for k in detector.bucket_order(image_paths, img_size)]
+    for i in range(0, len(ordered), batch_size):
+        tasks.put(ordered[i:i + batch_size])
+    for _ in processes:
+        tasks.put(None)
+
+    pids = [os.getpid()] + [process.pid for process in processes]
+    found, ready, failed = {}, 0, 0
+    peak_rss, peak_pss = 0, 0
+    start, all_ready = None, None
+    next_sample = 0.0
+    with instrumentation.stage('worker_pool'):
+        while len(found) < len(ordered):
+            if time.perf_counter() >= next_sample:
+                rss, pss = total_memory(pids)
+                peak_rss = max(peak_rss, rss)
+                peak_pss = None if pss is None else max(peak_pss or 0, pss)
+                next_sample = time.perf_counter() + memory_interval
+            try:
+                kind, _, payload = results.get(timeout=memory_interval)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    print("All workers exited before every image was processed")
+                    break
+                continue
+            if kind == 'ready':
+                ready += 1
+                if ready == 1:
+                    # The clock starts when the first worker takes its first task, so every counted image ran after it
+                    start = time.perf_counter()
+                if ready == workers:
+                    all_ready = time.perf_counter()
+                continue
+            failed += sum(value is None for value in payload.values())
+            found.update(payload)
+    end = time.perf_counter()
+    for process in processes:
+        process.join()
+
+    processed = len(found) - failed
+    elapsed = end - (start or load_start)
+    stats = {
+        'workers': workers, 'threads': threads, 'mode': 'shared' if shared else 'private',
+        'start_method': context.get_start_method(), 'images': processed, 'failed': failed,
+        'seconds': round(elapsed, 2), 'startup_seconds': round((all_ready or end) - load_start, 2),
+        'images_per_sec': round(processed / max(elapsed, 1e-9), 2),
+        'peak_rss_mb': round(peak_rss / 2 ** 20, 1), 'peak_pss_mb': None if peak_pss is None else round(peak_pss / 2 ** 20, 1),
+    }
+    instrumentation.count('images_inferred', processed)
+    return {path: value for path, value in found.items() if value is not None}, stats
+
+# Function to mine every img folder below root_folder with the shared pool, moving images with detections
+def mine(root_folder=None, output_folder=None, workers=None):
+    root_folder = root_folder or globals()['root_folder']
+    output_folder = output_folder or globals()['output_folder']
+    os.makedirs(output_folder, exist_ok=True)
+    image_paths = [path for img_folder in find_img_folders(root_folder) for path in detector.list_images(img_folder)]
+    if not image_paths:
+        print("No images found below the root folder.")
+        return 0
+    found, stats = run_pool(image_paths, workers)
+    moved = 0
+    for path, (count, _) in found.items():
+        if count:
+            move_processed_image(path, output_folder)
+            moved += 1
+    instrumentation.count('images_moved', moved)
+    print_stats([stats])
+    print(f"\nAll images processed! {moved} of {len(found)} images had detections.")
+    return moved
+
+# Function to print pool statistics as a table
+def print_stats(rows):
+    print(f"{'mode':<9}{'workers':>8}{'threads':>8}{'images/s':>10}{'RSS MB':>10}{'PSS MB':>10}{'startup s':>11}")
+    for row in rows:
+        pss = f"{row['peak_pss_mb']:.0f}" if row['peak_pss_mb'] is not None else 'n/a'
+        print(f"{row['mode']:<9}{row['workers']:>8}{row['threads']:>8}{row['images_per_sec']:>10.1f}"
+              f"{row['peak_rss_mb']:>10.0f}{pss:>10}{row['startup_seconds']:>11.1f}")
+
+# Function to compare images/sec and memory of private and shared models for a growing number of workers
+def scaling_report(image_folder, worker_counts=None, modes=('private', 'shared'), output_path=None, limit=256):
+    worker_counts = worker_counts or globals()['worker_counts']
+    image_paths = detector.list_images(image_folder)[:limit]
+    if not image_paths:
+        print(f"No images in {image_folder}")
+        return []
+    rows = []
+    for count in worker_counts:
+        for mode in modes:
+            print(f"Running {len(image_paths)} images on {count} workers ({mode} model)...")
+            _, stats = run_pool(image_paths, count, shared=(mode == 'shared'))
+            rows.append(stats)
+    print_stats(rows)
+    if output_path:
+        with open(output_path, 'w') as f:
+            json.dump({'cpus': os.cpu_count(), 'images': len(image_paths), 'runs': rows}, f, indent=1)
+        print(f"Report saved to {output_path}")
+    return rows
+
+if __name__ == '__main__':
+    mine()
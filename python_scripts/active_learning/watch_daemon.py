@@ -0,0 +1,330 @@
+# This script is a long-running daemon that processes new field images as they arrive.
+# It watches the incoming folders (with the watchdog package if installed, otherwise by polling), waits until a new
+# file has stopped growing, and groups new files into micro-batches that are closed when batch_size files are waiting
+# or when the oldest waiting file has waited max_latency seconds. Every batch goes through the configured chain of stages:
+#   ingest        - EXIF rotation, downscale to max_side and JPEG re-encode (tojpg.convert_to_jpg)
+#   blur          - Laplacian blur score; blurred images leave the chain (qua_classifier.blur_score)
+#   detect        - batched YOLOv5 detection (common/detector.py)
+#   pseudo_label  - confidence-gated YOLO labels and manifest lines (pseudo_labeling.py)
+# Files waiting for processing go through a bounded queue: when the stages fall behind, the watcher stops adding
+# files until there is room again, so memory stays flat during large uploads.
+# Processed files are recorded in a small SQLite state file (path, size, modification time), so a restart only picks up
+# files that are new or changed, and the cost per image does not grow with the size of the archive.
+# A batch that raises is recorded as 'failed' and the daemon carries on; the watcher queues its files again every
+# poll_interval until they have failed max_attempts times.
+
+import os
+import sys
+import time
+import queue
+import sqlite3
+import threading
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+
+# Define paths and daemon settings
+watch_folders = [r"D:\UniDoc\y2s1\SEGP\dataset\field_upload"]
+work_folder = r"D:\UniDoc\y2s1\SEGP\dataset\field_daemon"  # Ingested images, labels, manifest and state
+stages = ['ingest', 'blur', 'detect', 'pseudo_label']
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+weights_path = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_small\exp12\weights\best.pt"
+batch_size = 16  # Close a batch when this many files are waiting
+max_latency = 10.0  # ...or when the oldest waiting file has waited this many seconds
+max_pending = 256  # Bounded queue between the watcher and the stages (backpressure)
+poll_interval = 5.0  # Seconds between scans when watchdog is not installed
+settle_seconds = 2.0  # A file must keep its size this long before it is processed (upload finished)
+max_attempts = 3  # Files of failed batches are retried until they failed this often
+max_side = 1280
+blur_threshold = 100.0
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.heic')
+
+# Function to open the state database of processed files
+def open_state(path):
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.execute("CREATE TABLE IF NOT EXISTS processed (path TEXT PRIMARY KEY, size INTEGER, mtime REAL, status TEXT, "
+                       "processed REAL, attempts INTEGER DEFAULT 0)")
+    # State files written before failed batches were retried have no attempts column
+    if 'attempts' not in [row[1] for row in connection.execute("PRAGMA table_info(processed)")]:
+        connection.execute("ALTER TABLE processed ADD COLUMN attempts INTEGER DEFAULT 0")
+    return connection
+
+# Function to check if a file was already processed in its current version
+# A failed file only counts as processed once it has used up its attempts
+def is_processed(connection, path, stat):
+    row = connection.execute("SELECT size, mtime, status, attempts FROM processed WHERE path = ?", (path,)).fetchone()
+    if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime:
+        return False
+    return row[2] != 'failed' or (row[3] or 0) >= max_attempts
+
+# Function to record the outcome of a batch; failed files count their attempts
+def mark_processed(connection, items):
+    rows = []
+    for item in items:
+        attempts = 0
+        if item['status'] == 'failed':
+            previous = connection.execute("SELECT attempts FROM processed WHERE path = ? AND status = 'failed'",
+                                          (item['source'],)).fetchone()
+            attempts = (previous[0] or 0) + 1 if previous else 1
+        rows.append((item['source'], item['size'], item['mtime'], item['status'], time.time(), attempts))
+    connection.executemany("INSERT OR REPLACE INTO processed (path, size, mtime, status, processed, attempts) VALUES (?, ?, ?, ?, ?, ?)", rows)
+    connection.commit()
+
+# Function to list the failed files that have attempts left and whose last attempt ended after they were last queued
+# queued maps a path to the time the watcher put it on the queue, so a file waiting in the queue is not added twice
+def failed_files(connection, queued):
+    rows = connection.execute("SELECT path, processed FROM processed WHERE status = 'failed' AND attempts < ?", (max_attempts,))
+    return [path for path, processed in rows.fetchall() if processed >= queued.get(path, 0)]
+
+# ---- stages: each takes the batch items and the shared context, and returns the items that continue ----
+
+def stage_ingest(items, context):
+    from data_processing_annotation.tojpg import convert_to_jpg
+    from data_processing_annotation.ingest_images import init_worker
+    if 'heif' not in context:
+        init_worker(set())  # Registers the HEIC opener when pillow_heif is installed
+        context['heif'] = True
+    folder = os.path.join(work_folder, 'images')
+    os.makedirs(folder, exist_ok=True)
+    kept = []
+    for item in items:
+        # Flatten the path below the watched folder so photos with the same name from different phones do not clash
+        relative_path = os.path.relpath(item['source'], item['watch_folder'])
+        output_path = os.path.join(folder, os.path.splitext(relative_path)[0].replace(os.sep, '__') + '.jpg')
+        if convert_to_jpg(item['source'], folder, quality=90, max_side=max_side, exif_transpose=True, output_path=output_path):
+            item['path'] = output_path
+            item['status'] = 'ingested'
+            kept.append(item)
+        else:
+            item['status'] = 'unreadable'
+    return kept
+
+def stage_blur(items, context):
+    from data_processing_annotation.qua_classifier import blur_score
+    kept = []
+    for item in items:
+        score = blur_score(item['path'])
+        if score is None or score < blur_threshold:
+            item['status'] = 'blurred'
+        else:
+            item['status'] = 'clear'
+            kept.append(item)
+    return kept
+
+def stage_detect(items, context):
+    if 'model' not in context:
+        context['model'] = detector.load_raw_model(weights_path, yolov5_directory)
+    from active_learning import pseudo_labeling
+    # Detect down to the review threshold so the pseudo-label stage can gate the boxes
+    results, shapes = detector.detect_batch(context['model'], [item['path'] for item in items],
+                                            pseudo_labeling.img_size, pseudo_labeling.review_conf,
+                                            pseudo_labeling.iou_thres, pseudo_labeling.max_det, pseudo_labeling.rect)
+    for item, detections, shape in zip(items, results, shapes):
+        item['detections'], item['shape'] = detections, shape
+        item['status'] = 'detected'
+    return items
+
+def stage_pseudo_label(items, context):
+    from active_learning import pseudo_labeling
+    output_folder = os.path.join(work_folder, 'pseudo_labels')
+    os.makedirs(os.path.join(output_folder, 'labels'), exist_ok=True)
+    os.makedirs(os.path.join(output_folder, 'needs_review', 'labels'), exist_ok=True)
+    pending = []
+    for item in items:
+        status, boxes = pseudo_labeling.gate_detections(item['detections'], pseudo_labeling.accept_conf, pseudo_labeling.review_conf)
+        pending.append(pseudo_labeling.label_entry(item['path'], status, boxes, item['shape'], output_folder))
+        item['status'] = status
+    pseudo_labeling.flush_labels(pending, os.path.join(output_folder, pseudo_labeling.MANIFEST_NAME))
+    return items
+
+STAGES = {
+    'ingest': stage_ingest,
+    'blur': stage_blur,
+    'detect': stage_detect,
+    'pseudo_label': stage_pseudo_label,
+}
+
+# Function to run one batch through the stage chain
+def process_batch(items, context):
+    remaining = items
+    for name in stages:
+        if not remaining:
+            break
+        with instrumentation.stage(f'daemon_{name}'):
+            remaining = STAGES[name](remaining, context)
+    instrumentation.count('daemon_images', len(items))
+
+# Function to process a batch and record its outcome; a batch that raises is recorded as failed instead of stopping
+# the daemon
+def run_batch(connection, items, context):
+    try:
+        process_batch(items, context)
+    except Exception as e:
+        print(f"Batch of {len(items)} files failed: {type(e).__name__}: {e}")
+        for item in items:
+            item['status'] = 'failed'
+        instrumentation.count('daemon_failed', len(items))
+    mark_processed(connection, items)
+    statuses = {}
+    for item in items:
+        statuses[item['status']] = statuses.get(item['status'], 0) + 1
+    return statuses
+
+# Function to find the watched folder a file belongs to
+def watch_folder_of(path):
+    for folder in watch_folders:
+        if os.path.commonpath([os.path.abspath(folder), os.path.abspath(path)]) == os.path.abspath(folder):
+            return folder
+    return os.path.dirname(path)
+
+# Function to list the candidate files of the watched folders that are not processed yet
+def scan_new_files(connection, seen):
+    for folder in watch_folders:
+        for root, _, files in os.walk(folder):
+            for file in files:
+                path = os.path.join(root, file)
+                if file.lower().endswith(IMAGE_EXTENSIONS) and path not in seen:
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    if not is_processed(connection, path, stat):
+                        yield path
+
+# Function to wait until a file has stopped growing; returns its stat, or None if it disappeared
+def wait_until_settled(path):
+    previous = None
+    while True:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        # Files that were not modified for settle_seconds are complete (the common case for a burst of uploads)
+        if time.time() - stat.st_mtime >= settle_seconds and (previous is None or (stat.st_size, stat.st_mtime) == previous):
+            return stat
+        previous = (stat.st_size, stat.st_mtime)
+        time.sleep(min(settle_seconds, 1.0))
+
+# Function to start the watchdog observer; returns None when watchdog is not installed
+def start_observer(pending):
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return None
+
+    class NewImageHandler(FileSystemEventHandler):
+        def on_created(self, event):
+            if not event.is_directory and event.src_path.lower().endswith(IMAGE_EXTENSIONS):
+                pending.put(event.src_path)  # Blocks while the queue is full
+
+        def on_moved(self, event):
+            if not event.is_directory and event.dest_path.lower().endswith(IMAGE_EXTENSIONS):
+                pending.put(event.dest_path)
+
+    observer = Observer()
+    for folder in watch_folders:
+        observer.schedule(NewImageHandler(), folder, recursive=True)
+    observer.start()
+    return observer
+
+# Function to put a path on the queue; put() blocks while the queue is full, which pauses scanning
+def enqueue(pending, path, queued, stop):
+    while not stop.is_set():
+        try:
+            pending.put(path, timeout=1.0)
+            queued[path] = time.time()
+            return
+        except queue.Full:
+            continue
+
+# Function run in the watcher thread next to watchdog: queue the files that arrived while the daemon was down, then
+# the files of failed batches every poll_interval (watchdog only reports new files)
+def scan_once(pending, state_path, stop):
+    connection = open_state(state_path)
+    queued = {}
+    for path in scan_new_files(connection, queued):
+        enqueue(pending, path, queued, stop)
+    while not stop.wait(poll_interval):
+        for path in failed_files(connection, queued):
+            enqueue(pending, path, queued, stop)
+    connection.close()
+
+# Function run in the watcher thread when watchdog is not available
+def poll_folders(pending, state_path, stop):
+    connection = open_state(state_path)
+    queued = {}
+    while not stop.is_set():
+        for path in scan_new_files(connection, queued):
+            enqueue(pending, path, queued, stop)
+        # Files already queued once are skipped by the scan; the failed ones go back on the queue
+        for path in failed_files(connection, queued):
+            enqueue(pending, path, queued, stop)
+        stop.wait(poll_interval)
+    connection.close()
+
+# Function to run the daemon until interrupted (or for run_for seconds)
+def run_daemon(run_for=None):
+    unknown = [name for name in stages if name not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stages {unknown}; choose from {list(STAGES)}")
+    os.makedirs(work_folder, exist_ok=True)
+    state_path = os.path.join(work_folder, 'daemon_state.sqlite')
+    connection = open_state(state_path)
+    pending = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+
+    # Files that arrived while the daemon was down are picked up by one scan at start-up
+    observer = start_observer(pending)
+    if observer is None:
+        print(f"watchdog is not installed; polling every {poll_interval:g}s")
+        watcher = threading.Thread(target=poll_folders, args=(pending, state_path, stop), daemon=True)
+    else:
+        print("Watching with watchdog")
+        watcher = threading.Thread(target=scan_once, args=(pending, state_path, stop), daemon=True)
+    watcher.start()
+
+    context = {}
+    batch = []
+    batch_started = None
+    started = time.time()
+    try:
+        while run_for is None or time.time() - started < run_for:
+            # Wait for the next file, but never past the deadline of the open batch
+            timeout = max_latency if batch_started is None else max(0.0, batch_started + max_latency - time.time())
+            try:
+                path = pending.get(timeout=timeout)
+                stat = wait_until_settled(path)
+                if stat is not None and not is_processed(connection, path, stat):
+                    batch.append({'source': path, 'watch_folder': watch_folder_of(path), 'size': stat.st_size,
+                                  'mtime': stat.st_mtime, 'path': path, 'status': 'new'})
+                    batch_started = batch_started or time.time()
+            except queue.Empty:
+                pass
+            deadline_passed = batch_started is not None and time.time() - batch_started >= max_latency
+            if batch and (len(batch) >= batch_size or deadline_passed):
+                waited = time.time() - batch_started
+                # The batch is taken off before it runs, so an interrupted batch is not run again on the way out;
+                # its files are not recorded and are picked up again at the next start
+                current, batch, batch_started = batch, [], None
+                statuses = run_batch(connection, current, context)
+                print(f"Processed {len(current)} files (oldest waited {waited:.1f}s, {pending.qsize()} queued): {statuses}")
+    except KeyboardInterrupt:
+        print("Stopping...")
+    finally:
+        try:
+            stop.set()
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            # Files collected but not yet run
+            if batch:
+                run_batch(connection, batch, context)
+        finally:
+            connection.close()
+
+if __name__ == '__main__':
+    run_daemon()
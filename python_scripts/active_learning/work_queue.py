@@ -0,0 +1,156 @@
+# A work queue kept in one SQLite file, so any number of worker processes on any number of hosts can share it
+# (put the file on a shared drive; with network file systems use journal_mode 'DELETE', as WAL needs shared memory).
+# Each work unit is a JSON payload. A worker claims a unit with a lease, extends the lease with heartbeats while it
+# works, and completes it together with its results in one transaction. Units whose lease runs out (worker crashed or
+# host lost) are handed out again, and a unit that fails max_attempts times is marked failed with its last error.
+# Results of all workers end up in the same file, in the results table.
+
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+
+max_attempts = 3
+lease_seconds = 120
+journal_mode = 'WAL'  # 'DELETE' for queues on network file systems
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id INTEGER PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    updated REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS units_status ON units (status, lease_expires);
+CREATE TABLE IF NOT EXISTS results (
+    unit_id INTEGER NOT NULL,
+    item TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (unit_id, item)
+);
+"""
+
+# Function to open the queue database, creating the tables if needed
+def connect(db_path):
+    connection = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+    connection.execute(f"PRAGMA journal_mode={journal_mode}")
+    connection.execute("PRAGMA busy_timeout=60000")
+    connection.executescript(SCHEMA)
+    return connection
+
+# Function to build a worker id that is unique across hosts
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+# Function to add work units (a list of JSON-serializable payloads)
+def add_units(connection, payloads):
+    now = time.time()
+    connection.execute("BEGIN IMMEDIATE")
+    connection.executemany("INSERT INTO units (payload, updated) VALUES (?, ?)", [(json.dumps(p), now) for p in payloads])
+    connection.execute("COMMIT")
+    return len(payloads)
+
+# Function to claim the next available unit: pending, or leased with an expired lease
+# Returns (unit id, payload) or None when nothing can be claimed right now
+def claim_unit(connection, worker, lease=None):
+    lease = lease or lease_seconds
+    now = time.time()
+    # BEGIN IMMEDIATE takes the write lock first, so two workers can never claim the same unit
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        # Units whose last allowed attempt ran out of lease will not be retried
+        connection.execute("UPDATE units SET status = 'failed', error = 'lease expired', updated = ? "
+                           "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?", (now, now, max_attempts))
+        row = connection.execute(
+            "SELECT id, payload FROM units WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?)) "
+            "AND attempts < ? ORDER BY id LIMIT 1", (now, max_attempts)).fetchone()
+        if row is None:
+            connection.execute("COMMIT")
+            return None
+        connection.execute("UPDATE units SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? "
+                           "WHERE id = ?", (worker, now + lease, now, row[0]))
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    return row[0], json.loads(row[1])
+
+# Function to extend the lease of a unit; returns False if the unit was taken over by another worker
+def heartbeat(connection, unit_id, worker, lease=None):
+    lease = lease or lease_seconds
+    cursor = connection.execute("UPDATE units SET lease_expires = ?, updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                                (time.time() + lease, time.time(), unit_id, worker))
+    return cursor.rowcount == 1
+
+# Function to store a unit's results and mark it done, in one transaction
+# results: {item: JSON-serializable value}; returns False if the lease was lost (the results are then discarded)
+def complete_unit(connection, unit_id, worker, results):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        cursor = connection.execute("UPDATE units SET status = 'done', lease_expires = NULL, updated = ? "
+                                    "WHERE id = ? AND worker = ? AND status = 'leased'", (time.time(), unit_id, worker))
+        if cursor.rowcount != 1:
+            connection.execute("ROLLBACK")
+            return False
+        connection.executemany("INSERT OR REPLACE INTO results (unit_id, item, value) VALUES (?, ?, ?)",
+                               [(unit_id, item, json.dumps(value)) for item, value in results.items()])
+        connection.execute("COMMIT")
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    return True
+
+# Function to record a failed attempt; the unit is retried until it reaches max_attempts
+def fail_unit(connection, unit_id, worker, error):
+    connection.execute("UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                       "lease_expires = NULL, error = ?, updated = ? WHERE id = ? AND worker = ?",
+                       (max_attempts, str(error)[:2000], time.time(), unit_id, worker))
+
+# Function to count the units in each state; leased units with an expired lease are counted as 'expired'
+def queue_status(connection):
+    status = {'pending': 0, 'leased': 0, 'expired': 0, 'done': 0, 'failed': 0}
+    for state, count in connection.execute(
+            "SELECT CASE WHEN status = 'leased' AND lease_expires < ? THEN 'expired' ELSE status END, COUNT(*) "
+            "FROM units GROUP BY 1", (time.time(),)):
+        status[state] = count
+    return status
+
+# Function to check if there is still work that may be claimed now or after a lease runs out
+def has_open_units(connection):
+    return connection.execute("SELECT 1 FROM units WHERE status IN ('pending', 'leased') LIMIT 1").fetchone() is not None
+
+# Function to read all results as {item: value}
+def read_results(connection):
+    return {item: json.loads(value) for item, value in connection.execute("SELECT item, value FROM results")}
+
+# Heartbeat thread that keeps a unit's lease alive while the worker processes it
+class LeaseKeeper(threading.Thread):
+    def __init__(self, db_path, unit_id, worker, lease=None):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.unit_id = unit_id
+        self.worker = worker
+        self.lease = lease or lease_seconds
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        connection = connect(self.db_path)
+        try:
+            # Renew at a third of the lease so one missed beat does not lose the unit
+            while not self.stopped.wait(self.lease / 3):
+                if not heartbeat(connection, self.unit_id, self.worker, self.lease):
+                    self.lost = True
+                    break
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
@@ -0,0 +1,331 @@
+# This script keeps the black bunch counts of every scanned image in a columnar store, for yield reports per block
+# and per week across the estate.
+# Each image is one row: relative path, block (first folder below the archive root), capture date and GPS position
+# (from EXIF, falling back to the file date), the number of detections at or above count_conf and the sum of their
+# confidences (a confidence-weighted count). Rows are written in partitions, one folder of .npy column files per
+# update, so new detection results are appended without rewriting the store; compact() merges the partitions again.
+# Queries load the columns once (memory-mapped) and aggregate with np.bincount, which takes milliseconds for
+# millions of rows.
+#
+# Typical use:
+#   bbunch counts scan <store> --root <archive>                     -> detect and count the images not yet in the store
+#   bbunch counts import <store> --root <archive> --labels <labels>  -> count from detect.py --save-txt --save-conf labels
+#   bbunch counts report <store> --by block_week [--weighted]
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import datetime
+import numpy as np
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+
+# Path to YOLOv5 directory, trained weights, archive and store
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+weights_path = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_small\exp12\weights\best.pt"
+root_folder = r"D:\UniDoc\y2s1\SEGP\dataset\archive"
+store_path = r"D:\UniDoc\y2s1\SEGP\dataset\bunch_counts"
+img_size = 640
+batch_size = 32
+rect = True  # Batch images by aspect ratio and run them at stride-aligned rectangles instead of squares
+min_conf = 0.1  # Detections kept for the confidence-weighted count
+count_conf = 0.4  # Detections counted as bunches (same threshold as the test scripts)
+target_class = 0  # Class id of 'Black Bunch'
+rows_per_partition = 100000  # Rows written per partition while scanning
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+COLUMNS = {
+    'image': None,  # Unicode, width set per partition
+    'key': np.int64,
+    'block': np.int32,
+    'day': np.int32,  # Days since 1970-01-01
+    'lat': np.float32,
+    'lon': np.float32,
+    'count': np.int32,
+    'conf_sum': np.float32,
+}
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+DATE_TIME_ORIGINAL = 36867
+DATE_TIME = 306
+
+# Function to turn a relative image path into a stable 64-bit key
+def image_key(relative_path):
+    digest = hashlib.sha1(relative_path.replace('\\', '/').encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'little', signed=True)
+
+# Function to convert an EXIF GPS coordinate (degrees, minutes, seconds) to decimal degrees
+def gps_to_degrees(value, reference):
+    degrees, minutes, seconds = (float(part) for part in value)
+    decimal = degrees + minutes / 60 + seconds / 3600
+    return -decimal if reference in ('S', 'W') else decimal
+
+# Function to read the capture day (days since 1970) and GPS position of an image
+def image_metadata(image_path):
+    from PIL import Image
+    day, lat, lon = None, np.nan, np.nan
+    try:
+        with Image.open(image_path) as img:
+            exif = img.getexif()
+            taken = exif.get_ifd(EXIF_IFD).get(DATE_TIME_ORIGINAL) or exif.get(DATE_TIME)
+            if taken:
+                day = (datetime.datetime.strptime(str(taken).strip('\x00')[:10], '%Y:%m:%d').date() - datetime.date(1970, 1, 1)).days
+            gps = exif.get_ifd(GPS_IFD)
+            if 2 in gps and 4 in gps:
+                lat, lon = gps_to_degrees(gps[2], gps.get(1, 'N')), gps_to_degrees(gps[4], gps.get(3, 'E'))
+    except Exception:
+        pass
+    if day is None:
+        day = int(os.path.getmtime(image_path) // 86400)
+    return day, lat, lon
+
+# Function to find the block of an image: the first folder below the archive root
+def block_name(relative_path):
+    parts = relative_path.replace('\\', '/').split('/')
+    return parts[0] if len(parts) > 1 else ''
+
+# Function to list the images below a folder as paths relative to it
+def find_images(root_folder):
+    relative_paths = []
+    for folder, _, files in os.walk(root_folder):
+        for file in files:
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                relative_paths.append(os.path.relpath(os.path.join(folder, file), root_folder))
+    return sorted(relative_paths)
+
+# Function to read the block names of a store (the block column holds their index)
+def load_blocks(store_path):
+    path = os.path.join(store_path, 'blocks.json')
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return json.load(f)
+
+# Function to list the partition folders of a store, oldest first
+def list_partitions(store_path):
+    if not os.path.isdir(store_path):
+        return []
+    return sorted(name for name in os.listdir(store_path) if name.startswith('part-') and not name.endswith('.tmp'))
+
+# Function to write one partition; the folder is renamed into place so readers never see half a partition
+def write_partition(store_path, rows, blocks):
+    if not rows:
+        return None
+    os.makedirs(store_path, exist_ok=True)
+    block_ids = {name: i for i, name in enumerate(blocks)}
+    for row in rows:
+        if row['block'] not in block_ids:
+            block_ids[row['block']] = len(blocks)
+            blocks.append(row['block'])
+    # blocks.json first: a partition never refers to a block that is not listed
+    with open(os.path.join(store_path, 'blocks.json.tmp'), 'w') as f:
+        json.dump(blocks, f)
+    os.replace(os.path.join(store_path, 'blocks.json.tmp'), os.path.join(store_path, 'blocks.json'))
+
+    columns = {
+        'image': np.array([row['image'] for row in rows]),
+        'key': np.array([image_key(row['image']) for row in rows], dtype=np.int64),
+        'block': np.array([block_ids[row['block']] for row in rows], dtype=np.int32),
+    }
+    for name in ('day', 'lat', 'lon', 'count', 'conf_sum'):
+        columns[name] = np.array([row[name] for row in rows], dtype=COLUMNS[name])
+    return save_columns(store_path, columns)
+
+# Function to save a set of columns as a new partition folder
+def save_columns(store_path, columns):
+    partitions = list_partitions(store_path)
+    number = int(partitions[-1].split('-')[1]) + 1 if partitions else 0
+    name = f'part-{number:06d}'
+    temp_path = os.path.join(store_path, name + '.tmp')
+    os.makedirs(temp_path, exist_ok=True)
+    for column, values in columns.items():
+        np.save(os.path.join(temp_path, column + '.npy'), values)
+    os.replace(temp_path, os.path.join(store_path, name))
+    return name
+
+# Function to load all columns of a store; an image counted again later keeps only its latest row
+def load_columns(store_path, with_images=False):
+    names = [column for column in COLUMNS if with_images or column != 'image']
+    partitions = list_partitions(store_path)
+    if not partitions:
+        return {name: np.zeros(0, dtype=COLUMNS[name] or 'U1') for name in names}
+    with instrumentation.stage('load_columns'):
+        parts = [{name: np.load(os.path.join(store_path, partition, name + '.npy'), mmap_mode='r') for name in names}
+                 for partition in partitions]
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in names}
+        if len(parts) > 1:
+            # Last occurrence of every key wins (rows of later partitions replace earlier ones)
+            keys = columns['key']
+            _, first_from_end = np.unique(keys[::-1], return_index=True)
+            if len(first_from_end) < len(keys):
+                keep = np.sort(len(keys) - 1 - first_from_end)
+                columns = {name: values[keep] for name, values in columns.items()}
+    return columns
+
+# Function to merge all partitions into one, dropping replaced rows
+def compact(store_path=None):
+    store_path = store_path or globals()['store_path']
+    partitions = list_partitions(store_path)
+    if len(partitions) < 2:
+        return len(partitions)
+    columns = load_columns(store_path, with_images=True)
+    save_columns(store_path, columns)
+    for partition in partitions:
+        shutil.rmtree(os.path.join(store_path, partition))
+    print(f"Compacted {len(partitions)} partitions into one ({len(columns['key'])} images)")
+    return len(partitions)
+
+# Function to build the row of one image from its detections, an (n, 6) array of x1, y1, x2, y2, conf, cls
+def count_row(relative_path, image_path, detections):
+    detections = detections[(detections[:, 5] == target_class) & (detections[:, 4] >= min_conf)]
+    day, lat, lon = image_metadata(image_path)
+    return {'image': relative_path.replace('\\', '/'), 'block': block_name(relative_path), 'day': day, 'lat': lat, 'lon': lon,
+            'count': int((detections[:, 4] >= count_conf).sum()), 'conf_sum': float(detections[:, 4].sum())}
+
+# Function to detect and count the images below root_folder that are not in the store yet
+def scan(root_folder=None, store_path=None, model=None):
+    from common import detector
+    root_folder = root_folder or globals()['root_folder']
+    store_path = store_path or globals()['store_path']
+    known = set(load_columns(store_path)['key'].tolist())
+    relative_paths = [p for p in find_images(root_folder) if image_key(p) not in known]
+    print(f"{len(relative_paths)} new images to count ({len(known)} already in the store)")
+    if not relative_paths:
+        return 0
+
+    model = model or detector.load_raw_model(weights_path, yolov5_directory)
+    if rect:
+        # Keep images of the same aspect ratio together, so every batch runs at one rectangular shape
+        order = detector.bucket_order([os.path.join(root_folder, p) for p in relative_paths], img_size, detector.model_stride(model))
+        relative_paths = [relative_paths[k] for k in order]
+    blocks = load_blocks(store_path)
+    rows = []
+    for i in range(0, len(relative_paths), batch_size):
+        batch = relative_paths[i:i + batch_size]
+        paths = [os.path.join(root_folder, p) for p in batch]
+        with instrumentation.stage('detect'):
+            results, _ = detector.detect_batch(model, paths, img_size, min_conf, rect=rect)
+        rows += [count_row(relative_path, path, detections) for relative_path, path, detections in zip(batch, paths, results)]
+        # Write a partition every rows_per_partition images so an interrupted scan keeps its progress
+        if len(rows) >= rows_per_partition:
+            write_partition(store_path, rows, blocks)
+            rows = []
+    write_partition(store_path, rows, blocks)
+    instrumentation.count('images_counted', len(relative_paths))
+    return len(relative_paths)
+
+# Function to read a detect.py label file (class, cx, cy, w, h, conf) as detections with the conf and cls columns set
+def read_detect_labels(label_path):
+    detections = np.zeros((0, 6), dtype=np.float32)
+    if os.path.exists(label_path):
+        with open(label_path, 'r') as f:
+            rows = [line.split()[:6] for line in f if len(line.split()) >= 6]
+        if rows:
+            rows = np.array(rows, dtype=np.float32)
+            detections = np.zeros((len(rows), 6), dtype=np.float32)
+            detections[:, 4], detections[:, 5] = rows[:, 5], rows[:, 0]
+    return detections
+
+# Function to find the label file of every image below root_folder in the output of detect.py --save-txt
+# detect.py writes <stem>.txt without the subfolder, so an archive is labeled with one run per folder; those runs are
+# looked up as label_folder/<relative folder>/<stem>.txt. A flat label folder (label_folder/<stem>.txt) is only used
+# for names no other image shares, since its files cannot tell two blocks' IMG_0001.jpg apart.
+def label_paths_for(relative_paths, label_folder):
+    stems = {}
+    for relative_path in relative_paths:
+        stem = os.path.splitext(os.path.basename(relative_path))[0]
+        stems[stem] = stems.get(stem, 0) + 1
+    label_paths, ambiguous = [], []
+    for relative_path in relative_paths:
+        stem = os.path.splitext(os.path.basename(relative_path))[0]
+        nested = os.path.join(label_folder, os.path.dirname(relative_path), stem + '.txt')
+        flat = os.path.join(label_folder, stem + '.txt')
+        if os.path.exists(nested) or stems[stem] == 1:
+            label_paths.append(nested if os.path.exists(nested) else flat)
+        else:
+            if os.path.exists(flat):
+                ambiguous.append(relative_path)
+            label_paths.append(nested)
+    if ambiguous:
+        raise ValueError(f"{len(ambiguous)} images share a file name with another image (e.g. {ambiguous[0]}) and only have a "
+                         f"label in the top of {label_folder}; run detect.py per folder and keep the folders below the label folder")
+    return label_paths
+
+# Function to count the images below root_folder from the label files of detect.py --save-txt --save-conf
+# Images without a label file had no detections. Images already in the store are counted again (their row is replaced).
+def import_labels(root_folder, label_folder, store_path=None):
+    store_path = store_path or globals()['store_path']
+    relative_paths = find_images(root_folder)
+    label_paths = label_paths_for(relative_paths, label_folder)
+    blocks = load_blocks(store_path)
+    rows = [count_row(relative_path, os.path.join(root_folder, relative_path), read_detect_labels(label_path))
+            for relative_path, label_path in zip(relative_paths, label_paths)]
+    write_partition(store_path, rows, blocks)
+    print(f"Imported counts of {len(rows)} images into {store_path}")
+    return len(rows)
+
+# Function to turn a day number into a date
+def day_to_date(day):
+    return datetime.date(1970, 1, 1) + datetime.timedelta(days=int(day))
+
+# Function to aggregate the counts per 'block', 'week' or 'block_week'
+# weighted=True sums the confidences instead of the counts; start and end (datetime.date) limit the capture dates
+def aggregate(columns, blocks, by='block', weighted=False, start=None, end=None):
+    values = columns['conf_sum'] if weighted else columns['count']
+    mask = np.ones(len(values), dtype=bool)
+    if start:
+        mask &= columns['day'] >= (start - datetime.date(1970, 1, 1)).days
+    if end:
+        mask &= columns['day'] <= (end - datetime.date(1970, 1, 1)).days
+    block, day, values = columns['block'][mask], columns['day'][mask], values[mask].astype(np.float64)
+    if not len(values):
+        return []
+
+    # Weeks start on Monday; 1970-01-01 was a Thursday
+    week = (day + 3) // 7
+    first_week = int(week.min())
+    if by == 'block':
+        index, labels = block, [(name,) for name in blocks]
+    elif by == 'week':
+        index = week - first_week
+        labels = [(day_to_date(w * 7 - 3).isoformat(),) for w in range(first_week, int(week.max()) + 1)]
+    elif by == 'block_week':
+        weeks = int(week.max()) - first_week + 1
+        index = block.astype(np.int64) * weeks + (week - first_week)
+        labels = [(name, day_to_date((first_week + w) * 7 - 3).isoformat()) for name in blocks for w in range(weeks)]
+    else:
+        raise ValueError(f"Unknown grouping '{by}'; use 'block', 'week' or 'block_week'")
+
+    totals = np.bincount(index, weights=values, minlength=len(labels))
+    images = np.bincount(index, minlength=len(labels))
+    return [labels[i] + (int(images[i]), float(totals[i])) for i in np.nonzero(images)[0]]
+
+# Function to print an aggregate as a table
+def print_report(rows, by='block', weighted=False):
+    headers = {'block': ['block'], 'week': ['week of'], 'block_week': ['block', 'week of']}[by]
+    total_name = 'weighted bunches' if weighted else 'bunches'
+    print(''.join(f"{header:<24}" for header in headers) + f"{'images':>10}{total_name:>18}{'per image':>11}")
+    for row in rows:
+        *labels, images, total = row
+        print(''.join(f"{label or '(root)':<24}" for label in labels) + f"{images:>10}{total:>18.1f}{total / images:>11.2f}")
+
+# Function to load a store and print one aggregate, with the query time
+def report(store_path=None, by='block', weighted=False, start=None, end=None):
+    store_path = store_path or globals()['store_path']
+    columns = load_columns(store_path)
+    blocks = load_blocks(store_path)
+    begin = time.perf_counter()
+    rows = aggregate(columns, blocks, by, weighted, start, end)
+    elapsed = (time.perf_counter() - begin) * 1000
+    print_report(rows, by, weighted)
+    print(f"{len(columns['key'])} images, query took {elapsed:.1f} ms")
+    return rows
+
+if __name__ == '__main__':
+    scan()
+    report(by='block_week')
@@ -0,0 +1,260 @@
+# This script finds out where the detector goes wrong on a labeled dataset, box by box.
+# Every image below dataset_folder is run through the detector and its detections are matched to the ground-truth
+# boxes (YOLO label files, found the same way train.py finds them) with one IoU matrix per image. Every box is then
+# classified as:
+#   TP           detection matched to a label of the same class with IoU >= iou_thres
+#   LOC          detection that overlaps a label (IoU >= loc_iou) but not enough to match: a localization error
+#   FP           detection that does not overlap any label, or a duplicate of a matched detection
+#   FN           label that no detection matched
+# The boxes go into an indexed SQLite database together with their size, confidence, best IoU, source folder and the
+# sharpness (Laplacian variance) of their image, so questions such as "FNs under 32 px from the blurry bucket" are
+# one indexed query, and the crops of the matching boxes can be exported in bulk for review.
+#
+# Typical use:
+#   bbunch errors analyze <dataset folder> <errors.sqlite>
+#   bbunch errors query <errors.sqlite> --kind FN --max-size 32 --blurry --export crops/
+
+import os
+import sys
+import time
+import sqlite3
+import numpy as np
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+from common import yolo_data
+
+# Path to YOLOv5 directory, trained weights and dataset
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+weights_path = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_small\exp12\weights\best.pt"
+dataset_folder = r"D:\UniDoc\y2s1\SEGP\dataset\script_testing\yolo_dataset_splited\images\val"
+database_path = 'errors.sqlite'
+img_size = 640
+batch_size = 32
+conf_thres = 0.4  # Operating point the errors are measured at
+iou_thres = 0.5  # IoU for a detection to match a label
+loc_iou = 0.1  # Unmatched detections overlapping a label at least this much are localization errors
+blur_threshold = 100.0  # Images below this Laplacian variance are in the blurry bucket
+crop_context = 0.25  # Exported crops include this share of the box size around it
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    source TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    sharpness REAL
+);
+CREATE TABLE IF NOT EXISTS boxes (
+    id INTEGER PRIMARY KEY,
+    image_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    class INTEGER NOT NULL,
+    conf REAL,
+    iou REAL,
+    x1 REAL, y1 REAL, x2 REAL, y2 REAL,
+    size REAL NOT NULL,
+    source TEXT NOT NULL,
+    sharpness REAL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE INDEX IF NOT EXISTS boxes_kind_size ON boxes (kind, size);
+CREATE INDEX IF NOT EXISTS boxes_kind_sharpness ON boxes (kind, sharpness);
+CREATE INDEX IF NOT EXISTS boxes_source_kind ON boxes (source, kind);
+CREATE INDEX IF NOT EXISTS boxes_image ON boxes (image_id);
+"""
+KINDS = ('TP', 'LOC', 'FP', 'FN')
+
+# Function to open the error database
+def connect(database_path):
+    connection = sqlite3.connect(database_path)
+    connection.executescript(SCHEMA)
+    return connection
+
+# Function to list the images below a folder, recursively
+def find_images(folder):
+    found = []
+    for root, _, files in os.walk(folder):
+        found += [os.path.join(root, f) for f in files if f.lower().endswith(yolo_data.IMAGE_EXTENSIONS)]
+    return sorted(found)
+
+# Function to read the labels of an image as pixel boxes: (n, 5) class, x1, y1, x2, y2
+def ground_truth_boxes(image_path, width, height):
+    labels = yolo_data.read_labels(yolo_data.label_path_for(image_path))
+    boxes = yolo_data.xywh_to_xyxy(labels[:, 1:5]) * np.array([width, height, width, height], dtype=np.float32)
+    return np.column_stack([labels[:, 0], boxes])
+
+# Function to classify the detections and labels of one image
+# Returns the detection kinds with their best IoU, and a boolean 'missed' per label
+def classify_boxes(detections, ground_truth):
+    kinds = np.full(len(detections), 'FP', dtype=object)
+    best_iou = np.zeros(len(detections), dtype=np.float32)
+    missed = np.ones(len(ground_truth), dtype=bool)
+    if not len(detections) or not len(ground_truth):
+        return kinds, best_iou, missed
+
+    ious = yolo_data.box_iou(detections[:, :4], ground_truth[:, 1:5])
+    ious[detections[:, 5][:, None] != ground_truth[:, 0][None, :]] = 0  # Boxes only match within the same class
+    best_iou = ious.max(axis=1)
+    # Greedy matching in order of confidence: each label goes to the most confident detection that reaches iou_thres
+    for i in np.argsort(-detections[:, 4]):
+        candidates = np.where(missed & (ious[i] >= iou_thres))[0]
+        if len(candidates):
+            missed[candidates[np.argmax(ious[i, candidates])]] = False
+            kinds[i] = 'TP'
+    # Unmatched detections that still overlap a label well enough to match were duplicates and stay FP
+    kinds[(kinds == 'FP') & (best_iou >= loc_iou) & (best_iou < iou_thres)] = 'LOC'
+    return kinds, best_iou, missed
+
+# Function to build the database rows of the boxes of one image
+def box_rows(image_id, source, sharpness, detections, ground_truth):
+    kinds, best_iou, missed = classify_boxes(detections, ground_truth)
+    rows = []
+    for (x1, y1, x2, y2, conf, cls), kind, iou in zip(detections.tolist(), kinds, best_iou.tolist()):
+        rows.append((image_id, kind, int(cls), conf, iou, x1, y1, x2, y2, ((x2 - x1) * (y2 - y1)) ** 0.5, source, sharpness))
+    # Best IoU of a missed label with any detection of its class
+    if len(detections):
+        label_iou = yolo_data.box_iou(ground_truth[:, 1:5], detections[:, :4])
+        label_iou[ground_truth[:, 0][:, None] != detections[:, 5][None, :]] = 0
+        label_iou = label_iou.max(axis=1)
+    else:
+        label_iou = np.zeros(len(ground_truth), dtype=np.float32)
+    for (cls, x1, y1, x2, y2), iou in zip(ground_truth[missed].tolist(), label_iou[missed].tolist()):
+        rows.append((image_id, 'FN', int(cls), None, iou, x1, y1, x2, y2, ((x2 - x1) * (y2 - y1)) ** 0.5, source, sharpness))
+    return rows
+
+# Function to run the detector over a dataset and store every box; images already in the database are skipped
+def analyze(dataset_folder=None, database_path=None, model=None):
+    from data_processing_annotation.qua_classifier import blur_score
+    dataset_folder = dataset_folder or globals()['dataset_folder']
+    database_path = database_path or globals()['database_path']
+    connection = connect(database_path)
+    connection.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", [
+        ('weights', weights_path), ('conf_thres', str(conf_thres)), ('iou_thres', str(iou_thres)), ('loc_iou', str(loc_iou))])
+    done = {row[0] for row in connection.execute("SELECT path FROM images")}
+    image_paths = [p for p in find_images(dataset_folder) if os.path.abspath(p) not in done]
+    print(f"{len(image_paths)} images to analyze ({len(done)} already in {database_path})")
+    if not image_paths:
+        return summarize(database_path)
+
+    model = model or detector.load_raw_model(weights_path, yolov5_directory)
+    start = time.perf_counter()
+    for i in range(0, len(image_paths), batch_size):
+        batch = image_paths[i:i + batch_size]
+        with instrumentation.stage('decode'):
+            arrays = [detector.decode_image(path) for path in batch]
+        results, shapes = detector.detect_batch(model, arrays, img_size, conf_thres)
+        with instrumentation.stage('match'):
+            rows = []
+            for path, array, detections, (height, width) in zip(batch, arrays, results, shapes):
+                sharpness = blur_score(array)
+                source = os.path.relpath(os.path.dirname(path), dataset_folder).replace('\\', '/')
+                image_id = connection.execute("INSERT INTO images (path, source, width, height, sharpness) VALUES (?, ?, ?, ?, ?)",
+                                              (os.path.abspath(path), source, width, height, sharpness)).lastrowid
+                rows += box_rows(image_id, source, sharpness, detections, ground_truth_boxes(path, width, height))
+            connection.executemany("INSERT INTO boxes (image_id, kind, class, conf, iou, x1, y1, x2, y2, size, source, sharpness) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        # One commit per batch: an interrupted run keeps the finished batches and resumes after them
+        connection.commit()
+    print(f"Analyzed {len(image_paths)} images in {time.perf_counter() - start:.1f}s")
+    connection.close()
+    return summarize(database_path)
+
+# Function to build the WHERE clause of a box query
+def box_filter(kind=None, min_size=None, max_size=None, source=None, blurry=None, min_conf=None, max_conf=None):
+    clauses, values = [], []
+    if kind:
+        clauses.append("boxes.kind = ?")
+        values.append(kind)
+    if min_size is not None:
+        clauses.append("boxes.size >= ?")
+        values.append(min_size)
+    if max_size is not None:
+        clauses.append("boxes.size < ?")
+        values.append(max_size)
+    if source:
+        # The source folder itself or any folder below it
+        clauses.append("(boxes.source = ? OR boxes.source LIKE ?)")
+        values += [source, source.rstrip('/') + '/%']
+    if blurry is not None:
+        clauses.append("boxes.sharpness < ?" if blurry else "boxes.sharpness >= ?")
+        values.append(blur_threshold)
+    if min_conf is not None:
+        clauses.append("boxes.conf >= ?")
+        values.append(min_conf)
+    if max_conf is not None:
+        clauses.append("boxes.conf < ?")
+        values.append(max_conf)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", values
+
+# Function to query boxes; returns (box id, image path, kind, class, conf, iou, x1, y1, x2, y2, size, sharpness) rows
+def query_boxes(connection, limit=None, **filters):
+    where, values = box_filter(**filters)
+    sql = ("SELECT boxes.id, images.path, kind, class, conf, iou, x1, y1, x2, y2, size, boxes.sharpness "
+           "FROM boxes JOIN images ON images.id = boxes.image_id" + where + " ORDER BY boxes.id")
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    return connection.execute(sql, values).fetchall()
+
+# Function to write the crops of the given boxes, decoding every image once
+def export_crops(rows, output_folder):
+    import cv2
+    from concurrent.futures import ThreadPoolExecutor
+    os.makedirs(output_folder, exist_ok=True)
+    by_image = {}
+    for row in rows:
+        by_image.setdefault(row[1], []).append(row)
+
+    def export_image(item):
+        path, boxes = item
+        image = cv2.imread(path)
+        if image is None:
+            return 0
+        height, width = image.shape[:2]
+        written = 0
+        for box_id, _, kind, cls, conf, iou, x1, y1, x2, y2, size, _ in boxes:
+            pad_x, pad_y = (x2 - x1) * crop_context, (y2 - y1) * crop_context
+            left, top = max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y))
+            right, bottom = min(width, int(x2 + pad_x + 1)), min(height, int(y2 + pad_y + 1))
+            if right <= left or bottom <= top:
+                continue
+            conf_text = f"_{conf:.2f}" if conf is not None else ''
+            name = f"{kind}_{box_id}_{os.path.splitext(os.path.basename(path))[0]}{conf_text}.jpg"
+            cv2.imwrite(os.path.join(output_folder, name), image[top:bottom, left:right])
+            written += 1
+        return written
+
+    # OpenCV releases the GIL while decoding and encoding, so threads keep every core busy
+    with instrumentation.stage('export_crops'), ThreadPoolExecutor() as executor:
+        written = sum(executor.map(export_image, by_image.items()))
+    print(f"Exported {written} crops from {len(by_image)} images to {output_folder}")
+    return written
+
+# Function to print the error counts per source folder and per size bucket
+def summarize(database_path=None):
+    database_path = database_path or globals()['database_path']
+    connection = connect(database_path)
+    counts = {}
+    for source, kind, count in connection.execute("SELECT source, kind, COUNT(*) FROM boxes GROUP BY source, kind"):
+        counts.setdefault(source, dict.fromkeys(KINDS, 0))[kind] = count
+    print(f"\n{'source':<30}" + ''.join(f"{kind:>8}" for kind in KINDS) + f"{'precision':>11}{'recall':>8}")
+    for source, row in sorted(counts.items()):
+        detections, labels = row['TP'] + row['LOC'] + row['FP'], row['TP'] + row['FN']
+        print(f"{source:<30}" + ''.join(f"{row[kind]:>8}" for kind in KINDS)
+              + f"{row['TP'] / max(detections, 1):>11.3f}{row['TP'] / max(labels, 1):>8.3f}")
+
+    buckets = [('< 32 px', 0, 32), ('32-96 px', 32, 96), ('>= 96 px', 96, 1e9)]
+    print(f"\n{'box size':<30}" + ''.join(f"{kind:>8}" for kind in KINDS))
+    for name, low, high in buckets:
+        row = dict.fromkeys(KINDS, 0)
+        for kind, count in connection.execute("SELECT kind, COUNT(*) FROM boxes WHERE size >= ? AND size < ? GROUP BY kind", (low, high)):
+            row[kind] = count
+        print(f"{name:<30}" + ''.join(f"{row[kind]:>8}" for kind in KINDS))
+    connection.close()
+    return counts
+
+if __name__ == '__main__':
+    analyze()
@@ -0,0 +1,2 @@
+# Unified command line interface for the Black Bunch python_scripts tools.
+# Run `python -m bbunch --help` from the python_scripts folder to list the subcommands.
@@ -0,0 +1,11 @@
+# Allows `python -m bbunch` (and `python path/to/bbunch`) to run the command line interface
+import os
+import sys
+
+# Make the python_scripts folders importable wherever the command is started from
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bbunch.cli import main
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,798 @@
+# Command line interface for the python_scripts tools: python -m bbunch <command> [options]
+# Every subcommand maps onto the functions of an existing script. The script module is only imported once its
+# subcommand runs, and the scripts import torch, tensorflow, cv2, matplotlib and ultralytics inside the functions
+# that need them, so `--help` and the label tools start in a fraction of a second on a CPU-only host.
+# `python -m bbunch import-report` measures this for every subcommand.
+#
+# To add a subcommand, write an add_<name>_arguments(parser) and a run_<name>(args) function and list them in COMMANDS.
+
+import os
+import re
+import sys
+import time
+import argparse
+import datetime
+import importlib
+import subprocess
+
+# Folder that holds the script packages (active_learning, data_processing_annotation, model_training, ...)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Function to import a script module when its subcommand runs
+def load(module_name):
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return importlib.import_module(module_name)
+
+# Function to replace a script's configuration globals with the values given on the command line
+def override(module, **values):
+    for name, value in values.items():
+        if value is not None:
+            setattr(module, name, value)
+
+# ---- data_processing_annotation ----
+
+def add_convert_polygons_arguments(parser):
+    parser.add_argument('annotations', help="Folder with the polygon annotation .txt files")
+    parser.add_argument('output', help="Output folder for YOLO labels (images are copied to <output>/images)")
+    parser.add_argument('--images', help="Folder with the original images (default: the annotations folder)")
+
+def run_convert_polygons(args):
+    module = load('data_processing_annotation.yolo_format_convert')
+    module.convert_annotations_and_copy_images(input_directory=args.annotations, output_directory=args.output,
+                                               image_directory=args.images or args.annotations)
+    print("Conversion completed. YOLO formatted annotations and associated images are saved in the output directory.")
+
+def add_split_arguments(parser):
+    parser.add_argument('images', help="Folder with the images")
+    parser.add_argument('labels', help="Folder with the YOLO label files")
+    parser.add_argument('output', help="Output folder for images/{train,val} and labels/{train,val}")
+    parser.add_argument('--train-ratio', type=float, default=0.8)
+    parser.add_argument('--seed', type=int, help="Random seed for a reproducible split")
+
+def run_split(args):
+    module = load('data_processing_annotation.dataset_split')
+    if args.seed is not None:
+        import random
+        random.seed(args.seed)
+    module.split_dataset(args.images, args.labels, args.output, args.train_ratio)
+
+def add_split_manifest_arguments(parser):
+    parser.add_argument('manifest', help="manifest.jsonl written by pseudo-label")
+    parser.add_argument('output', help="Output folder for images/{train,val} and labels/{train,val}")
+    parser.add_argument('--train-ratio', type=float, default=0.8)
+    parser.add_argument('--include-review', action='store_true', help="Also use images from the needs_review bucket (after they were checked)")
+    parser.add_argument('--seed', type=int, help="Random seed for a reproducible split")
+
+def run_split_manifest(args):
+    module = load('data_processing_annotation.dataset_split')
+    if args.seed is not None:
+        import random
+        random.seed(args.seed)
+    statuses = ('accepted', 'needs_review') if args.include_review else ('accepted',)
+    train, val = module.split_from_manifest(args.manifest, args.output, args.train_ratio, statuses)
+    print(f"Split {train} train and {val} val images into {args.output}")
+    print("Dataset split completed!")
+
+def add_to_coco_arguments(parser):
+    parser.add_argument('images', help="Folder with the images")
+    parser.add_argument('labels', help="Folder with the YOLO label files")
+    parser.add_argument('--output', default='annotations.json', help="COCO JSON file to write")
+
+def run_to_coco(args):
+    module = load('data_processing_annotation.yolo_to_coco')
+    module.convert_yolo_to_coco(args.images, args.labels, args.output)
+    print(f"COCO format annotations saved to {args.output}")
+
+def add_fix_labels_arguments(parser):
+    parser.add_argument('annotations', help="Folder with the YOLO label files")
+    parser.add_argument('output', help="Folder for the corrected label files")
+
+def run_fix_labels(args):
+    module = load('data_processing_annotation.label_correction')
+    module.correct_labels(args.annotations, args.output)
+    print("YOLO annotations updated successfully!")
+
+def add_json_to_txt_arguments(parser):
+    parser.add_argument('json', help="Annotation JSON exported by the labeling tool")
+    parser.add_argument('txt', help="Polygon .txt file to write")
+
+def run_json_to_txt(args):
+    module = load('data_processing_annotation.json2txt')
+    module.convert_json_to_txt(args.json, args.txt)
+    print(f"Conversion complete. Output saved to {args.txt}")
+
+def add_to_jpg_arguments(parser):
+    parser.add_argument('input', help="Image to convert")
+    parser.add_argument('output', help="Output folder")
+    parser.add_argument('--quality', type=int, help="JPEG quality (default: PIL's 75)")
+    parser.add_argument('--progressive', action='store_true')
+    parser.add_argument('--max-side', type=int, help="Downscale so the longest side is at most this many pixels")
+    parser.add_argument('--exif-transpose', action='store_true', help="Apply the EXIF orientation")
+
+def run_to_jpg(args):
+    module = load('data_processing_annotation.tojpg')
+    os.makedirs(args.output, exist_ok=True)
+    module.convert_to_jpg(args.input, args.output, quality=args.quality, progressive=args.progressive,
+                          max_side=args.max_side, exif_transpose=args.exif_transpose)
+
+def add_ingest_arguments(parser):
+    parser.add_argument('input', help="Folder tree with the field photos")
+    parser.add_argument('output', help="Output folder for the JPEGs and the ingest ledger")
+    parser.add_argument('--max-side', type=int, help="Downscale so the longest side is at most this many pixels (0 keeps the size)")
+    parser.add_argument('--quality', type=int, help="JPEG quality")
+    parser.add_argument('--no-progressive', dest='progressive', action='store_false', default=None, help="Write baseline JPEGs")
+    parser.add_argument('--workers', type=int, help="Number of worker processes (default: all cores)")
+
+def run_ingest(args):
+    module = load('data_processing_annotation.ingest_images')
+    totals = module.ingest_folder(args.input, args.output, args.max_side, args.quality, args.progressive, args.workers)
+    return 1 if totals['failed'] else 0
+
+def add_ingest_video_arguments(parser):
+    parser.add_argument('input', help="Folder tree with the walk-through videos")
+    parser.add_argument('output', help="Output folder for the selected frames and the video ledger")
+    parser.add_argument('--max-side', type=int, help="Downscale frames so the longest side is at most this many pixels")
+    parser.add_argument('--scene-threshold', type=float, help="Thumbnail difference (0-255) that counts as a new view")
+    parser.add_argument('--blur-threshold', type=float, help="Laplacian variance below which a frame is dropped")
+    parser.add_argument('--stride', type=int, help="Score every n-th frame")
+    parser.add_argument('--workers', type=int, help="Number of worker processes (default: all cores)")
+
+def run_ingest_video(args):
+    module = load('data_processing_annotation.video_ingest')
+    override(module, max_side=args.max_side, scene_threshold=args.scene_threshold, blur_threshold=args.blur_threshold,
+             analysis_stride=args.stride)
+    totals = module.ingest_videos(args.input, args.output, args.workers)
+    return 1 if totals['failed'] else 0
+
+def add_pack_shards_arguments(parser):
+    parser.add_argument('images', help="Folder with the images of one split")
+    parser.add_argument('labels', help="Folder with the YOLO label files of that split")
+    parser.add_argument('output', help="Output folder for the tar shards and index.json")
+    parser.add_argument('--shard-size', type=float, default=1000, help="Shard size in MB")
+    parser.add_argument('--prefix', default='shard', help="Shard file name prefix")
+
+def run_pack_shards(args):
+    module = load('data_processing_annotation.dataset_shards')
+    module.write_shards(args.images, args.labels, args.output, int(args.shard_size * 1e6), args.prefix)
+
+def add_seg_labels_arguments(parser):
+    parser.add_argument('action', choices=['pack', 'unpack', 'boxes'],
+                        help="pack: YOLO-seg txt folder -> .npz label set; unpack: label set -> YOLO-seg txt; "
+                             "boxes: label set -> YOLO box labels")
+    parser.add_argument('source', help="Label folder (pack) or .npz label set (unpack, boxes)")
+    parser.add_argument('output', help="Output .npz (pack) or folder (unpack, boxes)")
+    parser.add_argument('--images', help="Image folder, to record the image sizes for rasterization (pack)")
+
+def run_seg_labels(args):
+    module = load('data_processing_annotation.segmentation_labels')
+    if args.action == 'pack':
+        module.pack_folder(args.source, args.output, args.images)
+    elif args.action == 'unpack':
+        module.unpack_to_folder(module.load_label_set(args.source), args.output)
+    else:
+        module.export_boxes(module.load_label_set(args.source), args.output)
+
+def add_blur_sort_arguments(parser):
+    parser.add_argument('data_dir', help="Folder of images to sort into blurred/ and clear/")
+    parser.add_argument('--threshold', type=float, default=100.0, help="Laplacian variance below which an image is blurred")
+
+def run_blur_sort(args):
+    module = load('data_processing_annotation.qua_classifier')
+    module.classify_images(args.data_dir, args.threshold)
+
+def add_train_blur_classifier_arguments(parser):
+    parser.add_argument('data_dir', help="Folder containing the blurred/ and clear/ subfolders")
+
+def run_train_blur_classifier(args):
+    module = load('data_processing_annotation.qua_classifier')
+    module.train_classifier(args.data_dir)
+    print("Training complete. Best model saved as 'best_model.h5'")
+
+# ---- active_learning ----
+
+def add_mine_arguments(parser):
+    parser.add_argument('root', help="Root folder searched recursively for 'img' folders")
+    parser.add_argument('output', help="Folder that images with detections are moved to")
+    parser.add_argument('--weights', help="Trained YOLOv5 weights")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+    parser.add_argument('--img-size', type=int)
+
+def run_mine(args):
+    module = load('active_learning.find_FPsample')
+    override(module, root_folder=args.root, output_folder=args.output, weights_path=args.weights,
+             yolov5_directory=args.yolov5_dir, img_size=args.img_size)
+    module.process_all_images()
+
+def add_cascade_mine_arguments(parser):
+    parser.add_argument('root', nargs='?', help="Root folder searched recursively for 'img' folders")
+    parser.add_argument('output', nargs='?', help="Folder that images with detections are moved to")
+    parser.add_argument('--calibrate', metavar='FOLDER', help="Tune the gate thresholds on this folder instead of scanning")
+    parser.add_argument('--target-recall', type=float, help="Share of the full detector's positive images to keep")
+    parser.add_argument('--thresholds', help="JSON file the calibrated thresholds are saved to and read from")
+    parser.add_argument('--gate-weights', help="Small fast model used as the gate (e.g. nano)")
+    parser.add_argument('--full-weights', help="Full detector for the uncertain images")
+    parser.add_argument('--gate-img-size', type=int)
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+
+def run_cascade_mine(args):
+    module = load('active_learning.cascade_mining')
+    override(module, target_recall=args.target_recall, thresholds_path=args.thresholds, gate_weights=args.gate_weights,
+             full_weights=args.full_weights, gate_img_size=args.gate_img_size, yolov5_directory=args.yolov5_dir)
+    if args.calibrate:
+        return 0 if module.calibrate(args.calibrate) else 1
+    module.cascade_process_all_images(args.root, args.output)
+
+def add_distributed_mine_arguments(parser):
+    parser.add_argument('action', choices=['plan', 'work', 'local', 'collect', 'status'],
+                        help="plan: create the queue; work: run one worker; local: run --workers workers here; "
+                             "collect: move images with detections; status: show the queue state")
+    parser.add_argument('root', help="Archive root folder (as mounted on this host)")
+    parser.add_argument('queue', help="SQLite queue file on a drive every worker can reach")
+    parser.add_argument('output', nargs='?', help="Folder that collect moves images with detections to")
+    parser.add_argument('--workers', type=int, help="Number of local worker processes")
+    parser.add_argument('--threads', type=int, default=0, help="Torch CPU threads for a single worker")
+    parser.add_argument('--unit-size', type=int, help="Images per work unit")
+    parser.add_argument('--weights', help="Trained YOLOv5 weights")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+
+def run_distributed_mine(args):
+    module = load('active_learning.distributed_mining')
+    override(module, weights_path=args.weights, yolov5_directory=args.yolov5_dir)
+    if args.action == 'plan':
+        module.plan(args.root, args.queue, args.unit_size)
+    elif args.action == 'work':
+        module.run_worker(args.root, args.queue, args.threads)
+    elif args.action == 'local':
+        module.run_local(args.workers, args.root, args.queue)
+    elif args.action == 'collect':
+        module.collect(args.root, args.queue, args.output)
+    else:
+        connection = module.work_queue.connect(args.queue)
+        print(module.work_queue.queue_status(connection))
+
+def add_worker_pool_arguments(parser):
+    parser.add_argument('action', choices=['mine', 'report'],
+                        help="mine: mining scan on workers sharing one model; report: images/s and memory as workers grow")
+    parser.add_argument('folder', help="Root folder searched for 'img' folders (mine) or a folder of images (report)")
+    parser.add_argument('output', nargs='?', help="Folder images with detections are moved to (mine) or report JSON (report)")
+    parser.add_argument('--workers', type=int, help="Worker processes (mine)")
+    parser.add_argument('--worker-counts', type=lambda text: [int(n) for n in text.split(',')],
+                        help="Comma-separated worker counts compared by the report, e.g. 1,2,4,8,16")
+    parser.add_argument('--limit', type=int, default=256, help="Images used by the report")
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--weights', help="Trained YOLOv5 weights")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+    parser.add_argument('--img-size', type=int)
+
+def run_worker_pool(args):
+    module = load('active_learning.shared_worker_pool')
+    override(module, weights_path=args.weights, yolov5_directory=args.yolov5_dir, img_size=args.img_size,
+             batch_size=args.batch_size)
+    if args.action == 'mine':
+        module.mine(args.folder, args.output, args.workers)
+    else:
+        module.scaling_report(args.folder, args.worker_counts, output_path=args.output, limit=args.limit)
+
+def add_watch_arguments(parser):
+    parser.add_argument('folders', nargs='+', help="Incoming folders to watch")
+    parser.add_argument('--work-folder', required=True, help="Output folder for images, labels, manifest and daemon state")
+    parser.add_argument('--stages', nargs='+', help="Stage chain (default: ingest blur detect pseudo_label)")
+    parser.add_argument('--weights', help="Path to the trained weights file")
+    parser.add_argument('--yolov5-dir', help="Path to the YOLOv5 repository")
+    parser.add_argument('--batch-size', type=int, help="Close a batch when this many files are waiting")
+    parser.add_argument('--max-latency', type=float, help="Close a batch when its oldest file has waited this many seconds")
+    parser.add_argument('--max-pending', type=int, help="Files the watcher may queue before it waits for the stages")
+    parser.add_argument('--poll-interval', type=float, help="Seconds between scans when watchdog is not installed")
+    parser.add_argument('--blur-threshold', type=float, help="Laplacian variance below which an image is dropped as blurred")
+
+def run_watch(args):
+    module = load('active_learning.watch_daemon')
+    override(module, watch_folders=args.folders, work_folder=args.work_folder, stages=args.stages, weights_path=args.weights,
+             yolov5_directory=args.yolov5_dir, batch_size=args.batch_size, max_latency=args.max_latency,
+             max_pending=args.max_pending, poll_interval=args.poll_interval, blur_threshold=args.blur_threshold)
+    module.run_daemon()
+
+def add_mine_shards_arguments(parser):
+    parser.add_argument('shards', help="Folder with the tar shards and index.json")
+    parser.add_argument('output', help="Folder that images with detections are written to")
+    parser.add_argument('--weights', help="Trained YOLOv5 weights")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+    parser.add_argument('--img-size', type=int)
+    parser.add_argument('--batch-size', type=int, default=32)
+
+def run_mine_shards(args):
+    module = load('active_learning.find_FPsample')
+    override(module, weights_path=args.weights, yolov5_directory=args.yolov5_dir, img_size=args.img_size)
+    module.process_shards(args.shards, args.output, args.batch_size)
+
+def add_pseudo_label_arguments(parser):
+    parser.add_argument('images', help="Folder with the images to label")
+    parser.add_argument('output', help="Output folder for labels/, needs_review/ and manifest.jsonl")
+    parser.add_argument('--weights', help="Trained YOLOv5 weights")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+    parser.add_argument('--img-size', type=int)
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--accept-conf', type=float, help="Boxes at or above this confidence are accepted")
+    parser.add_argument('--review-conf', type=float, help="Boxes between this and --accept-conf send the image to review")
+    parser.add_argument('--flush-every', type=int, help="Number of images buffered before labels are written")
+
+def run_pseudo_label(args):
+    module = load('active_learning.pseudo_labeling')
+    override(module, weights_path=args.weights, yolov5_directory=args.yolov5_dir, img_size=args.img_size,
+             batch_size=args.batch_size, accept_conf=args.accept_conf, review_conf=args.review_conf,
+             flush_every=args.flush_every)
+    module.pseudo_label_folder(args.images, args.output)
+
+def add_ensemble_arguments(parser):
+    parser.add_argument('images', help="Folder with the images to label")
+    parser.add_argument('output', help="Folder for the fused YOLO labels (with confidences)")
+    parser.add_argument('--weights', nargs='+', help="YOLOv5 weights of the ensemble members")
+    parser.add_argument('--v8-weights', nargs='+', help="YOLOv8 weights to add to the ensemble")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+    parser.add_argument('--img-size', type=int)
+    parser.add_argument('--scales', nargs='+', type=float, help="Test-time augmentation scales, e.g. 0.83 1.0 1.17")
+    parser.add_argument('--flip', action='store_true', default=None, help="Add a horizontally flipped pass")
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--conf', type=float, help="Confidence threshold for the fused boxes")
+    parser.add_argument('--wbf-iou', type=float, help="IoU above which boxes are fused")
+
+def run_ensemble(args):
+    module = load('active_learning.ensemble_detector')
+    override(module, weights_paths=args.weights, yolov8_weights_paths=args.v8_weights, yolov5_directory=args.yolov5_dir,
+             img_size=args.img_size, tta_scales=args.scales, tta_flip=args.flip, batch_size=args.batch_size,
+             conf_thres=args.conf, wbf_iou_thres=args.wbf_iou)
+    module.ensemble_detect_folder(args.images, args.output)
+
+# ---- analytics ----
+
+def add_counts_arguments(parser):
+    parser.add_argument('action', choices=['scan', 'import', 'report', 'compact'],
+                        help="scan: detect and count new images; import: count from detect.py label files; "
+                             "report: aggregate the counts; compact: merge the store's partitions")
+    parser.add_argument('store', help="Folder of the count store")
+    parser.add_argument('--root', help="Archive root (scan, import); its first-level folders are the blocks")
+    parser.add_argument('--labels', help="Label folder of detect.py --save-txt --save-conf, one subfolder per image folder (import)")
+    parser.add_argument('--by', choices=['block', 'week', 'block_week'], default='block', help="Grouping of the report")
+    parser.add_argument('--weighted', action='store_true', help="Sum detection confidences instead of counting detections")
+    parser.add_argument('--start', type=datetime.date.fromisoformat, help="First capture date (YYYY-MM-DD) in the report")
+    parser.add_argument('--end', type=datetime.date.fromisoformat, help="Last capture date (YYYY-MM-DD) in the report")
+    parser.add_argument('--count-conf', type=float, help="Confidence at which a detection counts as a bunch")
+    parser.add_argument('--weights', help="Trained YOLOv5 weights (scan)")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository (scan)")
+
+def run_counts(args):
+    module = load('analytics.count_store')
+    override(module, count_conf=args.count_conf, weights_path=args.weights, yolov5_directory=args.yolov5_dir)
+    if args.action in ('scan', 'import') and not args.root:
+        print(f"{args.action} needs --root")
+        return 1
+    if args.action == 'scan':
+        module.scan(args.root, args.store)
+    elif args.action == 'import':
+        if not args.labels:
+            print("import needs --labels")
+            return 1
+        module.import_labels(args.root, args.labels, args.store)
+    elif args.action == 'compact':
+        module.compact(args.store)
+    else:
+        module.report(args.store, args.by, args.weighted, args.start, args.end)
+
+def add_errors_arguments(parser):
+    parser.add_argument('action', choices=['analyze', 'query', 'summary'],
+                        help="analyze: detect and classify every box of a labeled dataset; query: list (and export) "
+                             "boxes; summary: counts per source folder and box size")
+    parser.add_argument('database', help="SQLite error database")
+    parser.add_argument('dataset', nargs='?', help="Image folder of a labeled dataset (analyze)")
+    parser.add_argument('--kind', choices=['TP', 'LOC', 'FP', 'FN'], help="Box kind to query")
+    parser.add_argument('--min-size', type=float, help="Smallest box size (sqrt of the area, px)")
+    parser.add_argument('--max-size', type=float, help="Box size below which boxes are returned (px)")
+    parser.add_argument('--source', help="Source folder below the dataset folder, e.g. blurred")
+    parser.add_argument('--blurry', action='store_true', default=None, help="Only boxes of images below the blur threshold")
+    parser.add_argument('--sharp', dest='blurry', action='store_false', help="Only boxes of images at or above the blur threshold")
+    parser.add_argument('--min-conf', type=float, help="Lowest detection confidence")
+    parser.add_argument('--max-conf', type=float, help="Detection confidence below which boxes are returned")
+    parser.add_argument('--limit', type=int, help="Return at most this many boxes")
+    parser.add_argument('--export', help="Write the crops of the returned boxes to this folder")
+    parser.add_argument('--conf-thres', type=float, help="Operating confidence threshold (analyze)")
+    parser.add_argument('--weights', help="Trained YOLOv5 weights (analyze)")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository (analyze)")
+
+def run_errors(args):
+    module = load('analytics.error_analysis')
+    override(module, conf_thres=args.conf_thres, weights_path=args.weights, yolov5_directory=args.yolov5_dir)
+    if args.action == 'analyze':
+        if not args.dataset:
+            print("analyze needs the dataset folder")
+            return 1
+        module.analyze(args.dataset, args.database)
+    elif args.action == 'summary':
+        module.summarize(args.database)
+    else:
+        connection = module.connect(args.database)
+        start = time.perf_counter()
+        rows = module.query_boxes(connection, args.limit, kind=args.kind, min_size=args.min_size, max_size=args.max_size,
+                                  source=args.source, blurry=args.blurry, min_conf=args.min_conf, max_conf=args.max_conf)
+        elapsed = (time.perf_counter() - start) * 1000
+        for box_id, path, kind, cls, conf, iou, x1, y1, x2, y2, size, sharpness in rows[:20]:
+            conf_text = f"{conf:.2f}" if conf is not None else '-'
+            print(f"{box_id:>8} {kind:<4} conf {conf_text:>4} iou {iou:.2f} size {size:6.1f} sharpness {sharpness:8.1f} {path}")
+        if len(rows) > 20:
+            print(f"... {len(rows) - 20} more")
+        print(f"{len(rows)} boxes ({elapsed:.1f} ms)")
+        if args.export:
+            module.export_crops(rows, args.export)
+        connection.close()
+
+# ---- model_training ----
+
+TRAINING_MODULES = {
+    'nano': 'model_training.yolo5_nano',
+    'small': 'model_training.yolo5_small',
+    'large': 'model_training.yolo5_large',
+    'v8s': 'model_training.yolov8s_training',
+}
+
+def add_train_arguments(parser):
+    parser.add_argument('model', choices=list(TRAINING_MODULES), help="Which training script to run")
+    parser.add_argument('--data', help="Dataset data.yaml")
+    parser.add_argument('--epochs', type=int)
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--img-size', type=int)
+    parser.add_argument('--project', help="Project folder for the results")
+    parser.add_argument('--yolov5-dir', help="YOLOv5 repository to run train.py/val.py from")
+    parser.add_argument('--skip-eval', action='store_true', help="Only train, do not run validation afterwards")
+
+def run_train(args):
+    module = load(TRAINING_MODULES[args.model])
+    if args.yolov5_dir:
+        os.chdir(args.yolov5_dir)
+    if args.model == 'v8s':
+        override(module, data_yaml=args.data, epochs=args.epochs, batch=args.batch_size, imgsz=args.img_size, project_name=args.project)
+        module.train_yolov8()
+        if not args.skip_eval:
+            module.evaluate_yolov8()
+    else:
+        override(module, data_yaml=args.data, epochs=args.epochs, batch_size=args.batch_size, img_size=args.img_size, project_name=args.project)
+        module.train_yolov5()
+        if not args.skip_eval:
+            module.evaluate_yolov5()
+    print("Training and evaluation completed!")
+
+TEST_MODULES = {
+    'nano': 'model_training.yolov5_nano_test',
+    'small': 'model_training.yolov5_samll_test',
+}
+
+def add_hyper_search_arguments(parser):
+    parser.add_argument('search_dir', help="Folder of the search (trial database, runs and summary.json); rerun to resume")
+    parser.add_argument('--data', help="Path to data.yaml")
+    parser.add_argument('--framework', choices=['yolov5', 'yolov8'], help="Train with YOLOv5's train.py or with ultralytics")
+    parser.add_argument('--trials', type=int, help="Number of sampled configurations")
+    parser.add_argument('--max-epochs', type=int, help="Epochs of a trial that is never stopped")
+    parser.add_argument('--min-epochs', type=int, help="Epoch of the first rung")
+    parser.add_argument('--eta', type=int, help="Keep the top 1/eta of the trials at every rung")
+    parser.add_argument('--parallel', type=int, help="Trials trained at the same time")
+    parser.add_argument('--cpu-budget', type=int, help="CPU cores shared by the running trials")
+    parser.add_argument('--yolov5-dir', help="Path to the YOLOv5 repository")
+    parser.add_argument('--summary', action='store_true', help="Only print the ranking of the trials so far")
+
+def run_hyper_search(args):
+    module = load('model_training.hyperparameter_search')
+    override(module, data_yaml=args.data, framework=args.framework, n_trials=args.trials, max_epochs=args.max_epochs,
+             min_epochs=args.min_epochs, eta=args.eta, cpu_budget=args.cpu_budget, yolov5_directory=args.yolov5_dir)
+    if args.summary:
+        module.summarize(args.search_dir)
+    else:
+        module.run_search(args.search_dir, args.parallel)
+
+def add_finetune_arguments(parser):
+    parser.add_argument('new_images', nargs='?', help="Folder of newly labeled images (labels in the sibling labels folder)")
+    parser.add_argument('--data', help="Existing dataset data.yaml (its train split is the replay pool)")
+    parser.add_argument('--weights', help="Current best.pt to fine-tune from")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+    parser.add_argument('--output', help="Folder for the incremental dataset, embedding cache and refresh log")
+    parser.add_argument('--replay-size', type=int, help="Old images replayed with the new ones")
+    parser.add_argument('--strategy', choices=['diversity', 'loss'], help="How the replay images are chosen")
+    parser.add_argument('--epochs', type=int, help="Maximum fine-tuning epochs")
+    parser.add_argument('--patience', type=int, help="Stop after this many epochs without val improvement")
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--project', help="Output project folder")
+    parser.add_argument('--no-merge', action='store_true', help="Do not add the new images to the train split afterwards")
+    parser.add_argument('--log-full-retrain', type=float, metavar='SECONDS',
+                        help="Only record the wall-clock time of a full retrain on the current train split")
+
+def run_finetune(args):
+    module = load('model_training.incremental_finetune')
+    override(module, data_yaml=args.data, weights_path=args.weights, yolov5_directory=args.yolov5_dir,
+             incremental_directory=args.output, replay_size=args.replay_size, replay_strategy=args.strategy,
+             max_epochs=args.epochs, patience=args.patience, batch_size=args.batch_size, project_name=args.project,
+             merge_new=False if args.no_merge else None)
+    if args.log_full_retrain is not None:
+        data = module.yolo_data.load_data_yaml(module.data_yaml)
+        images = len(module.yolo_data.list_images(module.yolo_data.split_images_dir(data, 'train', module.data_yaml)))
+        module.log_full_retrain(args.log_full_retrain, images)
+        return
+    module.refresh(args.new_images)
+
+def add_crops_arguments(parser):
+    parser.add_argument('action', choices=['cache', 'materialize', 'train'],
+                        help="cache: tile the training images; materialize: write crop rounds as a dataset; "
+                             "train: materialize, then train YOLOv5 on the crops")
+    parser.add_argument('--data', help="Dataset data.yaml (its train split is cropped, its val split is kept)")
+    parser.add_argument('--cache-dir', help="Folder of the tile cache")
+    parser.add_argument('--output', help="Folder of the crop dataset")
+    parser.add_argument('--crops-per-image', type=int, help="Crops sampled per image and round")
+    parser.add_argument('--background-share', type=float, help="Share of crops placed away from the boxes")
+    parser.add_argument('--rounds', type=int, help="Independent samplings written for train.py")
+    parser.add_argument('--img-size', type=int, help="Crop side and training input size")
+    parser.add_argument('--epochs', type=int, help="Epochs of crop sampling; train.py runs epochs / rounds")
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--weights', help="Starting weights (default: yolov5s.pt)")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+    parser.add_argument('--project', help="Output project folder")
+    parser.add_argument('--workers', type=int, help="Processes used to build the tile cache")
+
+def run_crops(args):
+    module = load('model_training.crop_sampler')
+    override(module, data_yaml=args.data, cache_directory=args.cache_dir, crop_directory=args.output,
+             crops_per_image=args.crops_per_image, background_share=args.background_share, rounds=args.rounds,
+             img_size=args.img_size, epochs=args.epochs, batch_size=args.batch_size, model=args.weights,
+             yolov5_directory=args.yolov5_dir, project_name=args.project, workers=args.workers)
+    if args.action == 'cache':
+        module.build_cache()
+        return
+    crop_yaml = module.materialize()
+    if args.action == 'train':
+        module.train_on_crops(crop_yaml)
+
+def add_distill_arguments(parser):
+    parser.add_argument('--data', help="Dataset data.yaml")
+    parser.add_argument('--teacher', help="Trained YOLOv5 Large weights")
+    parser.add_argument('--student', help="Student starting weights (default: yolov5n.pt)")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+    parser.add_argument('--output', help="Folder for the teacher cache")
+    parser.add_argument('--distill-weight', type=float, help="Weight of the teacher loss against the ground truth loss")
+    parser.add_argument('--epochs', type=int)
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--img-size', type=int)
+    parser.add_argument('--project', help="Output project folder")
+    parser.add_argument('--build-only', action='store_true', help="Only cache the teacher outputs")
+
+def run_distill(args):
+    module = load('model_training.distill_nano')
+    override(module, data_yaml=args.data, teacher_weights=args.teacher, model=args.student, yolov5_directory=args.yolov5_dir,
+             distill_directory=args.output, distill_weight=args.distill_weight, epochs=args.epochs, batch_size=args.batch_size,
+             img_size=args.img_size, project_name=args.project)
+    cache_path = module.cache_teacher()
+    if args.build_only:
+        return
+    weights = module.train_student(cache_path)
+    if os.path.exists(weights):
+        module.evaluate_student(weights)
+
+def add_prune_arguments(parser):
+    parser.add_argument('weights', help="Trained YOLOv5 checkpoint to prune")
+    parser.add_argument('--data', help="Dataset data.yaml used for fine-tuning and validation")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+    parser.add_argument('--output', help="Folder for the pruned checkpoints and prune_report.json")
+    parser.add_argument('--criterion', choices=['bn', 'l1'], help="Channel ranking: BatchNorm scale or conv L1 norm")
+    parser.add_argument('--target-flops', type=float, help="Stop at this fraction of the original FLOPs")
+    parser.add_argument('--max-ratio', type=float, help="Fraction of channels removed by the last step")
+    parser.add_argument('--steps', type=int, help="Maximum number of pruning steps")
+    parser.add_argument('--finetune-epochs', type=int)
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--img-size', type=int)
+
+def run_prune(args):
+    module = load('model_training.prune_model')
+    override(module, data_yaml=args.data, yolov5_directory=args.yolov5_dir, output_directory=args.output,
+             criterion=args.criterion, target_flops_ratio=args.target_flops, max_pruning_ratio=args.max_ratio,
+             max_steps=args.steps, finetune_epochs=args.finetune_epochs, batch_size=args.batch_size, img_size=args.img_size)
+    module.prune(args.weights)
+
+def add_export_tfjs_arguments(parser):
+    parser.add_argument('weights', help="YOLOv5 checkpoint (pruned or not) to export")
+    parser.add_argument('output', help="Output folder for model.json and group1-shard1of1.bin")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+    parser.add_argument('--img-size', type=int)
+
+def run_export_tfjs(args):
+    module = load('model_training.prune_model')
+    override(module, yolov5_directory=args.yolov5_dir, img_size=args.img_size)
+    module.export_tfjs(args.weights, args.output)
+
+def add_resolution_frontier_arguments(parser):
+    parser.add_argument('--checkpoint', nargs=2, action='append', metavar=('NAME', 'WEIGHTS'), help="Checkpoint to evaluate (repeatable)")
+    parser.add_argument('--sizes', nargs='+', type=int, help="Input sizes to evaluate (default: 320 416 512 640)")
+    parser.add_argument('--data', help="Dataset data.yaml")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+    parser.add_argument('--metric', choices=['recall', 'map50', 'map50_95'], help="Accuracy axis of the frontier")
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--threads', type=int, help="Torch CPU threads for the latency runs")
+    parser.add_argument('--output', help="Folder for frontier.json/.csv/.png")
+
+def run_resolution_frontier(args):
+    module = load('model_training.resolution_frontier')
+    override(module, data_yaml=args.data, yolov5_directory=args.yolov5_dir, frontier_metric=args.metric,
+             batch_size=args.batch_size, threads=args.threads)
+    checkpoints = dict(args.checkpoint) if args.checkpoint else None
+    return 0 if module.run_frontier(checkpoints, args.sizes, args.output) else 1
+
+def add_eval_shards_arguments(parser):
+    parser.add_argument('shards', help="Folder with the tar shards and index.json")
+    parser.add_argument('--weights', help="Trained YOLOv5 weights")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository")
+    parser.add_argument('--img-size', type=int)
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--conf', type=float, default=0.4)
+    parser.add_argument('--iou', type=float, default=0.5, help="IoU a detection needs to count as a true positive")
+
+def run_eval_shards(args):
+    module = load('model_training.shard_dataset')
+    override(module, weights_path=args.weights, yolov5_directory=args.yolov5_dir, img_size=args.img_size, batch_size=args.batch_size)
+    module.evaluate_shards(args.shards, conf_thres=args.conf, iou_thres=args.iou)
+
+def add_test_arguments(parser):
+    parser.add_argument('model', choices=list(TEST_MODULES), help="Which test script to run")
+    parser.add_argument('image', help="Image to run detection on")
+    parser.add_argument('--weights', help="Trained YOLOv5 weights")
+    parser.add_argument('--yolov5-dir', help="Local YOLOv5 repository containing detect.py")
+    parser.add_argument('--img-size', type=int)
+    parser.add_argument('--no-show', action='store_true', help="Do not display the output image")
+
+def run_test(args):
+    module = load(TEST_MODULES[args.model])
+    override(module, image_path=args.image, weights_path=args.weights, img_size=args.img_size)
+    if args.yolov5_dir:
+        override(module, yolov5_directory=args.yolov5_dir, output_folder=os.path.join(args.yolov5_dir, 'runs', 'detect', 'exp'))
+    module.test_yolov5()
+    if args.model == 'small':
+        module.count_black_bunch_objects()
+        module.count_bounding_boxes()
+    if not args.no_show:
+        module.show_output_image()
+
+# ---- benchmark ----
+
+def add_benchmark_arguments(parser):
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="Options passed to benchmark/run_benchmark.py (see --help there)")
+
+def run_benchmark(args):
+    return load('benchmark.run_benchmark').main(args.args)
+
+def add_compare_benchmark_arguments(parser):
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="Options passed to benchmark/compare_benchmark.py")
+
+def run_compare_benchmark(args):
+    return load('benchmark.compare_benchmark').main(args.args)
+
+def add_tfjs_regression_arguments(parser):
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="Options passed to benchmark/tfjs_regression.py (record|check GOLDEN ...)")
+
+def run_tfjs_regression(args):
+    return load('benchmark.tfjs_regression').main(args.args)
+
+# ---- import-time report ----
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( *)(\S+)')
+
+# Function to run `python -X importtime` on some imports and return {module: (cumulative us, nesting depth)}
+def measure_imports(modules):
+    code = f"import sys; sys.path.insert(0, {ROOT!r}); import importlib; [importlib.import_module(m) for m in {list(modules)!r}]"
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1])
+    timings = {}
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            timings[match.group(4)] = (int(match.group(2)), len(match.group(3)) // 2)
+    return timings
+
+# Function to time the whole `python -m bbunch <command> --help` process, the best of a few runs
+def measure_startup(command, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'bbunch', command, '--help'], cwd=ROOT, capture_output=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def add_import_report_arguments(parser):
+    parser.add_argument('commands', nargs='*', help="Subcommands to report on (default: all)")
+    parser.add_argument('--repeat', type=int, default=3, help="Start-up runs per subcommand (the fastest is reported)")
+    parser.add_argument('--top', type=int, default=3, help="Number of heaviest third-party packages to list")
+
+def run_import_report(args):
+    baseline = measure_imports([])
+    names = args.commands or [name for name, _, modules, _, _ in COMMANDS if modules]
+    print(f"{'command':<24}{'--help ms':>10}{'run import ms':>15}  heaviest imports")
+    for name, _, modules, _, _ in COMMANDS:
+        if name not in names:
+            continue
+        startup = measure_startup(name, args.repeat)
+        try:
+            timings = measure_imports(modules)
+        except RuntimeError as e:
+            print(f"{name:<24}{startup * 1e3:>10.0f}{'failed':>15}  {e}")
+            continue
+
+        # Top-level imports the command adds on top of a bare interpreter
+        new_timings = {module: timing for module, timing in timings.items() if module not in baseline}
+        import_us = sum(cumulative for cumulative, depth in new_timings.values() if depth == 0)
+        own_packages = {module.split('.')[0] for module in modules} | {'common'}
+        # Packages imported directly by the command modules, not their own dependencies
+        third_party = sorted(((cumulative, module) for module, (cumulative, depth) in new_timings.items()
+                              if depth <= 1 and '.' not in module and module not in own_packages), reverse=True)
+        heaviest = ', '.join(f"{module} {cumulative / 1e3:.0f}ms" for cumulative, module in third_party[:args.top])
+        print(f"{name:<24}{startup * 1e3:>10.0f}{import_us / 1e3:>15.0f}  {heaviest}")
+    print("\n--help ms: whole process start-up for `python -m bbunch <command> --help`.")
+    print("run import ms: extra import time once the command runs (lazy imports inside functions are not included).")
+
+# Subcommands: (name, help, script modules imported when it runs, add_arguments, run)
+COMMANDS = [
+    ('convert-polygons', "Convert polygon annotations to YOLO boxes and copy the images", ['data_processing_annotation.yolo_format_convert'], add_convert_polygons_arguments, run_convert_polygons),
+    ('split', "Split a YOLO dataset into train and val", ['data_processing_annotation.dataset_split'], add_split_arguments, run_split),
+    ('split-manifest', "Split the images of a pseudo-labeling manifest into train and val", ['data_processing_annotation.dataset_split'], add_split_manifest_arguments, run_split_manifest),
+    ('to-coco', "Build COCO annotation JSON from a YOLO dataset", ['data_processing_annotation.yolo_to_coco'], add_to_coco_arguments, run_to_coco),
+    ('fix-labels', "Change class id 1 to 0 in YOLO label files", ['data_processing_annotation.label_correction'], add_fix_labels_arguments, run_fix_labels),
+    ('json-to-txt', "Convert a labeling-tool JSON file to a polygon txt file", ['data_processing_annotation.json2txt'], add_json_to_txt_arguments, run_json_to_txt),
+    ('to-jpg', "Convert an image to JPEG", ['data_processing_annotation.tojpg'], add_to_jpg_arguments, run_to_jpg),
+    ('ingest', "Convert a folder tree of photos to rotated, downscaled JPEGs in parallel", ['data_processing_annotation.ingest_images'], add_ingest_arguments, run_ingest),
+    ('ingest-video', "Extract sharp, non-duplicate frames at scene changes from walk-through videos", ['data_processing_annotation.video_ingest'], add_ingest_video_arguments, run_ingest_video),
+    ('pack-shards', "Pack images and labels into sequential-read tar shards", ['data_processing_annotation.dataset_shards'], add_pack_shards_arguments, run_pack_shards),
+    ('seg-labels', "Pack polygon labels into a compact label set, or write it back as YOLO-seg or box labels", ['data_processing_annotation.segmentation_labels'], add_seg_labels_arguments, run_seg_labels),
+    ('blur-sort', "Sort images into blurred/ and clear/ by Laplacian variance", ['data_processing_annotation.qua_classifier'], add_blur_sort_arguments, run_blur_sort),
+    ('train-blur-classifier', "Train the blur CNN on sorted images", ['data_processing_annotation.qua_classifier'], add_train_blur_classifier_arguments, run_train_blur_classifier),
+    ('mine', "Move archive images with detections to an output folder", ['active_learning.find_FPsample'], add_mine_arguments, run_mine),
+    ('cascade-mine', "Mining scan with a blur + nano gate before the full detector", ['active_learning.cascade_mining'], add_cascade_mine_arguments, run_cascade_mine),
+    ('distributed-mine', "Mining scan split into work units shared by workers on any number of hosts", ['active_learning.distributed_mining'], add_distributed_mine_arguments, run_distributed_mine),
+    ('worker-pool', "Mining scan on CPU workers sharing one frozen model, with a memory and throughput report", ['active_learning.shared_worker_pool'], add_worker_pool_arguments, run_worker_pool),
+    ('watch', "Process new images in incoming folders continuously: ingest, blur score, detect, pseudo-label", ['active_learning.watch_daemon'], add_watch_arguments, run_watch),
+    ('mine-shards', "Write shard images with detections to an output folder", ['active_learning.find_FPsample'], add_mine_shards_arguments, run_mine_shards),
+    ('pseudo-label', "Write YOLO labels from confident detections, with a needs-review bucket", ['active_learning.pseudo_labeling'], add_pseudo_label_arguments, run_pseudo_label),
+    ('ensemble', "Label images with a fused ensemble of models and test-time augmentation", ['active_learning.ensemble_detector'], add_ensemble_arguments, run_ensemble),
+    ('counts', "Per-image bunch counts with block, date and GPS; per-block and per-week yield reports", ['analytics.count_store'], add_counts_arguments, run_counts),
+    ('errors', "Per-box TP/FP/FN/localization database of a labeled dataset, with queries and crop export", ['analytics.error_analysis'], add_errors_arguments, run_errors),
+    ('train', "Train and evaluate a YOLO model", list(TRAINING_MODULES.values()), add_train_arguments, run_train),
+    ('hyper-search', "Parallel hyperparameter search with ASHA early stopping on val mAP", ['model_training.hyperparameter_search'], add_hyper_search_arguments, run_hyper_search),
+    ('finetune', "Fine-tune the current model on new images plus a replay buffer of old ones", ['model_training.incremental_finetune'], add_finetune_arguments, run_finetune),
+    ('crops', "Train on box-aware crops of the full-resolution images read from a tile cache", ['model_training.crop_sampler'], add_crops_arguments, run_crops),
+    ('distill', "Train the nano model on labels plus soft targets from cached YOLOv5 Large outputs", ['model_training.distill_nano'], add_distill_arguments, run_distill),
+    ('prune', "Prune conv channels step by step with fine-tuning and an accuracy/latency report", ['model_training.prune_model'], add_prune_arguments, run_prune),
+    ('export-tfjs', "Export a YOLOv5 checkpoint to the app's TF.js bundle via ONNX", ['model_training.prune_model'], add_export_tfjs_arguments, run_export_tfjs),
+    ('resolution-frontier', "Accuracy and CPU latency of each checkpoint across input sizes", ['model_training.resolution_frontier'], add_resolution_frontier_arguments, run_resolution_frontier),
+    ('eval-shards', "Precision and recall of a YOLOv5 model on a shard folder", ['model_training.shard_dataset'], add_eval_shards_arguments, run_eval_shards),
+    ('test', "Run a trained YOLOv5 model on one image", list(TEST_MODULES.values()), add_test_arguments, run_test),
+    ('benchmark', "Benchmark the scripts on synthetic data", ['benchmark.run_benchmark'], add_benchmark_arguments, run_benchmark),
+    ('compare-benchmark', "Compare benchmark results against a baseline", ['benchmark.compare_benchmark'], add_compare_benchmark_arguments, run_compare_benchmark),
+    ('tfjs-regression', "Check a TF.js model bundle against golden detections and latency", ['benchmark.tfjs_regression'], add_tfjs_regression_arguments, run_tfjs_regression),
+    ('import-report', "Show start-up and import time of each subcommand", [], add_import_report_arguments, run_import_report),
+]
+
+# Function to build the argument parser with one subparser per command
+def build_parser():
+    parser = argparse.ArgumentParser(prog='bbunch', description="Black Bunch dataset, mining and training tools.")
+    parser.add_argument('--trace', help="Record per-stage timings and write them here at exit (.jsonl, .prom or .json for a Chrome trace)")
+    parser.add_argument('--profile-mode', choices=['cprofile', 'sample'], help="Also run a profiler next to the trace")
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+    for name, help_text, _, add_arguments, run in COMMANDS:
+        subparser = subparsers.add_parser(name, help=help_text, description=help_text)
+        add_arguments(subparser)
+        subparser.set_defaults(run=run)
+    return parser
+
+# Function to run the command line interface, returns the process exit code
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.trace:
+        from common import instrumentation
+        instrumentation.enable(trace_path=args.trace, profile_mode=args.profile_mode, export_at_exit=True)
+    return args.run(args) or 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,73 @@
+# This script compares two benchmark result files produced by run_benchmark.py.
+# A stage counts as a regression when its files/sec drops, or its peak RSS grows, by more than the allowed fraction.
+# The script exits with code 1 when any stage regressed so it can be used as a check before merging changes.
+
+import sys
+import json
+import argparse
+
+# Function to compare the stages of a baseline and a current result file
+def compare_results(baseline, current, max_slowdown=0.10, max_rss_growth=0.20):
+    rows = []
+    regressed = False
+    for name, result in current['stages'].items():
+        base = baseline['stages'].get(name)
+        if base is None or base.get('status') != 'ok' or result.get('status') != 'ok':
+            rows.append({'stage': name, 'status': 'skipped'})
+            continue
+
+        speed_change = result['files_per_sec'] / base['files_per_sec'] - 1.0 if base['files_per_sec'] else 0.0
+        rss_change = result['peak_rss_mb'] / base['peak_rss_mb'] - 1.0 if base['peak_rss_mb'] else 0.0
+        problems = []
+        if speed_change < -max_slowdown:
+            problems.append('slower')
+        if rss_change > max_rss_growth:
+            problems.append('more memory')
+        regressed = regressed or bool(problems)
+
+        rows.append({
+            'stage': name,
+            'status': 'REGRESSION (' + ', '.join(problems) + ')' if problems else 'ok',
+            'baseline_files_per_sec': base['files_per_sec'],
+            'files_per_sec': result['files_per_sec'],
+            'speed_change': speed_change,
+            'baseline_peak_rss_mb': base['peak_rss_mb'],
+            'peak_rss_mb': result['peak_rss_mb'],
+            'rss_change': rss_change,
+        })
+
+    # Results for different dataset sizes are not directly comparable
+    if baseline.get('num_images') != current.get('num_images'):
+        print(f"Warning: baseline has {baseline.get('num_images')} images, current run has {current.get('num_images')}")
+    return rows, regressed
+
+# Function to print the comparison as a table
+def print_comparison(rows):
+    print(f"{'stage':<22}{'files/s (base)':>16}{'files/s':>12}{'change':>9}{'RSS MB (base)':>16}{'RSS MB':>10}{'change':>9}  status")
+    for row in rows:
+        if row['status'] == 'skipped':
+            print(f"{row['stage']:<22}{'':>72}  skipped")
+            continue
+        print(f"{row['stage']:<22}{row['baseline_files_per_sec']:>16.1f}{row['files_per_sec']:>12.1f}{row['speed_change']:>+9.1%}"
+              f"{row['baseline_peak_rss_mb']:>16.0f}{row['peak_rss_mb']:>10.0f}{row['rss_change']:>+9.1%}  {row['status']}")
+
+# Function to run the command line interface, returns the process exit code
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare benchmark results against a baseline.")
+    parser.add_argument('baseline', help="Baseline JSON results")
+    parser.add_argument('current', help="Current JSON results")
+    parser.add_argument('--max-slowdown', type=float, default=0.10)
+    parser.add_argument('--max-rss-growth', type=float, default=0.20)
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, 'r') as f:
+        baseline = json.load(f)
+    with open(args.current, 'r') as f:
+        current = json.load(f)
+
+    rows, regressed = compare_results(baseline, current, args.max_slowdown, args.max_rss_growth)
+    print_comparison(rows)
+    return 1 if regressed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,261 @@
+# This script benchmarks the data-processing and inference scripts on a synthetic dataset.
+# It generates random JPEGs and polygon labels in a temporary folder, then runs each stage
+# (polygon -> YOLO conversion, train/val split, YOLO -> COCO, blur check, batch inference) in a fresh process
+# and records wall time, CPU time, files/sec, MB/sec and peak RSS. Results are saved as JSON and can be
+# compared against a baseline file with regression thresholds (see compare_benchmark.py).
+# Everything runs offline on CPU; inference uses a randomly initialized YOLOv5 nano model built from the local YOLOv5 repo.
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import argparse
+import tempfile
+import contextlib
+import multiprocessing
+
+# Make the python_scripts folders importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.synthetic_dataset import generate_dataset, parse_scale
+from benchmark.compare_benchmark import compare_results, print_comparison
+
+# Path to the local YOLOv5 repository used to build the untrained inference model
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Function to list image paths in a folder
+def list_images(folder):
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+# Function to sum the size of all files in a folder (not recursive)
+def folder_bytes(folder):
+    return sum(entry.stat().st_size for entry in os.scandir(folder) if entry.is_file())
+
+# Stage: convert polygon annotations to YOLO boxes and copy images
+def stage_yolo_format_convert(dataset_dir, work_dir, options):
+    from data_processing_annotation.yolo_format_convert import convert_annotations_and_copy_images
+    output_dir = os.path.join(work_dir, 'yolo')
+    convert_annotations_and_copy_images(input_directory=dataset_dir, output_directory=output_dir, image_directory=dataset_dir)
+    return len(os.listdir(dataset_dir)), folder_bytes(dataset_dir)
+
+# Stage: split the converted dataset into train and val
+def stage_dataset_split(dataset_dir, work_dir, options):
+    from data_processing_annotation.dataset_split import split_dataset
+    random.seed(options['seed'])
+    yolo_dir = os.path.join(work_dir, 'yolo')
+    images_dir = os.path.join(yolo_dir, 'images')
+    split_dataset(images_dir, yolo_dir, os.path.join(work_dir, 'split'))
+    return len(os.listdir(images_dir)), folder_bytes(images_dir)
+
+# Stage: build the COCO annotation JSON for the train split
+def stage_yolo_to_coco(dataset_dir, work_dir, options):
+    from data_processing_annotation.yolo_to_coco import convert_yolo_to_coco
+    images_dir = os.path.join(work_dir, 'split', 'images', 'train')
+    labels_dir = os.path.join(work_dir, 'split', 'labels', 'train')
+    convert_yolo_to_coco(images_dir, labels_dir, os.path.join(work_dir, 'train_annotations.json'))
+    return len(os.listdir(images_dir)), folder_bytes(images_dir)
+
+# Stage: run the Laplacian blur check on every image
+def stage_is_blurry(dataset_dir, work_dir, options):
+    from data_processing_annotation.qua_classifier import is_blurry
+    image_paths = list_images(dataset_dir)
+    for image_path in image_paths:
+        is_blurry(image_path)
+    return len(image_paths), sum(os.path.getsize(p) for p in image_paths)
+
+# Function to build a randomly initialized YOLOv5 nano model (no weights download needed)
+def load_tiny_model(yolov5_directory):
+    import torch
+    torch.manual_seed(0)
+    model = torch.hub.load(yolov5_directory, 'yolov5n', source='local', pretrained=False, classes=1)
+    model.conf = 0.4  # Same thresholds as find_FPsample.py
+    model.iou = 0.45
+    model.max_det = 100
+    model.eval()
+    return model
+
+# Stage: batched YOLOv5 inference with the find_FPsample.py helpers
+def stage_batch_inference(dataset_dir, work_dir, options):
+    import torch
+    from active_learning import find_FPsample
+    if options['threads']:
+        torch.set_num_threads(options['threads'])
+    model = load_tiny_model(options['yolov5_directory'])
+    image_paths = list_images(dataset_dir)[:options['inference_images']]
+    batch_size = options['batch_size']
+    with torch.no_grad():
+        for i in range(0, len(image_paths), batch_size):
+            find_FPsample.batch_inference(image_paths[i:i + batch_size], model=model)
+    return len(image_paths), sum(os.path.getsize(p) for p in image_paths)
+
+# Stages in pipeline order, with the stages whose output they read
+STAGES = {
+    'yolo_format_convert': (stage_yolo_format_convert, []),
+    'dataset_split': (stage_dataset_split, ['yolo_format_convert']),
+    'yolo_to_coco': (stage_yolo_to_coco, ['dataset_split']),
+    'is_blurry': (stage_is_blurry, []),
+    'batch_inference': (stage_batch_inference, []),
+}
+
+# Function to add the stages a selection depends on, keeping pipeline order
+def resolve_stages(selected):
+    needed = set()
+    pending = list(selected)
+    while pending:
+        name = pending.pop()
+        if name not in STAGES:
+            raise ValueError(f"Unknown stage '{name}'. Available stages: {', '.join(STAGES)}")
+        if name not in needed:
+            needed.add(name)
+            pending.extend(STAGES[name][1])
+    return [name for name in STAGES if name in needed]
+
+# Function executed in a fresh process so every stage gets its own peak RSS
+def run_stage_child(name, dataset_dir, work_dir, options, queue):
+    import resource
+    from common import instrumentation
+    try:
+        # Per-stage timers inside the scripts add a little overhead, so they are only switched on when asked for
+        if options.get('breakdown'):
+            instrumentation.enable(memory_interval=0)
+        start_usage = resource.getrusage(resource.RUSAGE_SELF)
+        start = time.perf_counter()
+        # The scripts print one line per file; keep that cost but not the noise
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            files, total_bytes = STAGES[name][0](dataset_dir, work_dir, options)
+        wall = time.perf_counter() - start
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        cpu = (usage.ru_utime - start_usage.ru_utime) + (usage.ru_stime - start_usage.ru_stime)
+        result = {
+            'status': 'ok',
+            'files': files,
+            'bytes': total_bytes,
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'files_per_sec': files / wall if wall > 0 else 0.0,
+            'mb_per_sec': total_bytes / 1e6 / wall if wall > 0 else 0.0,
+            'peak_rss_mb': usage.ru_maxrss / 1024.0,  # ru_maxrss is reported in KB on Linux
+        }
+        if options.get('breakdown'):
+            result['breakdown'] = instrumentation.snapshot()
+        queue.put(result)
+    except Exception as e:
+        queue.put({'status': 'error', 'error': f"{type(e).__name__}: {e}"})
+
+# Function to run one stage in a child process and collect its measurements
+def run_stage(name, dataset_dir, work_dir, options):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=run_stage_child, args=(name, dataset_dir, work_dir, options, queue))
+    process.start()
+    process.join()
+    if not queue.empty():
+        return queue.get()
+    return {'status': 'error', 'error': f"stage process exited with code {process.exitcode}"}
+
+# Function to describe the machine the benchmark ran on
+def machine_info():
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+    }
+
+# Function to run the whole benchmark and return the results dictionary
+def run_benchmark(scale='1k', stages=None, options=None, keep=False, temp_root=None):
+    options = dict(options or {})
+    num_images = parse_scale(scale)
+    stage_names = resolve_stages(stages or list(STAGES))
+
+    temp_dir = tempfile.mkdtemp(prefix='bbunch_bench_', dir=temp_root)
+    dataset_dir = os.path.join(temp_dir, 'raw')
+    work_dir = os.path.join(temp_dir, 'work')
+    os.makedirs(work_dir)
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'scale': scale,
+        'num_images': num_images,
+        'machine': machine_info(),
+        'options': options,
+        'stages': {},
+    }
+    try:
+        print(f"Generating {num_images} synthetic images in {dataset_dir}...")
+        start = time.perf_counter()
+        dataset_bytes = generate_dataset(dataset_dir, num_images, width=options['width'], height=options['height'], seed=options['seed'])
+        results['dataset'] = {'bytes': dataset_bytes, 'generate_seconds': time.perf_counter() - start}
+
+        for name in stage_names:
+            print(f"Running stage: {name}")
+            result = run_stage(name, dataset_dir, work_dir, options)
+            results['stages'][name] = result
+            if result['status'] == 'ok':
+                print(f"  {result['files']} files in {result['wall_seconds']:.2f}s "
+                      f"({result['files_per_sec']:.1f} files/s, {result['mb_per_sec']:.1f} MB/s, peak RSS {result['peak_rss_mb']:.0f} MB)")
+                for step, timing in sorted(result.get('breakdown', {}).get('stages', {}).items(), key=lambda item: -item[1]['total_seconds']):
+                    print(f"    {step:<24}{timing['total_seconds']:>9.3f}s over {timing['calls']} calls")
+            else:
+                print(f"  Failed: {result['error']}")
+    finally:
+        if keep:
+            print(f"Benchmark data kept in {temp_dir}")
+        else:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    return results
+
+# Function to run the command line interface, returns the process exit code
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Black Bunch data-processing and inference scripts on synthetic data.")
+    parser.add_argument('--scale', default='1k', help="Dataset size: 1k, 10k, 100k or a number of images")
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), help="Stages to run (dependencies are added automatically)")
+    parser.add_argument('--output', help="Path of the JSON results file")
+    parser.add_argument('--baseline', help="Baseline JSON results to compare against")
+    parser.add_argument('--max-slowdown', type=float, default=0.10, help="Allowed drop in files/sec before a stage counts as a regression")
+    parser.add_argument('--max-rss-growth', type=float, default=0.20, help="Allowed growth in peak RSS before a stage counts as a regression")
+    parser.add_argument('--width', type=int, default=320, help="Synthetic image width")
+    parser.add_argument('--height', type=int, default=240, help="Synthetic image height")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--yolov5-dir', default=yolov5_directory, help="Local YOLOv5 repository used to build the untrained model")
+    parser.add_argument('--inference-images', type=int, default=512, help="Number of images used for the inference stage")
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--threads', type=int, default=0, help="Torch intra-op threads for inference (0 keeps the default)")
+    parser.add_argument('--temp-dir', help="Parent folder for the temporary dataset")
+    parser.add_argument('--keep', action='store_true', help="Keep the generated dataset and stage outputs")
+    parser.add_argument('--breakdown', action='store_true', help="Record the per-step timers of each script (adds a little overhead)")
+    args = parser.parse_args(argv)
+
+    options = {
+        'width': args.width,
+        'height': args.height,
+        'seed': args.seed,
+        'yolov5_directory': args.yolov5_dir,
+        'inference_images': args.inference_images,
+        'batch_size': args.batch_size,
+        'threads': args.threads,
+        'breakdown': args.breakdown,
+    }
+    results = run_benchmark(args.scale, args.stages, options, keep=args.keep, temp_root=args.temp_dir)
+
+    output_path = args.output or os.path.join('benchmark_results', f"benchmark_{args.scale}_{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"Results saved to {output_path}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        rows, regressed = compare_results(baseline, results, args.max_slowdown, args.max_rss_growth)
+        print_comparison(rows)
+        return 1 if regressed else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,69 @@
+# This script generates a synthetic Black Bunch dataset for benchmarking the data-processing and inference scripts.
+# It writes random JPEG images together with polygon annotation files in the same layout the annotation tool exports,
+# so the output folder can be fed straight into yolo_format_convert.py and the later pipeline stages.
+# Images are smooth random colour fields with a little noise so they compress to realistic sizes without filling the disk.
+
+import os
+import random
+import numpy as np
+from PIL import Image
+
+# Dataset sizes used by the benchmark suite
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000}
+
+# Function to turn a scale name such as '10k' (or a plain number) into an image count
+def parse_scale(scale):
+    if scale in SCALES:
+        return SCALES[scale]
+    return int(scale)
+
+# Function to create one random image as a uint8 array
+def random_image(rng, width, height):
+    # Upsample a tiny random grid to get large smooth regions, then add mild sensor-like noise
+    base = rng.integers(0, 256, size=(max(height // 32, 2), max(width // 32, 2), 3), dtype=np.uint8)
+    image = np.asarray(Image.fromarray(base).resize((width, height), Image.BILINEAR), dtype=np.int16)
+    image += rng.integers(-12, 13, size=image.shape, dtype=np.int16)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+# Function to create random polygon annotations with normalized coordinates
+def random_polygons(rng, max_objects=5):
+    polygons = []
+    for _ in range(int(rng.integers(0, max_objects + 1))):
+        center_x, center_y = rng.uniform(0.15, 0.85, size=2)
+        radius = rng.uniform(0.03, 0.15)
+        num_points = int(rng.integers(6, 13))
+        angles = np.sort(rng.uniform(0, 2 * np.pi, size=num_points))
+        radii = radius * rng.uniform(0.7, 1.0, size=num_points)
+        xs = np.clip(center_x + radii * np.cos(angles), 0.0, 1.0)
+        ys = np.clip(center_y + radii * np.sin(angles), 0.0, 1.0)
+        polygons.append(np.stack([xs, ys], axis=1).ravel())
+    return polygons
+
+# Function to write the synthetic dataset to a folder
+def generate_dataset(output_dir, num_images, width=320, height=240, seed=0, unannotated_ratio=0.1, quality=85):
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    random.seed(seed)
+
+    total_bytes = 0
+    for index in range(num_images):
+        name = f"synthetic_{index:06d}"
+        image_path = os.path.join(output_dir, name + '.jpg')
+        Image.fromarray(random_image(rng, width, height)).save(image_path, 'JPEG', quality=quality)
+        total_bytes += os.path.getsize(image_path)
+
+        # Some images are left without an annotation file, like the background images in the real dataset
+        if rng.random() < unannotated_ratio:
+            continue
+
+        with open(os.path.join(output_dir, name + '.txt'), 'w') as label_file:
+            for polygon in random_polygons(rng):
+                label_file.write("1 " + " ".join(f"{value:.6f}" for value in polygon) + "\n")
+
+    return total_bytes
+
+if __name__ == '__main__':
+    # Example usage
+    output_dir = r"D:\UniDoc\y2s1\SEGP\dataset\synthetic_1k"
+    total_bytes = generate_dataset(output_dir, parse_scale('1k'))
+    print(f"Synthetic dataset written to {output_dir} ({total_bytes / 1e6:.1f} MB of images)")
@@ -0,0 +1,278 @@
+# This script checks a TF.js model bundle (assets/models/model.json + its weight shards) before it is shipped to the app.
+# The app (app/(tabs)/camera.tsx) stretches the photo to 640x640 without keeping the aspect ratio, re-encodes it as JPEG,
+# divides by 255, keeps the predictions with prediction[4] >= confidenceThreshold, sorts them by ascending confidence,
+# turns them into [xStart, xEnd, yStart, yEnd] and greedily drops every box whose IoU with an already kept box is
+# above 0.4. This script repeats those steps exactly (app_preprocess, app_postprocess) and runs the bundle on CPU with
+# TensorFlow, so the detections are the ones a device would show.
+#   record  runs a fixed golden image set through the bundle (or through its source best.pt with --reference, using the
+#           same preprocessing) and stores the detections and latency as expectations (JSON)
+#   check   runs the golden set through a new bundle and compares with the expectations: every expected box must be
+#           found again with IoU >= min_box_iou and a confidence within conf_tolerance, no extra boxes may appear,
+#           and the median latency may not grow by more than max_slowdown. Boxes whose confidence is within
+#           conf_tolerance of the threshold may come or go. The script exits with code 1 on any regression.
+#           A bundle whose output units (pixels or 0-1) differ from the expectations is a regression too: the app
+#           divides the boxes by 640, so it would draw them wrongly.
+#           The latency gate needs expectations recorded from a bundle: a --reference recording times PyTorch, not
+#           TensorFlow, so against those only the detections are checked and the summary says latency was not gated.
+# Requires tensorflow and tfjs-graph-converter (pip install tfjs-graph-converter) to load the graph model.
+
+import os
+import io
+import sys
+import json
+import time
+import hashlib
+import platform
+import argparse
+import numpy as np
+from PIL import Image, ImageOps
+from concurrent.futures import ThreadPoolExecutor
+
+# Make the python_scripts folders importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import yolo_data
+
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+
+# Preprocessing and postprocessing constants of camera.tsx
+APP_INPUT_SIZE = 640
+APP_IOU_THRESHOLD = 0.4
+APP_CONFIDENCE = 0.5  # Default confidenceThreshold of settingsContext.tsx
+
+# Default tolerances of the check
+MIN_BOX_IOU = 0.9
+CONF_TOLERANCE = 0.02
+MAX_SLOWDOWN = 0.15
+
+# Function to preprocess an image the way the app does: stretch to 640x640, JPEG round trip, scale to 0-1
+def app_preprocess(image_path):
+    with Image.open(image_path) as img:
+        img = ImageOps.exif_transpose(img).convert('RGB')  # ImageManipulator works on the upright photo
+        resized = img.resize((APP_INPUT_SIZE, APP_INPUT_SIZE), Image.BILINEAR)
+    # manipulateAsync saves the resized photo as a JPEG (compress: 1) and the app decodes that file again
+    buffer = io.BytesIO()
+    resized.save(buffer, format='JPEG', quality=100)
+    buffer.seek(0)
+    with Image.open(buffer) as decoded:
+        array = np.asarray(decoded.convert('RGB'), dtype=np.float32) / 255.0
+    return array
+
+# Function to compute the IoU of one [x1, x2, y1, y2] box against many, with the formula of camera.tsx computeIoU
+def app_iou(box, boxes):
+    inter_width = np.maximum(0, np.minimum(boxes[:, 1], box[1]) - np.maximum(boxes[:, 0], box[0]))
+    inter_height = np.maximum(0, np.minimum(boxes[:, 3], box[3]) - np.maximum(boxes[:, 2], box[2]))
+    intersection = inter_width * inter_height
+    union = (box[1] - box[0]) * (box[3] - box[2]) + (boxes[:, 1] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 2]) - intersection
+    return np.where(union == 0, 0, intersection / np.where(union == 0, 1, union))
+
+# Function to filter one image's raw predictions (anchors, 5 + classes) the way the app does
+# Returns an (n, 5) array of [xStart, xEnd, yStart, yEnd, confidence] in the order the app keeps them
+def app_postprocess(prediction, conf_thres=APP_CONFIDENCE):
+    confident = prediction[prediction[:, 4] >= conf_thres]
+    # Array.prototype.sort is stable, ascending by confidence as in the app
+    confident = confident[np.argsort(confident[:, 4], kind='stable')]
+    boxes = np.column_stack([confident[:, 0] - confident[:, 2] / 2, confident[:, 0] + confident[:, 2] / 2,
+                             confident[:, 1] - confident[:, 3] / 2, confident[:, 1] + confident[:, 3] / 2,
+                             confident[:, 4]]).astype(np.float32)
+    kept = []
+    for i in range(len(boxes)):
+        if not kept or not (app_iou(boxes[i], boxes[kept]) > APP_IOU_THRESHOLD).any():
+            kept.append(i)
+    return boxes[kept]
+
+# Function to hash the files of a bundle, so expectations record which bundle produced them
+def bundle_hash(model_dir, manifest):
+    digest = hashlib.sha1()
+    for name in ['model.json'] + [path for group in manifest['weightsManifest'] for path in group['paths']]:
+        with open(os.path.join(model_dir, name), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+# Function to load a TF.js graph model on CPU; returns (predict function, batch size the graph accepts or None, hash)
+def load_tfjs_model(model_dir):
+    os.environ['CUDA_VISIBLE_DEVICES'] = '-1'  # The devices run the bundle without a GPU; compare on CPU too
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    with open(os.path.join(model_dir, 'model.json'), 'r') as f:
+        manifest = json.load(f)
+    missing = [path for group in manifest['weightsManifest'] for path in group['paths']
+               if not os.path.exists(os.path.join(model_dir, path))]
+    if missing:
+        raise SystemExit(f"Weight shards missing next to model.json: {', '.join(missing)}")
+    try:
+        import tensorflow as tf
+        import tfjs_graph_converter.api as tfjs_api
+    except ImportError:
+        raise SystemExit("tensorflow and tfjs-graph-converter are needed. Install them with: pip install tfjs-graph-converter")
+
+    signature = manifest['signature']
+    input_spec = next(iter(signature['inputs'].values()))
+    output_spec = next(iter(signature['outputs'].values()))
+    batch = int(input_spec['tensorShape']['dim'][0]['size'])
+    graph = tfjs_api.load_graph_model(model_dir)
+    session = tf.compat.v1.Session(graph=graph)
+    input_tensor = graph.get_tensor_by_name(input_spec['name'])
+    output_tensor = graph.get_tensor_by_name(output_spec['name'])
+
+    def predict(images):
+        return session.run(output_tensor, feed_dict={input_tensor: images})
+    return predict, (batch if batch > 0 else None), bundle_hash(model_dir, manifest)
+
+# Function to load a YOLOv5 checkpoint on CPU as a predict function with the bundle's input layout (NHWC, 0-1)
+def load_reference_model(weights_path, yolov5_directory):
+    from common import detector
+    model = detector.load_raw_model(weights_path, yolov5_directory, device='cpu')
+
+    def predict(images):
+        import torch
+        tensor = torch.from_numpy(np.ascontiguousarray(images)).permute(0, 3, 1, 2)
+        return detector.forward(model, tensor).numpy()
+    return predict, None, None
+
+# Function to run the golden images through a model in batches; returns per-image detections and latencies (ms/image)
+def run_golden(predict, image_paths, batch_size=8, model_batch=None, conf_thres=APP_CONFIDENCE, runs=3, warmup=2):
+    batch_size = min(batch_size, model_batch) if model_batch else batch_size
+    # Decoding runs in threads ahead of the model, so it does not count towards the model latency
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        inputs = list(executor.map(app_preprocess, image_paths))
+    batches = [np.stack(inputs[i:i + batch_size]) for i in range(0, len(inputs), batch_size)]
+    for _ in range(warmup):
+        predict(batches[0])
+
+    detections, latencies, raw_max = [], [], 0.0
+    for run in range(runs):
+        for batch in batches:
+            start = time.perf_counter()
+            output = predict(batch)
+            latencies.append((time.perf_counter() - start) * 1000 / len(batch))
+            if run == 0:
+                raw_max = max(raw_max, float(np.abs(output[..., :2]).max()))
+                detections.extend(app_postprocess(prediction, conf_thres) for prediction in output)
+    # The app divides the boxes by 640, i.e. expects pixels; a bundle that outputs 0-1 coordinates draws them wrongly
+    units = 'normalized' if raw_max <= 2.0 else 'pixels'
+    return detections, np.array(latencies), units
+
+# Function to match the detections of one image against its expected boxes; returns (matched, missing, extra, worst IoU)
+def compare_image(expected, actual, conf_thres, min_box_iou=MIN_BOX_IOU, conf_tolerance=CONF_TOLERANCE):
+    expected = np.array(expected, dtype=np.float32).reshape(-1, 5)
+    actual = np.array(actual, dtype=np.float32).reshape(-1, 5)
+    used = np.zeros(len(actual), dtype=bool)
+    matched, missing, worst_iou = 0, 0, 1.0
+    for box in expected[np.argsort(-expected[:, 4])]:
+        ious = app_iou(box, actual) if len(actual) else np.zeros(0)
+        ious[used] = 0
+        candidates = np.where((ious >= min_box_iou) & (np.abs(actual[:, 4] - box[4]) <= conf_tolerance))[0]
+        if len(candidates):
+            best = candidates[np.argmax(ious[candidates])]
+            used[best] = True
+            matched += 1
+            worst_iou = min(worst_iou, float(ious[best]))
+        elif box[4] - conf_thres > conf_tolerance:
+            missing += 1
+    # Boxes near the threshold may appear or disappear with tiny numeric differences
+    extra = int(((actual[:, 4] - conf_thres > conf_tolerance) & ~used).sum())
+    return matched, missing, extra, worst_iou
+
+# Function to describe the machine, since latencies are only comparable on the same one
+def machine_info():
+    return {'platform': platform.platform(), 'processor': platform.processor() or platform.machine(), 'cpus': os.cpu_count()}
+
+# Function to record the expectations of the golden set
+def record(args, image_paths):
+    if args.reference:
+        predict, model_batch, model_hash = load_reference_model(args.reference, args.yolov5_dir)
+    else:
+        predict, model_batch, model_hash = load_tfjs_model(args.model_dir)
+    detections, latencies, units = run_golden(predict, image_paths, args.batch_size, model_batch, args.conf, args.runs)
+    expectations = {
+        'source': args.reference or args.model_dir, 'bundle_hash': model_hash, 'conf': args.conf, 'units': units,
+        'batch_size': min(args.batch_size, model_batch) if model_batch else args.batch_size, 'machine': machine_info(),
+        'latency_ms': {'median': float(np.median(latencies)), 'p90': float(np.percentile(latencies, 90))},
+        'images': {os.path.basename(path): boxes.round(4).tolist() for path, boxes in zip(image_paths, detections)},
+    }
+    with open(args.expectations, 'w') as f:
+        json.dump(expectations, f, indent=1)
+    print(f"Recorded {sum(len(d) for d in detections)} boxes on {len(image_paths)} images, "
+          f"{expectations['latency_ms']['median']:.1f} ms/image (median) -> {args.expectations}")
+    return 0
+
+# Function to check a bundle against the expectations, returns the process exit code
+def check(args, image_paths):
+    if not os.path.exists(args.expectations):
+        print(f"No expectations at {args.expectations}; create them with: record {args.golden} --expectations {args.expectations}")
+        return 1
+    with open(args.expectations, 'r') as f:
+        expectations = json.load(f)
+    predict, model_batch, model_hash = load_tfjs_model(args.model_dir)
+    detections, latencies, units = run_golden(predict, image_paths, expectations['batch_size'], model_batch, expectations['conf'], args.runs)
+    regressed = units != expectations['units']
+    if regressed:
+        # The app would draw these boxes wrongly; rescale only so the per-image table still shows what else changed
+        scale = 1 / APP_INPUT_SIZE if expectations['units'] == 'pixels' else APP_INPUT_SIZE
+        print(f"REGRESSION: the bundle outputs {units} coordinates, the expectations use {expectations['units']}")
+        detections = [np.column_stack([boxes[:, :4] / scale, boxes[:, 4:]]) for boxes in detections]
+
+    outputs_regressed = False
+    print(f"{'image':<32}{'expected':>9}{'found':>7}{'missing':>9}{'extra':>7}{'worst IoU':>11}  status")
+    for path, boxes in zip(image_paths, detections):
+        name = os.path.basename(path)
+        if name not in expectations['images']:
+            print(f"{name:<32}  not in the expectations, skipped")
+            continue
+        expected = expectations['images'][name]
+        matched, missing, extra, worst_iou = compare_image(expected, boxes, expectations['conf'], args.min_box_iou, args.conf_tolerance)
+        problem = bool(missing or extra)
+        outputs_regressed = outputs_regressed or problem
+        print(f"{name:<32}{len(expected):>9}{matched:>7}{missing:>9}{extra:>7}{worst_iou:>11.3f}  {'REGRESSION' if problem else 'ok'}")
+
+    regressed = regressed or outputs_regressed
+
+    median_ms = float(np.median(latencies))
+    if expectations.get('bundle_hash') is None:
+        # Recorded with --reference: the baseline is PyTorch's latency, which says nothing about the TF.js graph
+        latency_status = 'NOT GATED'
+        print(f"Latency: {median_ms:.1f} ms/image (median, p90 {np.percentile(latencies, 90):.1f}), NOT GATED: the expectations "
+              f"were recorded from {expectations['source']}, record them from a bundle to gate latency")
+    else:
+        baseline_ms = expectations['latency_ms']['median']
+        slowdown = median_ms / baseline_ms - 1.0 if baseline_ms else 0.0
+        slow = slowdown > args.max_slowdown
+        regressed = regressed or slow
+        latency_status = 'REGRESSION' if slow else 'ok'
+        if expectations['machine'] != machine_info():
+            print("Warning: the expectations were recorded on another machine, latencies are not directly comparable")
+        if model_hash == expectations['bundle_hash']:
+            print("Note: this is the same bundle the expectations were recorded with")
+        print(f"Latency: {median_ms:.1f} ms/image (median, p90 {np.percentile(latencies, 90):.1f}) against {baseline_ms:.1f} "
+              f"({slowdown:+.1%}) {latency_status}")
+    print(f"Result: {'FAIL' if regressed else 'PASS'} (units {'ok' if units == expectations['units'] else 'REGRESSION'}, "
+          f"detections {'REGRESSION' if outputs_regressed else 'ok'}, latency {latency_status})")
+    return 1 if regressed else 0
+
+# Function to run the command line interface, returns the process exit code
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Golden-output regression check for the app's TF.js model bundle.")
+    parser.add_argument('action', choices=['record', 'check'])
+    parser.add_argument('golden', help="Folder of golden images")
+    parser.add_argument('--model-dir', default=os.path.join('assets', 'models'), help="Folder of model.json and its weight shards")
+    parser.add_argument('--expectations', default='tfjs_golden.json', help="Expectations JSON to write (record) or read (check)")
+    parser.add_argument('--reference', help="Record the expectations from this YOLOv5 best.pt instead of a bundle")
+    parser.add_argument('--yolov5-dir', default=yolov5_directory, help="Local YOLOv5 repository (with --reference)")
+    parser.add_argument('--conf', type=float, default=APP_CONFIDENCE, help="The app's confidenceThreshold (record)")
+    parser.add_argument('--batch-size', type=int, default=8, help="Images per model call (record; limited by the graph's input)")
+    parser.add_argument('--runs', type=int, default=3, help="Timed passes over the golden set")
+    parser.add_argument('--min-box-iou', type=float, default=MIN_BOX_IOU)
+    parser.add_argument('--conf-tolerance', type=float, default=CONF_TOLERANCE)
+    parser.add_argument('--max-slowdown', type=float, default=MAX_SLOWDOWN)
+    args = parser.parse_args(argv)
+
+    image_paths = yolo_data.list_images(args.golden)
+    if not image_paths:
+        print(f"No images in {args.golden}")
+        return 1
+    if args.action == 'record':
+        return record(args, image_paths)
+    return check(args, image_paths)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+# Batched YOLOv5 detector working on tensors instead of the AutoShape wrapper used by find_FPsample.py.
+# Images are decoded and letterboxed once into a single batch tensor, so several models or test-time
+# augmentations can run on the same preprocessed input. NMS uses torchvision and boxes are mapped back to
+# the pixel coordinates of the original images.
+# With rect=True, images are grouped by aspect ratio and each group runs at the smallest stride-aligned rectangle that
+# holds its images letterboxed to img_size (e.g. 640x480 for 4:3 photos), which saves the compute spent on padding.
+#
+# Detections are returned per image as float32 arrays of shape (n, 6): x1, y1, x2, y2, confidence, class.
+
+import os
+import math
+import numpy as np
+from PIL import Image
+
+from common import instrumentation
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+PAD_VALUE = 114  # Same grey padding as YOLOv5's letterbox
+
+# Function to pick the GPU if available
+def get_device():
+    import torch
+    return 'cuda' if torch.cuda.is_available() else 'cpu'
+
+# Function to pick the GPU if available, in the form the --device option of YOLOv5's train.py/val.py/detect.py takes
+def cli_device():
+    return '0' if get_device() == 'cuda' else 'cpu'
+
+# Function to load a YOLOv5 checkpoint without the AutoShape wrapper, so it accepts batch tensors
+def load_raw_model(weights_path, yolov5_directory, device=None):
+    import torch
+    device = device or get_device()
+    model = torch.hub.load(yolov5_directory, 'custom', path=weights_path, source='local', autoshape=False)
+    model = model.to(device).eval()
+    return model
+
+# Function to load a YOLOv8 checkpoint (yolov8s_training.py) as a plain module that accepts batch tensors
+def load_yolov8_model(weights_path, device=None):
+    from ultralytics import YOLO
+    device = device or get_device()
+    return YOLO(weights_path).model.to(device).float().eval()
+
+# Function to read the largest stride of a model (input sides must be a multiple of it)
+def model_stride(model):
+    stride = getattr(model, 'stride', 32)
+    try:
+        return int(max(stride))
+    except TypeError:
+        return int(stride)
+
+# Function to decode an image file into an RGB array
+def decode_image(image):
+    if isinstance(image, np.ndarray):
+        return image
+    with instrumentation.stage('decode'):
+        if isinstance(image, Image.Image):
+            return np.asarray(image.convert('RGB'))
+        with Image.open(image) as img:
+            return np.asarray(img.convert('RGB'))
+
+# Function to resize an image to fit inside (height, width) keeping its aspect ratio, then pad it
+def letterbox(image, new_shape):
+    height, width = image.shape[:2]
+    ratio = min(new_shape[0] / height, new_shape[1] / width)
+    resized_width, resized_height = int(round(width * ratio)), int(round(height * ratio))
+    with instrumentation.stage('resize'):
+        if (resized_width, resized_height) != (width, height):
+            image = np.asarray(Image.fromarray(image).resize((resized_width, resized_height), Image.BILINEAR))
+        canvas = np.full((new_shape[0], new_shape[1], 3), PAD_VALUE, dtype=np.uint8)
+        pad_x = (new_shape[1] - resized_width) // 2
+        pad_y = (new_shape[0] - resized_height) // 2
+        canvas[pad_y:pad_y + resized_height, pad_x:pad_x + resized_width] = image
+    return canvas, ratio, (pad_x, pad_y)
+
+# Function to read the (height, width) of an image without decoding its pixels
+def image_shape(image):
+    if isinstance(image, np.ndarray):
+        return image.shape[:2]
+    if isinstance(image, Image.Image):
+        return image.size[::-1]
+    with Image.open(image) as img:
+        size = img.size
+    if hasattr(image, 'seek'):
+        image.seek(0)  # File objects are decoded again later
+    return size[::-1]
+
+# Function to find the smallest stride-aligned (height, width) that holds an image letterboxed to img_size
+def rect_shape(shape, img_size=640, stride=32):
+    height, width = shape
+    ratio = img_size / max(height, width)
+    return (min(img_size, math.ceil(height * ratio / stride) * stride), min(img_size, math.ceil(width * ratio / stride) * stride))
+
+# Function to group images by their rectangular input shape into batches of at most batch_size
+# Returns (indices, shape) pairs covering every image once
+def bucket_batches(images, img_size=640, batch_size=16, stride=32):
+    buckets = {}
+    for i, image in enumerate(images):
+        buckets.setdefault(rect_shape(image_shape(image), img_size, stride), []).append(i)
+    return [(indices[start:start + batch_size], shape)
+            for shape, indices in buckets.items() for start in range(0, len(indices), batch_size)]
+
+# Function to order images so that images with the same rectangular input shape are next to each other
+# Callers that cut a long list into batches use it first, so rect=True batches stay full
+def bucket_order(images, img_size=640, stride=32):
+    shapes = [rect_shape(image_shape(image), img_size, stride) for image in images]
+    return sorted(range(len(images)), key=lambda i: shapes[i])
+
+# Function to decode and letterbox a list of images into one uint8 batch of shape (n, height, width, 3)
+def preprocess_batch(images, img_size=640, shape=None):
+    shape = shape or (img_size, img_size)
+    batch = np.empty((len(images), shape[0], shape[1], 3), dtype=np.uint8)
+    meta = []
+    for i, image in enumerate(images):
+        array = decode_image(image)
+        batch[i], ratio, pad = letterbox(array, shape)
+        meta.append({'shape': array.shape[:2], 'ratio': ratio, 'pad': pad})
+    return batch, meta
+
+# Function to turn a uint8 batch into the normalized float tensor the models expect
+def to_tensor(batch, device='cpu', half=False):
+    import torch
+    tensor = torch.from_numpy(batch).to(device).permute(0, 3, 1, 2).contiguous()
+    tensor = tensor.half() if half else tensor.float()
+    return tensor / 255.0
+
+# Function to run the model and return the raw predictions (n, anchors, 5 + classes)
+def forward(model, tensor):
+    import torch
+    with torch.no_grad(), instrumentation.stage('model_forward'):
+        output = model(tensor)
+    # Depending on the YOLOv5 version the eval output is the tensor itself or (predictions, feature maps)
+    predictions = output[0] if isinstance(output, (list, tuple)) else output
+    if predictions.shape[1] < predictions.shape[2]:
+        # YOLOv8 layout (n, 4 + classes, anchors) without objectness: convert to the YOLOv5 layout
+        predictions = predictions.transpose(1, 2)
+        predictions = torch.cat([predictions[..., :4], torch.ones_like(predictions[..., :1]), predictions[..., 4:]], -1)
+    return predictions
+
+# Function to apply confidence filtering and class-aware NMS to raw predictions
+def non_max_suppression(predictions, conf_thres=0.4, iou_thres=0.45, max_det=100):
+    import torch
+    import torchvision
+    results = []
+    with instrumentation.stage('nms'):
+        for prediction in predictions:
+            # Score = objectness * class probability, as in YOLOv5
+            scores, classes = (prediction[:, 5:] * prediction[:, 4:5]).max(1)
+            keep = scores > conf_thres
+            xywh, scores, classes = prediction[keep, :4], scores[keep], classes[keep]
+            boxes = torch.cat([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], 1)
+            keep = torchvision.ops.batched_nms(boxes, scores, classes, iou_thres)[:max_det]
+            results.append(torch.cat([boxes[keep], scores[keep, None], classes[keep, None].float()], 1))
+    return results
+
+# Function to map boxes from letterboxed input coordinates back to the original image
+def scale_boxes(boxes, meta):
+    boxes = boxes.copy()
+    pad_x, pad_y = meta['pad']
+    boxes[:, [0, 2]] = (boxes[:, [0, 2]] - pad_x) / meta['ratio']
+    boxes[:, [1, 3]] = (boxes[:, [1, 3]] - pad_y) / meta['ratio']
+    height, width = meta['shape']
+    boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+    boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+    return boxes
+
+# Function to find the device a model's weights live on
+def model_device(model):
+    return next(model.parameters()).device
+
+# Function to run detection on a list of images (paths, PIL images or RGB arrays)
+# Returns the detections of each image and the (height, width) of each original image
+# rect=True runs each aspect-ratio group at its own rectangular shape instead of one img_size square
+def detect_batch(model, images, img_size=640, conf_thres=0.4, iou_thres=0.45, max_det=100, rect=False):
+    if rect:
+        batches = bucket_batches(images, img_size, len(images), model_stride(model))
+    else:
+        batches = [(list(range(len(images))), None)]
+    results, shapes = [None] * len(images), [None] * len(images)
+    for indices, shape in batches:
+        batch, meta = preprocess_batch([images[i] for i in indices], img_size, shape)
+        instrumentation.count('input_pixels', batch.shape[0] * batch.shape[1] * batch.shape[2])
+        predictions = forward(model, to_tensor(batch, model_device(model)))
+        detections = non_max_suppression(predictions, conf_thres, iou_thres, max_det)
+        for i, d, m in zip(indices, detections, meta):
+            results[i], shapes[i] = scale_boxes(d.cpu().numpy(), m), m['shape']
+    instrumentation.count('images_detected', len(images))
+    return results, shapes
+
+# Function to list the images of a folder, sorted so batches are reproducible
+def list_images(folder):
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+# Function to convert pixel xyxy detections to YOLO label lines: class cx cy w h [conf]
+def to_yolo_lines(detections, image_shape, with_conf=True):
+    height, width = image_shape
+    lines = []
+    for x1, y1, x2, y2, conf, cls in detections:
+        line = f"{int(cls)} {(x1 + x2) / 2 / width:.6f} {(y1 + y2) / 2 / height:.6f} {(x2 - x1) / width:.6f} {(y2 - y1) / height:.6f}"
+        lines.append(line + (f" {conf:.4f}" if with_conf else ''))
+    return lines
@@ -0,0 +1,349 @@
+# Lightweight instrumentation shared by the python_scripts tools.
+# Scripts wrap their steps in stage timers (decode, resize, model forward, NMS, file moves, ...) and bump counters;
+# the results can be exported as a JSONL event trace, a Prometheus text file or a Chrome trace (chrome://tracing, Perfetto).
+#
+# Instrumentation is off unless switched on, and then stage() hands back a shared no-op object so the cost is one call.
+# Environment variables:
+#   BBUNCH_PROFILE=1                 enable timers, counters and memory sampling
+#   BBUNCH_TRACE=path                where to export at exit (default bbunch_trace.jsonl, '{pid}' is replaced by the process id)
+#   BBUNCH_TRACE_FORMAT=fmt          jsonl, prometheus or chrome (default: guessed from the file extension)
+#   BBUNCH_PROFILE_MODE=mode         also run 'cprofile' (writes <trace>.prof) or the stack 'sample'r (writes <trace>.folded)
+#   BBUNCH_MEMORY_INTERVAL=seconds   RSS sampling interval, 0 to turn memory sampling off (default 0.5)
+#
+# Example:
+#   from common import instrumentation
+#   with instrumentation.stage('decode'):
+#       img = Image.open(path).convert('RGB')
+#   instrumentation.count('images')
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from collections import defaultdict
+
+ENV_ENABLE = 'BBUNCH_PROFILE'
+ENV_TRACE = 'BBUNCH_TRACE'
+ENV_FORMAT = 'BBUNCH_TRACE_FORMAT'
+ENV_MODE = 'BBUNCH_PROFILE_MODE'
+ENV_MEMORY_INTERVAL = 'BBUNCH_MEMORY_INTERVAL'
+
+MAX_EVENTS = 1000000  # Individual stage events kept for the traces; totals are always kept
+
+# Module state
+_enabled = False
+_lock = threading.Lock()
+_stage_totals = defaultdict(lambda: [0, 0.0, 0.0])  # name -> [calls, total seconds, max seconds]
+_counters = defaultdict(float)
+_gauges = {}
+_events = []  # (name, start seconds since epoch, duration seconds, thread id)
+_memory_samples = []  # (time seconds since epoch, rss bytes)
+_dropped_events = 0
+_trace_path = None
+_trace_format = None
+_profile_mode = None
+_profiler = None
+_sampler = None  # (thread, stacks) while the sampling profiler runs
+_sampled_stacks = None  # Stacks of the last sampling run, kept after disable() for export
+_memory_thread = None
+_stop = threading.Event()
+
+# Timer object returned by stage() when instrumentation is enabled
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        _record(self.name, duration, time.time() - duration)
+        return False
+
+# Shared do-nothing timer returned by stage() when instrumentation is disabled
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+# Function to store one finished stage
+def _record(name, duration, start):
+    global _dropped_events
+    with _lock:
+        totals = _stage_totals[name]
+        totals[0] += 1
+        totals[1] += duration
+        if duration > totals[2]:
+            totals[2] = duration
+        if len(_events) < MAX_EVENTS:
+            _events.append((name, start, duration, threading.get_ident()))
+        else:
+            _dropped_events += 1
+
+# Function to time a block of code: `with stage('decode'): ...`
+def stage(name):
+    if not _enabled:
+        return _NULL_STAGE
+    return _Stage(name)
+
+# Function to time every call of a function, used as a decorator: @timed('move_file')
+def timed(name):
+    def decorator(function):
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Stage(name):
+                return function(*args, **kwargs)
+        wrapper.__name__ = function.__name__
+        wrapper.__wrapped__ = function
+        return wrapper
+    return decorator
+
+# Function to add a duration that was measured elsewhere (e.g. timings reported by the YOLOv5 results object)
+def record(name, seconds, calls=1):
+    if not _enabled:
+        return
+    with _lock:
+        totals = _stage_totals[name]
+        totals[0] += calls
+        totals[1] += seconds
+        if seconds / max(calls, 1) > totals[2]:
+            totals[2] = seconds / max(calls, 1)
+
+# Function to increase a counter (files processed, detections found, bytes written, ...)
+def count(name, value=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] += value
+
+# Function to set a gauge to its latest value
+def gauge(name, value):
+    if not _enabled:
+        return
+    with _lock:
+        _gauges[name] = value
+
+# Function to tell whether instrumentation is switched on
+def is_enabled():
+    return _enabled
+
+# Function to read the current resident set size in bytes
+def current_rss():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Not the current value, but the best that is available outside Linux
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except ImportError:
+        return 0
+
+# Function run by the background thread that samples memory usage
+def _sample_memory(interval):
+    while not _stop.wait(interval):
+        rss = current_rss()
+        with _lock:
+            _memory_samples.append((time.time(), rss))
+            if rss > _gauges.get('peak_rss_bytes', 0):
+                _gauges['peak_rss_bytes'] = rss
+
+# Function run by the background thread of the stack sampling profiler (py-spy style folded stacks)
+def _sample_stacks(target_thread, interval, stacks):
+    while not _stop.wait(interval):
+        frame = sys._current_frames().get(target_thread)
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+            frame = frame.f_back
+        if names:
+            key = ';'.join(reversed(names))
+            stacks[key] = stacks.get(key, 0) + 1
+
+# Function to switch instrumentation on
+def enable(trace_path=None, trace_format=None, profile_mode=None, memory_interval=0.5, export_at_exit=False):
+    global _enabled, _trace_path, _trace_format, _profile_mode, _profiler, _sampler, _memory_thread
+    if _enabled:
+        return
+    _enabled = True
+    _stop.clear()
+    _trace_path = trace_path
+    _trace_format = trace_format
+    _profile_mode = profile_mode
+
+    if memory_interval and memory_interval > 0:
+        _memory_thread = threading.Thread(target=_sample_memory, args=(memory_interval,), daemon=True)
+        _memory_thread.start()
+
+    if profile_mode == 'cprofile':
+        import cProfile
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    elif profile_mode == 'sample':
+        stacks = {}
+        thread = threading.Thread(target=_sample_stacks, args=(threading.get_ident(), 0.005, stacks), daemon=True)
+        thread.start()
+        _sampler = (thread, stacks)
+
+    if export_at_exit:
+        atexit.register(_export_at_exit)
+
+# Function to switch instrumentation off and stop the background threads
+def disable():
+    global _enabled, _sampler, _sampled_stacks, _memory_thread
+    _enabled = False
+    _stop.set()
+    if _memory_thread is not None:
+        _memory_thread.join()
+        _memory_thread = None
+    if _sampler is not None:
+        _sampler[0].join()
+        _sampled_stacks = _sampler[1]
+        _sampler = None
+    if _profiler is not None:
+        _profiler.disable()
+
+# Function to clear everything recorded so far
+def reset():
+    global _dropped_events, _sampled_stacks
+    _sampled_stacks = None
+    with _lock:
+        _stage_totals.clear()
+        _counters.clear()
+        _gauges.clear()
+        del _events[:]
+        del _memory_samples[:]
+        _dropped_events = 0
+
+# Function to return the recorded totals as a plain dictionary
+def snapshot():
+    with _lock:
+        stages = {name: {'calls': calls, 'total_seconds': total, 'mean_seconds': total / calls if calls else 0.0, 'max_seconds': longest}
+                  for name, (calls, total, longest) in _stage_totals.items()}
+        gauges = dict(_gauges)
+        gauges.setdefault('peak_rss_bytes', current_rss())
+        return {'pid': os.getpid(), 'stages': stages, 'counters': dict(_counters), 'gauges': gauges, 'dropped_events': _dropped_events}
+
+# Function to print a per-stage summary table, slowest stage first
+def print_summary():
+    data = snapshot()
+    total = sum(s['total_seconds'] for s in data['stages'].values()) or 1.0
+    print(f"{'stage':<28}{'calls':>10}{'total s':>12}{'mean ms':>12}{'max ms':>12}{'share':>8}")
+    for name, s in sorted(data['stages'].items(), key=lambda item: -item[1]['total_seconds']):
+        print(f"{name:<28}{s['calls']:>10}{s['total_seconds']:>12.3f}{s['mean_seconds'] * 1e3:>12.2f}{s['max_seconds'] * 1e3:>12.2f}{s['total_seconds'] / total:>8.1%}")
+    for name, value in sorted(data['counters'].items()):
+        print(f"{name:<28}{value:>10g}")
+    print(f"peak RSS: {data['gauges']['peak_rss_bytes'] / 1e6:.0f} MB")
+
+# Function to write the trace as JSON lines: one event per line, then the counters and totals
+def export_jsonl(path):
+    data = snapshot()
+    with _lock:
+        events = list(_events)
+        memory = list(_memory_samples)
+    with open(path, 'w') as f:
+        for name, start, duration, thread_id in events:
+            f.write(json.dumps({'type': 'stage', 'name': name, 'start': start, 'seconds': duration, 'pid': data['pid'], 'tid': thread_id}) + '\n')
+        for sample_time, rss in memory:
+            f.write(json.dumps({'type': 'memory', 'time': sample_time, 'rss_bytes': rss, 'pid': data['pid']}) + '\n')
+        f.write(json.dumps(dict(data, type='summary')) + '\n')
+
+# Function to write the totals in the Prometheus text exposition format (for the node_exporter textfile collector)
+def export_prometheus(path):
+    data = snapshot()
+    lines = [
+        '# HELP bbunch_stage_seconds_total Time spent in each stage.',
+        '# TYPE bbunch_stage_seconds_total counter',
+    ]
+    lines += [f'bbunch_stage_seconds_total{{stage="{name}"}} {s["total_seconds"]:.6f}' for name, s in sorted(data['stages'].items())]
+    lines += ['# HELP bbunch_stage_calls_total Number of times each stage ran.', '# TYPE bbunch_stage_calls_total counter']
+    lines += [f'bbunch_stage_calls_total{{stage="{name}"}} {s["calls"]}' for name, s in sorted(data['stages'].items())]
+    lines += ['# HELP bbunch_stage_max_seconds Longest single run of each stage.', '# TYPE bbunch_stage_max_seconds gauge']
+    lines += [f'bbunch_stage_max_seconds{{stage="{name}"}} {s["max_seconds"]:.6f}' for name, s in sorted(data['stages'].items())]
+    lines += ['# HELP bbunch_events_total Counters reported by the scripts.', '# TYPE bbunch_events_total counter']
+    lines += [f'bbunch_events_total{{name="{name}"}} {value:g}' for name, value in sorted(data['counters'].items())]
+    lines += ['# HELP bbunch_gauge Gauges reported by the scripts.', '# TYPE bbunch_gauge gauge']
+    lines += [f'bbunch_gauge{{name="{name}"}} {value:g}' for name, value in sorted(data['gauges'].items())]
+
+    # Write to a temporary file first so the collector never reads a half-written file
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(temp_path, path)
+
+# Function to write a Chrome trace (open in chrome://tracing or https://ui.perfetto.dev)
+def export_chrome_trace(path):
+    pid = os.getpid()
+    with _lock:
+        events = list(_events)
+        memory = list(_memory_samples)
+    trace_events = [{'name': name, 'cat': 'stage', 'ph': 'X', 'ts': start * 1e6, 'dur': duration * 1e6, 'pid': pid, 'tid': thread_id}
+                    for name, start, duration, thread_id in events]
+    trace_events += [{'name': 'memory', 'ph': 'C', 'ts': sample_time * 1e6, 'pid': pid, 'args': {'rss_mb': rss / 1e6}}
+                     for sample_time, rss in memory]
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms', 'otherData': snapshot()}, f)
+
+EXPORTERS = {
+    'jsonl': export_jsonl,
+    'prometheus': export_prometheus,
+    'chrome': export_chrome_trace,
+}
+
+# Function to export in the given format, guessing it from the extension when not given
+def export(path, trace_format=None):
+    if trace_format is None:
+        if path.endswith('.prom'):
+            trace_format = 'prometheus'
+        elif path.endswith('.json'):
+            trace_format = 'chrome'
+        else:
+            trace_format = 'jsonl'
+    EXPORTERS[trace_format](path)
+
+    # Sampling profiler output goes next to the trace
+    if _profiler is not None:
+        _profiler.dump_stats(path + '.prof')
+    # Copy the stacks first: while sampling is still on, the sampler thread keeps adding to them
+    stacks = dict(_sampler[1]) if _sampler is not None else _sampled_stacks
+    if stacks is not None:
+        with open(path + '.folded', 'w') as f:
+            for stack, samples in sorted(stacks.items()):
+                f.write(f"{stack} {samples}\n")
+
+# Function registered with atexit when instrumentation was switched on from the environment
+def _export_at_exit():
+    if not _stage_totals and not _counters and _profiler is None and _sampler is None and _sampled_stacks is None:
+        return
+    path = (_trace_path or 'bbunch_trace.jsonl').replace('{pid}', str(os.getpid()))
+    disable()
+    try:
+        export(path, _trace_format)
+        print(f"Instrumentation trace written to {path}", file=sys.stderr)
+    except OSError as e:
+        print(f"Could not write instrumentation trace {path}: {e}", file=sys.stderr)
+
+# Switch on from the environment when the module is first imported
+if os.environ.get(ENV_ENABLE, '').lower() not in ('', '0', 'false', 'no'):
+    enable(trace_path=os.environ.get(ENV_TRACE),
+           trace_format=os.environ.get(ENV_FORMAT) or None,
+           profile_mode=os.environ.get(ENV_MODE) or None,
+           memory_interval=float(os.environ.get(ENV_MEMORY_INTERVAL, '0.5')),
+           export_at_exit=True)
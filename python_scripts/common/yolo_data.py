@@ -0,0 +1,77 @@
+# Helpers for YOLO datasets described by a data.yaml (as written for train.py / val.py).
+# YOLOv5 finds the label file of an image by replacing the last /images/ folder in its path with /labels/ and the
+# extension with .txt; the helpers below follow the same rule so they work on any dataset the training scripts use.
+
+import os
+import numpy as np
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Function to read a data.yaml file
+def load_data_yaml(data_yaml):
+    import yaml
+    with open(data_yaml, 'r') as f:
+        return yaml.safe_load(f)
+
+# Function to write a data.yaml file
+def write_data_yaml(path, data):
+    import yaml
+    with open(path, 'w') as f:
+        yaml.safe_dump(data, f, sort_keys=False)
+
+# Function to find the image folder of a split ('train' or 'val'), relative paths resolved like YOLOv5 does
+def split_images_dir(data, split, data_yaml=None):
+    folder = data[split]
+    if isinstance(folder, list):
+        folder = folder[0]
+    root = data.get('path') or (os.path.dirname(os.path.abspath(data_yaml)) if data_yaml else '')
+    return folder if os.path.isabs(folder) else os.path.normpath(os.path.join(root, folder))
+
+# Function to find the label file of an image
+def label_path_for(image_path):
+    images_folder = os.sep + 'images' + os.sep
+    if images_folder not in image_path:
+        return os.path.splitext(image_path)[0] + '.txt'
+    head, tail = image_path.rsplit(images_folder, 1)
+    return os.path.join(head, 'labels', os.path.splitext(tail)[0] + '.txt')
+
+# Function to list the images of a folder (not recursive), sorted
+def list_images(folder):
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+# Function to read a YOLO label file into an (n, 5) float32 array: class, cx, cy, w, h (normalized)
+def read_labels(label_path):
+    if not os.path.exists(label_path):
+        return np.zeros((0, 5), dtype=np.float32)
+    with open(label_path, 'r') as f:
+        rows = [line.split()[:5] for line in f if len(line.split()) >= 5]
+    return np.array(rows, dtype=np.float32).reshape(-1, 5)
+
+# Function to write an (n, 5) label array as a YOLO label file
+def write_labels(label_path, labels):
+    with open(label_path, 'w') as f:
+        f.write(''.join(f"{int(c)} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n" for c, x, y, w, h in labels))
+
+# Function to convert normalized cx, cy, w, h boxes to x1, y1, x2, y2 (same units)
+def xywh_to_xyxy(boxes):
+    boxes = np.asarray(boxes, dtype=np.float32)
+    return np.concatenate([boxes[:, :2] - boxes[:, 2:4] / 2, boxes[:, :2] + boxes[:, 2:4] / 2], 1)
+
+# Function to compute the IoU matrix between two sets of xyxy boxes
+def box_iou(boxes1, boxes2):
+    top_left = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    bottom_right = np.minimum(boxes1[:, None, 2:4], boxes2[None, :, 2:4])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area1 = np.prod(boxes1[:, 2:4] - boxes1[:, :2], axis=1)
+    area2 = np.prod(boxes2[:, 2:4] - boxes2[:, :2], axis=1)
+    return intersection / np.maximum(area1[:, None] + area2[None, :] - intersection, 1e-9)
+
+# Function to link a file, falling back to a copy across drives or on file systems without hard links
+def link_or_copy(source, destination):
+    import shutil
+    if os.path.exists(destination):
+        return
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
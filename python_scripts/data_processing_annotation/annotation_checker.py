@@ -6,9 +6,6 @@
 # The class label 'Black Bunch' is hardcoded for display purposes here.
 
 import os
-import cv2
-import matplotlib.pyplot as plt
-import yaml
 from pathlib import Path
 
 # Define paths to images and annotations
@@ -31,6 +28,9 @@ def load_annotations(annotation_path):
 
 # Function to draw bounding boxes on the image
 def draw_bounding_boxes(image_path, annotations):
+    import cv2
+    import matplotlib.pyplot as plt
+
     img = cv2.imread(image_path)
     img_height, img_width = img.shape[:2]
     
@@ -6,32 +6,37 @@
 
 import json
 import os
-import cv2
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 
 # Path to the COCO annotations file and images directory
 coco_annotation_path = r"D:\UniDoc\y2s1\SEGP\dataset\COCO_dataset\annotations\train_annotations.json"
 images_directory = r"D:\UniDoc\y2s1\SEGP\dataset\COCO_dataset\images\train"
 
-# Load the COCO annotations
-with open(coco_annotation_path, 'r') as f:
-    coco_data = json.load(f)
+# Function to load the COCO annotations and build the lookup dictionaries
+def load_coco_annotations(coco_annotation_path=coco_annotation_path):
+    with open(coco_annotation_path, 'r') as f:
+        coco_data = json.load(f)
 
-# Create dictionaries for easy lookup
-images_dict = {image['id']: image for image in coco_data['images']}
-annotations_dict = {}
-for ann in coco_data['annotations']:
-    image_id = ann['image_id']
-    if image_id not in annotations_dict:
-        annotations_dict[image_id] = []
-    annotations_dict[image_id].append(ann)
+    # Create dictionaries for easy lookup
+    images_dict = {image['id']: image for image in coco_data['images']}
+    annotations_dict = {}
+    for ann in coco_data['annotations']:
+        image_id = ann['image_id']
+        if image_id not in annotations_dict:
+            annotations_dict[image_id] = []
+        annotations_dict[image_id].append(ann)
 
-# Create a dictionary to lookup image IDs by file name
-file_name_to_id = {image['file_name']: image['id'] for image in coco_data['images']}
+    # Create a dictionary to lookup image IDs by file name
+    file_name_to_id = {image['file_name']: image['id'] for image in coco_data['images']}
+    return coco_data, images_dict, annotations_dict, file_name_to_id
 
 # Function to plot the specific image with annotations
-def plot_specific_image(filename):
+def plot_specific_image(filename, coco_annotation_path=coco_annotation_path, images_directory=images_directory):
+    import cv2
+    import matplotlib.pyplot as plt
+    import matplotlib.patches as patches
+
+    coco_data, images_dict, annotations_dict, file_name_to_id = load_coco_annotations(coco_annotation_path)
+
     if filename not in file_name_to_id:
         print(f"Image '{filename}' not found in annotations.")
         return
@@ -74,6 +79,7 @@ def plot_specific_image(filename):
     plt.axis('off')
     plt.show()
 
-# Input to specify which image to display
-filename = input("Enter the image filename you want to display (including extension, e.g., 'example.jpg'): ")
-plot_specific_image(filename)
+if __name__ == '__main__':
+    # Input to specify which image to display
+    filename = input("Enter the image filename you want to display (including extension, e.g., 'example.jpg'): ")
+    plot_specific_image(filename)
@@ -0,0 +1,204 @@
+# This script packs a YOLO dataset (images/<split> + labels/<split>) into WebDataset-style tar shards of about 1 GB.
+# Every sample is stored as two consecutive tar members, <key>.jpg and <key>.txt, so a shard can be read front to back
+# with one sequential stream instead of two small-file opens per image. This matters on network or HDD storage,
+# where opening hundreds of thousands of small files costs more than reading them.
+# index.json next to the shards lists every shard with the byte offset and size of each member, so single samples can
+# also be read with one seek (read_sample), and shards can be divided between workers without opening them.
+#
+# Readers:
+#   iter_samples / iter_batches  - sequential reading with an optional shuffle buffer, used by the mining detector
+#                                  (find_FPsample.process_shards) and the evaluator (model_training/shard_dataset.py)
+#   shards_for_worker            - splits the shard list between data-loader workers
+#   model_training/shard_dataset.py wraps the readers in a PyTorch IterableDataset
+
+import io
+import os
+import sys
+import json
+import random
+import tarfile
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+
+# Define paths
+images_path = r"D:\UniDoc\y2s1\SEGP\dataset\new_yolo_dataset\yolo_dataset_splited\images\train"
+labels_path = r"D:\UniDoc\y2s1\SEGP\dataset\new_yolo_dataset\yolo_dataset_splited\labels\train"
+output_path = r"D:\UniDoc\y2s1\SEGP\dataset\new_yolo_dataset\shards\train"
+shard_size = 1000 * 1000 * 1000  # Bytes per shard (about 1 GB)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+INDEX_NAME = 'index.json'
+
+# Function to add one in-memory file to a tar archive
+def add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o644  # Fixed metadata so packing the same data twice gives identical shards
+    tar.addfile(info, io.BytesIO(data))
+
+# Function to list the byte offset and size of every member of a finished shard
+# Returns {key: [image extension, image offset, image size, label offset, label size]}
+def index_shard(shard_path):
+    members = {}
+    with tarfile.open(shard_path, 'r') as tar:
+        for info in tar:
+            key, extension = os.path.splitext(info.name)
+            entry = members.setdefault(key, [None, 0, 0, 0, 0])
+            if extension == '.txt':
+                entry[3:5] = [info.offset_data, info.size]
+            else:
+                entry[0:3] = [extension, info.offset_data, info.size]
+    return members
+
+# Function to pack the images and labels of one split into shards and write index.json
+def write_shards(images_path=images_path, labels_path=labels_path, output_path=output_path, shard_size=shard_size, prefix='shard'):
+    os.makedirs(output_path, exist_ok=True)
+    image_files = sorted(f for f in os.listdir(images_path) if f.lower().endswith(IMAGE_EXTENSIONS))
+    # Samples are keyed by the name without its extension (the label file's name), so a.jpg and a.png would be read
+    # back as one sample; refuse them before writing anything
+    stems = {}
+    for file in image_files:
+        stems.setdefault(os.path.splitext(file)[0], []).append(file)
+    collisions = [files for files in stems.values() if len(files) > 1]
+    if collisions:
+        raise ValueError(f"{len(collisions)} image names in {images_path} differ only in their extension "
+                         f"(e.g. {', '.join(collisions[0])}); rename them so each has its own label file")
+
+    shards = []
+    tar = None
+    shard_bytes = 0
+
+    # Function to close the current shard and record its index
+    def close_shard():
+        tar.close()
+        shard = shards[-1]
+        shard['members'] = index_shard(os.path.join(output_path, shard['name']))
+        shard['samples'] = len(shard['members'])
+        shard['bytes'] = os.path.getsize(os.path.join(output_path, shard['name']))
+        print(f"Wrote {shard['name']}: {shard['samples']} samples, {shard['bytes'] / 1e6:.0f} MB")
+
+    for file in image_files:
+        key, extension = os.path.splitext(file)
+        with instrumentation.stage('read_files'):
+            with open(os.path.join(images_path, file), 'rb') as f:
+                image_data = f.read()
+            label_file = os.path.join(labels_path, key + '.txt')
+            label_data = b''
+            if os.path.exists(label_file):
+                with open(label_file, 'rb') as f:
+                    label_data = f.read()
+
+        # Start a new shard when this sample would push the current one over the size limit
+        sample_bytes = len(image_data) + len(label_data) + 2048  # Two 512-byte headers plus padding
+        if tar is None or (shard_bytes and shard_bytes + sample_bytes > shard_size):
+            if tar is not None:
+                close_shard()
+            name = f"{prefix}-{len(shards):06d}.tar"
+            shards.append({'name': name})
+            tar = tarfile.open(os.path.join(output_path, name), 'w', format=tarfile.GNU_FORMAT)
+            shard_bytes = 0
+
+        with instrumentation.stage('write_shard'):
+            add_member(tar, key + extension.lower(), image_data)
+            add_member(tar, key + '.txt', label_data)
+        shard_bytes += sample_bytes
+    if tar is not None:
+        close_shard()
+
+    index = {'format': 'webdataset-tar', 'samples': sum(s['samples'] for s in shards), 'shards': shards}
+    with open(os.path.join(output_path, INDEX_NAME), 'w') as f:
+        json.dump(index, f)
+    instrumentation.count('samples_packed', index['samples'])
+    print(f"Packed {index['samples']} samples into {len(shards)} shards in {output_path}")
+    return index
+
+# Function to load the index of a shard folder
+def load_index(shard_dir):
+    with open(os.path.join(shard_dir, INDEX_NAME), 'r') as f:
+        return json.load(f)
+
+# Function to pick the shards one worker reads: every num_workers-th shard, starting at worker_id
+def shards_for_worker(shard_names, worker_id, num_workers):
+    return shard_names[worker_id::num_workers]
+
+# Function to read one shard front to back
+# Yields (key, image extension, image bytes, label text) in the order the samples were written
+def iter_shard(shard_path):
+    current = {}
+    with open(shard_path, 'rb') as f:
+        # 'r|' reads the tar as a stream: no seeking, one sequential read with a large buffer
+        with tarfile.open(fileobj=f, mode='r|', bufsize=1 << 20) as tar:
+            for info in tar:
+                key, extension = os.path.splitext(info.name)
+                with instrumentation.stage('read_shard'):
+                    data = tar.extractfile(info).read()
+                if current and current['key'] != key:
+                    yield current['key'], current.get('extension'), current.get('image'), current.get('label', '')
+                    current = {}
+                current['key'] = key
+                if extension == '.txt':
+                    current['label'] = data.decode('utf-8')
+                else:
+                    current['extension'], current['image'] = extension, data
+    if current:
+        yield current['key'], current.get('extension'), current.get('image'), current.get('label', '')
+
+# Function to read the samples of several shards, optionally shuffled through a buffer
+# A shuffle buffer of N keeps N samples in memory and yields a random one each time a new sample is read
+def iter_samples(shard_dir, shard_names=None, shuffle_buffer=0, seed=None):
+    if shard_names is None:
+        shard_names = [shard['name'] for shard in load_index(shard_dir)['shards']]
+    rng = random.Random(seed)
+    buffer = []
+    for name in shard_names:
+        for sample in iter_shard(os.path.join(shard_dir, name)):
+            if shuffle_buffer <= 1:
+                yield sample
+                continue
+            if len(buffer) < shuffle_buffer:
+                buffer.append(sample)
+                continue
+            index = rng.randrange(len(buffer))
+            yield buffer[index]
+            buffer[index] = sample
+    rng.shuffle(buffer)
+    yield from buffer
+
+# Function to read samples in batches: yields (keys, image extensions, image bytes, label texts)
+def iter_batches(shard_dir, batch_size=32, shard_names=None, shuffle_buffer=0, seed=None):
+    batch = []
+    for sample in iter_samples(shard_dir, shard_names, shuffle_buffer, seed):
+        batch.append(sample)
+        if len(batch) == batch_size:
+            yield tuple(map(list, zip(*batch)))
+            batch = []
+    if batch:
+        yield tuple(map(list, zip(*batch)))
+
+# Function to read a single sample with one seek, using the offsets in the index
+def read_sample(shard_dir, key, index=None):
+    index = index or load_index(shard_dir)
+    for shard in index['shards']:
+        if key in shard['members']:
+            extension, image_offset, image_size, label_offset, label_size = shard['members'][key]
+            with open(os.path.join(shard_dir, shard['name']), 'rb') as f:
+                f.seek(image_offset)
+                image_data = f.read(image_size)
+                f.seek(label_offset)
+                label = f.read(label_size).decode('utf-8')
+            return extension, image_data, label
+    raise KeyError(f"{key} is not in the shards of {shard_dir}")
+
+# Function to parse YOLO label text into a list of (class, cx, cy, w, h)
+def parse_labels(label_text):
+    labels = []
+    for line in label_text.splitlines():
+        values = line.split()
+        if len(values) >= 5:
+            labels.append((int(values[0]), *map(float, values[1:5])))
+    return labels
+
+if __name__ == '__main__':
+    write_shards()
@@ -4,9 +4,14 @@
 # The split is performed based on a specified ratio (default is 80% train, 20% validation).
 
 import os
+import sys
 import shutil
 import random
 
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+
 def split_dataset(images_path, labels_path, output_path, train_ratio=0.8):
     # Create output directories
     train_images_path = os.path.join(output_path, 'images/train')
@@ -20,7 +25,8 @@ def split_dataset(images_path, labels_path, output_path, train_ratio=0.8):
     os.makedirs(val_labels_path, exist_ok=True)
 
     # Get all image files
-    image_files = [f for f in os.listdir(images_path) if f.endswith('.jpg')]
+    with instrumentation.stage('list_images'):
+        image_files = [f for f in os.listdir(images_path) if f.endswith('.jpg')]
     random.shuffle(image_files)
 
     # Split dataset
@@ -30,16 +36,50 @@ def split_dataset(images_path, labels_path, output_path, train_ratio=0.8):
 
     # Copy files to train and val folders
     for file in train_files:
-        shutil.copy(os.path.join(images_path, file), train_images_path)
+        with instrumentation.stage('copy_image'):
+            shutil.copy(os.path.join(images_path, file), train_images_path)
         label_file = os.path.splitext(file)[0] + '.txt'
         if os.path.exists(os.path.join(labels_path, label_file)):
-            shutil.copy(os.path.join(labels_path, label_file), train_labels_path)
+            with instrumentation.stage('copy_label'):
+                shutil.copy(os.path.join(labels_path, label_file), train_labels_path)
+    instrumentation.count('train_images', len(train_files))
 
     for file in val_files:
-        shutil.copy(os.path.join(images_path, file), val_images_path)
+        with instrumentation.stage('copy_image'):
+            shutil.copy(os.path.join(images_path, file), val_images_path)
         label_file = os.path.splitext(file)[0] + '.txt'
         if os.path.exists(os.path.join(labels_path, label_file)):
-            shutil.copy(os.path.join(labels_path, label_file), val_labels_path)
+            with instrumentation.stage('copy_label'):
+                shutil.copy(os.path.join(labels_path, label_file), val_labels_path)
+    instrumentation.count('val_images', len(val_files))
+
+# Function to split the images listed in a pseudo-labeling manifest (active_learning/pseudo_labeling.py)
+# Only entries with one of the given statuses are used; images and labels are copied from the paths in the manifest
+def split_from_manifest(manifest_path, output_path, train_ratio=0.8, statuses=('accepted',)):
+    # Shared reader of the pseudo-labeling manifest: a last line cut off by an interrupted run is dropped
+    from active_learning.pseudo_labeling import read_manifest
+    entries = [entry for entry in read_manifest(manifest_path) if entry['status'] in statuses]
+    random.shuffle(entries)
+
+    split_index = int(len(entries) * train_ratio)
+    for subset, subset_entries in (('train', entries[:split_index]), ('val', entries[split_index:])):
+        images_dir = os.path.join(output_path, 'images', subset)
+        labels_dir = os.path.join(output_path, 'labels', subset)
+        os.makedirs(images_dir, exist_ok=True)
+        os.makedirs(labels_dir, exist_ok=True)
+        for entry in subset_entries:
+            with instrumentation.stage('copy_image'):
+                shutil.copy(entry['image'], images_dir)
+            if entry['label']:
+                label_file = os.path.splitext(os.path.basename(entry['image']))[0] + '.txt'
+                with instrumentation.stage('copy_label'):
+                    # Review labels carry a confidence column; training labels keep only class cx cy w h
+                    with open(entry['label'], 'r') as f:
+                        lines = [' '.join(line.split()[:5]) for line in f if line.strip()]
+                    with open(os.path.join(labels_dir, label_file), 'w') as f:
+                        f.write('\n'.join(lines) + '\n')
+        instrumentation.count(f'{subset}_images', len(subset_entries))
+    return split_index, len(entries) - split_index
 
 if __name__ == '__main__':
     # Define paths
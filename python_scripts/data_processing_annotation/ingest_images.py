@@ -0,0 +1,186 @@
+# This script ingests a folder tree of field photos (JPEG, PNG, WEBP and, with pillow-heif installed, HEIC) into a
+# folder of JPEGs ready for annotation, training and mining.
+# Every image gets its EXIF rotation applied, is optionally downscaled so its longest side is at most max_side, and is
+# re-encoded with the chosen quality (tojpg.convert_to_jpg). The folder structure below input_folder is kept.
+# Work is spread over a process pool. Files are identified by a hash of their content, which is recorded in a ledger
+# (ingest_ledger.jsonl in the output folder); a rerun skips every file whose content was already ingested, even if it
+# was renamed or moved. Files with the same content within one run are ingested once. The ledger also records the bytes
+# before and after, and the run ends with the bytes saved. A ledger line cut off by an interrupted run is dropped.
+
+import os
+import io
+import sys
+import json
+import time
+import hashlib
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from active_learning.pseudo_labeling import read_manifest
+from data_processing_annotation.tojpg import convert_to_jpg
+
+# Define paths and encoding settings
+input_folder = r"D:\UniDoc\y2s1\SEGP\dataset\field_upload"
+output_folder = r"D:\UniDoc\y2s1\SEGP\dataset\field_upload_jpg"
+max_side = 1280  # None keeps the original size
+quality = 90
+progressive = True
+workers = None  # None uses every CPU core
+
+INPUT_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff', '.heic', '.heif')
+LEDGER_NAME = 'ingest_ledger.jsonl'
+
+# Hashes of the files ingested by earlier runs, set in every worker by init_worker
+known_hashes = set()
+
+# Function to hash a file's content in 1 MB chunks
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Function to read the hashes recorded in the ledger (a truncated last line is dropped, as for the label manifest)
+def read_ledger(ledger_path):
+    return {record['hash'] for record in read_manifest(ledger_path)}
+
+# Function to read the output path recorded in the ledger for every source file
+def read_ledger_outputs(ledger_path):
+    return {record['source']: record['output'] for record in read_manifest(ledger_path)}
+
+# Function to choose the output path of every source, relative to the output folder
+# a.png and a.jpg in one folder would both become a.jpg; every source after the first keeps its extension in the
+# name instead (a_png.jpg). Sources recorded in the ledger keep the name an earlier run gave them.
+def assign_outputs(relative_paths, recorded=None):
+    recorded = recorded or {}
+    present = set(relative_paths)
+    outputs = {path: output for path, output in recorded.items() if path in present}
+    claimed = {os.path.normcase(output) for output in recorded.values()}
+    next_suffix = {}  # Next _N to try per a_png name, so every collision costs O(1)
+    for relative_path in relative_paths:
+        if relative_path in outputs:
+            continue
+        stem, extension = os.path.splitext(relative_path)
+        candidate = stem + '.jpg'
+        if os.path.normcase(candidate) in claimed:
+            base = f"{stem}_{extension.lstrip('.').lower()}"
+            candidate = base + '.jpg'
+            n = next_suffix.get(base, 2)
+            while os.path.normcase(candidate) in claimed:
+                candidate = f"{base}_{n}.jpg"
+                n += 1
+            next_suffix[base] = n
+        claimed.add(os.path.normcase(candidate))
+        outputs[relative_path] = candidate
+    return outputs
+
+# Function to list the images below a folder, relative to it
+def find_images(folder):
+    found = []
+    for root, _, files in os.walk(folder):
+        for file in files:
+            if file.lower().endswith(INPUT_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(root, file), folder))
+    return sorted(found)
+
+# Function run once in every worker process
+def init_worker(hashes):
+    global known_hashes
+    known_hashes = hashes
+    # HEIC support is optional
+    try:
+        import pillow_heif
+        pillow_heif.register_heif_opener()
+    except ImportError:
+        pass
+
+# Function to ingest one file; returns a ledger record, or None if the file was ingested before
+def ingest_one(task):
+    relative_path, output_relative, input_folder, output_folder, max_side, quality, progressive = task
+    source = os.path.join(input_folder, relative_path)
+    content_hash = file_hash(source)
+    if content_hash in known_hashes:
+        return None
+
+    output_path = os.path.join(output_folder, output_relative)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    # convert_to_jpg prints one line per file; only keep its message when the conversion fails
+    messages = io.StringIO()
+    with contextlib.redirect_stdout(messages):
+        result = convert_to_jpg(source, None, quality=quality, progressive=progressive, max_side=max_side,
+                                exif_transpose=True, output_path=output_path)
+    record = {'hash': content_hash, 'source': relative_path, 'output': os.path.relpath(output_path, output_folder),
+              'bytes_in': os.path.getsize(source)}
+    if result is None:
+        record['error'] = messages.getvalue().strip()
+    else:
+        record['bytes_out'] = os.path.getsize(output_path)
+    return record
+
+# Function to ingest every new image below input_folder
+def ingest_folder(input_folder=None, output_folder=None, max_side=None, quality=None, progressive=None, workers=None):
+    settings = globals()
+    input_folder = input_folder or settings['input_folder']
+    output_folder = output_folder or settings['output_folder']
+    max_side = settings['max_side'] if max_side is None else max_side
+    quality = settings['quality'] if quality is None else quality
+    progressive = settings['progressive'] if progressive is None else progressive
+    workers = workers or settings['workers'] or os.cpu_count()
+
+    os.makedirs(output_folder, exist_ok=True)
+    ledger_path = os.path.join(output_folder, LEDGER_NAME)
+    hashes = read_ledger(ledger_path)
+    relative_paths = find_images(input_folder)
+    print(f"Found {len(relative_paths)} images, {len(hashes)} already in the ledger, using {workers} workers")
+
+    outputs = assign_outputs(relative_paths, read_ledger_outputs(ledger_path))
+    renamed = sum(outputs[path] != os.path.splitext(path)[0] + '.jpg' for path in relative_paths)
+    if renamed:
+        print(f"{renamed} images share a name with another image in their folder and keep their extension in the output name")
+    tasks = [(path, outputs[path], input_folder, output_folder, max_side or None, quality, progressive) for path in relative_paths]
+    totals = {'ingested': 0, 'skipped': 0, 'duplicates': 0, 'failed': 0, 'bytes_in': 0, 'bytes_out': 0}
+    seen = set(hashes)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(hashes,)) as executor, \
+            open(ledger_path, 'a') as ledger:
+        with instrumentation.stage('ingest'):
+            for record in executor.map(ingest_one, tasks, chunksize=8):
+                if record is None:
+                    totals['skipped'] += 1
+                    continue
+                if 'error' in record:
+                    # Failed files are not written to the ledger, so the next run tries them again
+                    totals['failed'] += 1
+                    print(record['error'])
+                    continue
+                if record['hash'] in seen:
+                    # Same content as a file earlier in this run: keep only the first copy
+                    os.remove(os.path.join(output_folder, record['output']))
+                    totals['duplicates'] += 1
+                    continue
+                seen.add(record['hash'])
+                ledger.write(json.dumps(record) + '\n')
+                totals['ingested'] += 1
+                totals['bytes_in'] += record['bytes_in']
+                totals['bytes_out'] += record['bytes_out']
+                if totals['ingested'] % 500 == 0:
+                    ledger.flush()
+                    print(f"Ingested {totals['ingested']} images...")
+
+    elapsed = time.perf_counter() - start
+    saved = totals['bytes_in'] - totals['bytes_out']
+    instrumentation.count('images_ingested', totals['ingested'])
+    instrumentation.count('bytes_saved', saved)
+    print(f"Ingested {totals['ingested']}, skipped {totals['skipped']}, duplicates {totals['duplicates']}, "
+          f"failed {totals['failed']} in {elapsed:.1f}s")
+    if totals['bytes_in']:
+        print(f"{totals['bytes_in'] / 1e6:.1f} MB -> {totals['bytes_out'] / 1e6:.1f} MB "
+              f"(saved {saved / 1e6:.1f} MB, {saved / totals['bytes_in']:.0%})")
+    return totals
+
+if __name__ == '__main__':
+    ingest_folder()
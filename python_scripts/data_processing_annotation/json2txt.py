@@ -23,8 +23,9 @@ def convert_json_to_txt(json_path, txt_path):
             line = f"{category} " + " ".join(normalized_coords) + "\n"
             f.write(line)
 
-# Example usage
-convert_json_to_txt(r"D:\UniDoc\y2s1\SEGP\dataset\images\downloaded_images\clear\clear/net1.json", 
-                    r"D:\UniDoc\y2s1\SEGP\dataset\images\downloaded_images\clear\net1.txt")
+if __name__ == '__main__':
+    # Example usage
+    convert_json_to_txt(r"D:\UniDoc\y2s1\SEGP\dataset\images\downloaded_images\clear\clear/net1.json", 
+                        r"D:\UniDoc\y2s1\SEGP\dataset\images\downloaded_images\clear\net1.txt")
 
-print("Conversion complete. Output saved to 0008eba8a0_001_converted.txt")
+    print("Conversion complete. Output saved to 0008eba8a0_001_converted.txt")
@@ -0,0 +1,268 @@
+# Compact storage and fast geometry for segmentation labels.
+# json2txt.py writes every polygon as a text line of float pairs, and yolo_format_convert.py keeps only its bounding
+# box. Here a whole label set (one polygon list per image) is kept in a single .npz file instead:
+#   names          image names (without extension)
+#   sizes          (n_images, 2) width, height in pixels (0 if unknown)
+#   image_offsets  polygons of image i are polygons image_offsets[i]:image_offsets[i + 1]
+#   classes        class id per polygon
+#   point_offsets  points of polygon j are points[point_offsets[j]:point_offsets[j + 1]]
+#   points         (n_points, 2) uint16: normalized x, y quantized to 0..65535 (finer than a pixel up to 65535 px)
+# Four bytes per point instead of ~20 characters of text, and np.savez_compressed shrinks it further.
+# Masks are kept as COCO run-length encodings (column-major runs starting with background, optionally as COCO's
+# compressed string). Polygons are rasterized with a vectorized even-odd scanline fill (all polygons of an image at
+# once), and masks -> boxes and mask IoU work on whole stacks of masks.
+
+import os
+import sys
+import numpy as np
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+
+QUANTIZATION = 65535
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# ---- polygons ----
+
+# Function to quantize normalized coordinates to uint16
+def quantize(points):
+    return np.round(np.clip(points, 0.0, 1.0) * QUANTIZATION).astype(np.uint16)
+
+# Function to turn quantized coordinates back into normalized floats
+def dequantize(points):
+    return points.astype(np.float32) / QUANTIZATION
+
+# Function to read a YOLO-seg label file: a list of (class, (k, 2) normalized points)
+def read_yolo_seg(label_path):
+    polygons = []
+    with open(label_path, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 7 or len(parts) % 2 == 0:  # Class and at least three points
+                continue
+            polygons.append((int(float(parts[0])), np.array(parts[1:], dtype=np.float32).reshape(-1, 2)))
+    return polygons
+
+# Function to write a YOLO-seg label file
+def write_yolo_seg(label_path, polygons):
+    with open(label_path, 'w') as f:
+        for cls, points in polygons:
+            f.write(f"{cls} " + ' '.join(f"{value:.6f}" for value in points.reshape(-1)) + '\n')
+
+# Function to read the image size from the file header without decoding the pixels
+def image_size(image_path):
+    from PIL import Image
+    with Image.open(image_path) as img:
+        return img.size
+
+# Function to build a label set from lists of polygons
+# entries: list of (name, (width, height), [(class, (k, 2) normalized points), ...])
+def build_label_set(entries):
+    names, sizes, image_offsets, classes, point_offsets, points = [], [], [0], [], [0], []
+    for name, size, polygons in entries:
+        names.append(name)
+        sizes.append(size)
+        for cls, polygon in polygons:
+            classes.append(cls)
+            points.append(quantize(polygon))
+            point_offsets.append(point_offsets[-1] + len(polygon))
+        image_offsets.append(len(classes))
+    return {
+        'names': np.array(names),
+        'sizes': np.array(sizes, dtype=np.int32).reshape(-1, 2),
+        'image_offsets': np.array(image_offsets, dtype=np.int64),
+        'classes': np.array(classes, dtype=np.int16),
+        'point_offsets': np.array(point_offsets, dtype=np.int64),
+        'points': np.concatenate(points) if points else np.zeros((0, 2), dtype=np.uint16),
+    }
+
+# Function to pack a folder of YOLO-seg (or json2txt) label files into a label set
+# With image_folder, the image sizes are read from the image headers so the set can be rasterized later
+def pack_folder(label_folder, output_path, image_folder=None):
+    entries = []
+    images = {}
+    if image_folder:
+        images = {os.path.splitext(f)[0]: os.path.join(image_folder, f) for f in os.listdir(image_folder) if f.lower().endswith(IMAGE_EXTENSIONS)}
+    with instrumentation.stage('read_labels'):
+        for file in sorted(os.listdir(label_folder)):
+            if not file.endswith('.txt'):
+                continue
+            name = os.path.splitext(file)[0]
+            size = image_size(images[name]) if name in images else (0, 0)
+            entries.append((name, size, read_yolo_seg(os.path.join(label_folder, file))))
+    label_set = build_label_set(entries)
+    save_label_set(output_path, label_set)
+    text_bytes = sum(os.path.getsize(os.path.join(label_folder, name + '.txt')) for name, _, _ in entries)
+    packed_bytes = os.path.getsize(output_path)
+    print(f"Packed {len(entries)} label files ({len(label_set['classes'])} polygons, {len(label_set['points'])} points): "
+          f"{text_bytes / 1e6:.2f} MB of text -> {packed_bytes / 1e6:.2f} MB ({text_bytes / max(packed_bytes, 1):.1f}x smaller)")
+    return label_set
+
+# Function to save a label set
+def save_label_set(path, label_set):
+    np.savez_compressed(path, **label_set)
+
+# Function to load a label set
+def load_label_set(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+# Function to get the polygons of image i as a list of (class, (k, 2) normalized float points)
+def image_polygons(label_set, i):
+    start, end = label_set['image_offsets'][i], label_set['image_offsets'][i + 1]
+    offsets = label_set['point_offsets']
+    return [(int(label_set['classes'][j]), dequantize(label_set['points'][offsets[j]:offsets[j + 1]])) for j in range(start, end)]
+
+# Function to write a label set back to YOLO-seg label files
+def unpack_to_folder(label_set, output_folder):
+    os.makedirs(output_folder, exist_ok=True)
+    for i, name in enumerate(label_set['names']):
+        write_yolo_seg(os.path.join(output_folder, f"{name}.txt"), image_polygons(label_set, i))
+    print(f"Wrote {len(label_set['names'])} YOLO-seg label files to {output_folder}")
+
+# Function to compute the normalized xyxy box of every polygon at once
+def polygon_boxes(label_set):
+    points = dequantize(label_set['points'])
+    starts = label_set['point_offsets'][:-1]
+    if not len(starts):
+        return np.zeros((0, 4), dtype=np.float32)
+    low = np.minimum.reduceat(points, starts, axis=0)
+    high = np.maximum.reduceat(points, starts, axis=0)
+    return np.concatenate([low, high], axis=1)
+
+# Function to write YOLO box labels (class cx cy w h) for every image, as yolo_format_convert.py does per line
+def export_boxes(label_set, output_folder):
+    os.makedirs(output_folder, exist_ok=True)
+    boxes = polygon_boxes(label_set)
+    xywh = np.column_stack([(boxes[:, :2] + boxes[:, 2:]) / 2, boxes[:, 2:] - boxes[:, :2]])
+    offsets = label_set['image_offsets']
+    for i, name in enumerate(label_set['names']):
+        rows = range(offsets[i], offsets[i + 1])
+        with open(os.path.join(output_folder, f"{name}.txt"), 'w') as f:
+            f.write(''.join(f"{label_set['classes'][j]} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n" for j, (x, y, w, h) in zip(rows, xywh[rows.start:rows.stop])))
+    print(f"Wrote box labels of {len(label_set['names'])} images to {output_folder}")
+
+# ---- rasterization ----
+
+# Function to rasterize polygons (pixel coordinates) into one mask per polygon, (n, height, width) bool
+# Even-odd scanline fill, vectorized over all edges of all polygons: every edge crossing a pixel row's center toggles
+# the inside state from the first pixel whose center lies right of the crossing; a cumulative sum along the row
+# turns the toggles into the filled mask.
+def rasterize_polygons(polygons, height, width):
+    masks = np.zeros((len(polygons), height, width + 1), dtype=np.uint8)
+    if not len(polygons):
+        return masks[:, :, :width].astype(bool)
+    with instrumentation.stage('rasterize'):
+        # All edges as (polygon, x0, y0, x1, y1)
+        owner = np.concatenate([np.full(len(p), i) for i, p in enumerate(polygons)])
+        start = np.concatenate(polygons).astype(np.float64)
+        end = np.concatenate([np.roll(p, -1, axis=0) for p in polygons]).astype(np.float64)
+        # Rows whose center (y + 0.5) lies between the edge's end points (half-open, so vertices count once)
+        y_low, y_high = np.minimum(start[:, 1], end[:, 1]), np.maximum(start[:, 1], end[:, 1])
+        first_row = np.clip(np.ceil(y_low - 0.5), 0, height).astype(np.int64)
+        last_row = np.clip(np.ceil(y_high - 0.5), 0, height).astype(np.int64)
+        counts = last_row - first_row
+        edge = np.repeat(np.arange(len(start)), counts)
+        rows = np.repeat(first_row, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        # x where the edge crosses the row center
+        y = rows + 0.5
+        x0, y0, x1, y1 = start[edge, 0], start[edge, 1], end[edge, 0], end[edge, 1]
+        x = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+        columns = np.clip(np.floor(x - 0.5) + 1, 0, width).astype(np.int64)
+        np.add.at(masks, (owner[edge], rows, columns), 1)
+        # uint8 sums wrap around, which keeps the parity
+        return (np.cumsum(masks, axis=2, dtype=np.uint8)[:, :, :width] & 1).astype(bool)
+
+# Function to rasterize the polygons of image i of a label set, (n, height, width) bool
+def image_masks(label_set, i, height=None, width=None):
+    width = width or int(label_set['sizes'][i][0])
+    height = height or int(label_set['sizes'][i][1])
+    if not width or not height:
+        raise ValueError(f"Unknown image size for {label_set['names'][i]}; pack the labels with the image folder")
+    polygons = [points * np.array([width, height], dtype=np.float32) for _, points in image_polygons(label_set, i)]
+    return rasterize_polygons(polygons, height, width)
+
+# ---- masks ----
+
+# Function to encode a mask as COCO run lengths (column-major, first run is background)
+def mask_to_rle(mask):
+    pixels = np.asarray(mask, dtype=bool).ravel(order='F')
+    changes = np.flatnonzero(pixels[1:] != pixels[:-1]) + 1
+    boundaries = np.concatenate([[0], changes, [len(pixels)]])
+    counts = np.diff(boundaries)
+    if len(pixels) and pixels[0]:
+        counts = np.concatenate([[0], counts])
+    return {'size': [int(mask.shape[0]), int(mask.shape[1])], 'counts': counts.astype(np.int64).tolist()}
+
+# Function to decode COCO run lengths into a mask
+def rle_to_mask(rle):
+    height, width = rle['size']
+    counts = rle['counts']
+    if isinstance(counts, (str, bytes)):
+        counts = string_to_counts(counts)
+    values = np.arange(len(counts)) % 2 == 1
+    return np.repeat(values, counts).reshape((width, height)).T
+
+# Function to encode run lengths as COCO's compressed string (pycocotools rleToString)
+def counts_to_string(counts):
+    characters = []
+    for i, x in enumerate(counts):
+        x = int(x) - (int(counts[i - 2]) if i > 2 else 0)
+        more = True
+        while more:
+            c = x & 0x1f
+            x >>= 5
+            more = (x != -1) if c & 0x10 else (x != 0)
+            if more:
+                c |= 0x20
+            characters.append(chr(c + 48))
+    return ''.join(characters)
+
+# Function to decode COCO's compressed string into run lengths (pycocotools rleFrString)
+def string_to_counts(text):
+    if isinstance(text, bytes):
+        text = text.decode('ascii')
+    counts, p = [], 0
+    while p < len(text):
+        x, k, more = 0, 0, True
+        while more:
+            c = ord(text[p]) - 48
+            x |= (c & 0x1f) << (5 * k)
+            more = bool(c & 0x20)
+            p += 1
+            k += 1
+            if not more and c & 0x10:
+                x |= -1 << (5 * k)
+        if len(counts) > 2:
+            x += counts[-2]
+        counts.append(x)
+    return counts
+
+# Function to get the pixel xyxy box of every mask in a stack, (n, 4); empty masks get zeros
+def masks_to_boxes(masks):
+    masks = np.asarray(masks, dtype=bool)
+    rows, columns = masks.any(axis=2), masks.any(axis=1)
+    height, width = masks.shape[1:]
+    boxes = np.zeros((len(masks), 4), dtype=np.float32)
+    present = rows.any(axis=1)
+    boxes[:, 0] = np.argmax(columns, axis=1)
+    boxes[:, 1] = np.argmax(rows, axis=1)
+    boxes[:, 2] = width - np.argmax(columns[:, ::-1], axis=1)
+    boxes[:, 3] = height - np.argmax(rows[:, ::-1], axis=1)
+    boxes[~present] = 0
+    return boxes
+
+# Function to compute the IoU matrix between two stacks of masks of the same size
+def mask_iou(masks1, masks2):
+    a = np.asarray(masks1, dtype=bool).reshape(len(masks1), -1)
+    b = np.asarray(masks2, dtype=bool).reshape(len(masks2), -1)
+    # Intersections of all pairs as one matrix product
+    intersection = a.astype(np.float32) @ b.astype(np.float32).T
+    union = a.sum(axis=1)[:, None] + b.sum(axis=1)[None, :] - intersection
+    return intersection / np.maximum(union, 1)
+
+if __name__ == '__main__':
+    label_set = pack_folder(r"D:\UniDoc\y2s1\SEGP\dataset\images\downloaded_images\clear\clear",
+                            r"D:\UniDoc\y2s1\SEGP\dataset\segmentation_labels.npz",
+                            r"D:\UniDoc\y2s1\SEGP\dataset\images\downloaded_images\clear\clear")
@@ -1,25 +1,53 @@
 # Author: Zhang Shuning
 # This script converts a single image file (e.g., PNG, WEBP) to JPEG format.
+# ingest_images.py uses it to convert whole folders in parallel.
 
-from PIL import Image
+from PIL import Image, ImageOps
 import os
+import sys
 
-def convert_to_jpg(input_path, output_folder):
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+
+# Function to convert an image to JPEG
+# Optional: quality/progressive encoding, EXIF rotation, and downscaling so the longest side is at most max_side.
+# With the defaults it behaves as before (PIL default quality, no resizing). Returns the output path, or None on error.
+def convert_to_jpg(input_path, output_folder, quality=None, progressive=False, max_side=None, exif_transpose=False, output_path=None):
     try:
         # Open the image file
         with Image.open(input_path) as img:
-            # Convert image to RGB (if it's not already in RGB mode)
-            img = img.convert("RGB")
+            with instrumentation.stage('decode'):
+                # For JPEGs, let the decoder skip detail we would throw away (DCT scaling to 1/2, 1/4 or 1/8)
+                if max_side and img.format == 'JPEG':
+                    img.draft('RGB', (max_side, max_side))
+                # Rotate the pixels according to the EXIF orientation tag
+                if exif_transpose:
+                    img = ImageOps.exif_transpose(img)
+                # Convert image to RGB (if it's not already in RGB mode)
+                img = img.convert("RGB")
+
+            # Shrink so the longest side is at most max_side
+            if max_side and max(img.size) > max_side:
+                with instrumentation.stage('resize'):
+                    img.thumbnail((max_side, max_side), Image.LANCZOS)
 
             # Create output filename with .jpg extension
-            base_name = os.path.splitext(os.path.basename(input_path))[0]
-            output_path = os.path.join(output_folder, f"{base_name}.jpg")
+            if output_path is None:
+                base_name = os.path.splitext(os.path.basename(input_path))[0]
+                output_path = os.path.join(output_folder, f"{base_name}.jpg")
 
             # Save image as JPEG
-            img.save(output_path, "JPEG")
+            options = {'progressive': progressive, 'optimize': progressive}
+            if quality is not None:
+                options['quality'] = quality
+            with instrumentation.stage('encode'):
+                img.save(output_path, "JPEG", **options)
             print(f"Successfully converted: {input_path} -> {output_path}")
+            return output_path
     except Exception as e:
         print(f"Error converting {input_path}: {e}")
+        return None
 
 if __name__ == "__main__":
     # Example usage
@@ -0,0 +1,215 @@
+# This script turns walk-through videos of plantation rows into still frames for annotation and mining.
+# Instead of keeping every n-th frame, each video is decoded once with OpenCV and a frame is only kept when the view
+# has changed enough since the last kept frame (mean absolute difference of small grayscale thumbnails). After such a
+# change, the sharpest of the next candidate_window frames is kept (Laplacian variance, qua_classifier.blur_score),
+# and dropped if it is still below blur_threshold. A window ends early at the next cut (a frame that differs from the
+# window's first frame by scene_threshold), so every scene gets its own window and its frame is not taken from the next. Kept frames are compared with a rolling window of difference hashes
+# (dHash) of the recent kept frames, so walking back along a row does not produce near-duplicates.
+# Kept frames are written as JPEGs (longest side at most max_side) into output_folder/<video name>/, where the
+# ingest, watch and mining scripts pick them up. Videos are processed in parallel, one per worker process, and each
+# worker only holds the current frame, the best candidate and a few thumbnails, so memory does not grow with the video.
+# Processed videos are recorded by content hash in a ledger (video_ledger.jsonl), so a rerun skips them.
+
+import os
+import sys
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from data_processing_annotation.ingest_images import file_hash, read_ledger
+
+# Define paths and sampling settings
+input_folder = r"D:\UniDoc\y2s1\SEGP\dataset\field_video"
+output_folder = r"D:\UniDoc\y2s1\SEGP\dataset\field_upload"
+max_side = 1280
+quality = 90
+analysis_stride = 2  # Score every n-th frame (the others are only decoded)
+thumbnail_width = 160  # Width of the grayscale thumbnails used for the change score
+scene_threshold = 12.0  # Mean absolute thumbnail difference (0-255) that counts as a new view
+candidate_window = 8  # Scored frames after a change among which the sharpest is kept
+blur_threshold = 100.0  # Same Laplacian threshold as qua_classifier.is_blurry
+hash_window = 50  # Recent kept frames checked for near-duplicates
+duplicate_distance = 6  # dHash bits that may differ for two frames to count as duplicates
+workers = None  # None uses every CPU core
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.3gp', '.m4v')
+LEDGER_NAME = 'video_ledger.jsonl'
+
+# Hashes of the videos sampled by earlier runs, set in every worker by init_worker
+known_hashes = set()
+
+# Function to list the videos below a folder, relative to it
+def find_videos(folder):
+    found = []
+    for root, _, files in os.walk(folder):
+        for file in files:
+            if file.lower().endswith(VIDEO_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(root, file), folder))
+    return sorted(found)
+
+# Function to compute the 64-bit difference hash of a grayscale image
+def dhash(gray):
+    import cv2
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(''.join('1' if bit else '0' for bit in bits), 2)
+
+# Function to check a hash against the recent hashes
+def is_duplicate(frame_hash, recent_hashes):
+    return any(bin(frame_hash ^ other).count('1') <= duplicate_distance for other in recent_hashes)
+
+# Function to downscale a frame so its longest side is at most max_side
+def limit_size(frame, max_side):
+    import cv2
+    height, width = frame.shape[:2]
+    scale = max_side / max(height, width) if max_side else 1.0
+    if scale >= 1.0:
+        return frame
+    return cv2.resize(frame, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+# Function run once in every worker process
+def init_worker(hashes):
+    global known_hashes
+    known_hashes = hashes
+
+# Function to end a candidate window: write its sharpest frame unless it is blurred or a near-duplicate
+# Returns the thumbnail of that frame, the reference the next scene change is measured against
+def keep_best(best, thumbnail_size, recent_hashes, record, output_prefix, fps):
+    import cv2
+    sharpness, best_index, best_frame = best
+    best_gray = cv2.cvtColor(best_frame, cv2.COLOR_BGR2GRAY)
+    reference = cv2.resize(best_gray, thumbnail_size, interpolation=cv2.INTER_AREA)
+    if sharpness < blur_threshold:
+        record['blurred'] += 1
+        return reference
+    frame_hash = dhash(best_gray)
+    if is_duplicate(frame_hash, recent_hashes):
+        record['duplicates'] += 1
+        return reference
+    recent_hashes.append(frame_hash)
+    cv2.imwrite(f"{output_prefix}_{best_index / fps:08.2f}s.jpg", best_frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    record['kept'] += 1
+    return reference
+
+# Function to select and write the frames of one video; returns a ledger record, or None if it was sampled before
+def sample_video(task):
+    import cv2
+    from data_processing_annotation.qua_classifier import blur_score
+    relative_path, input_folder, output_folder, settings = task
+    globals().update(settings)
+    cv2.setNumThreads(1)  # One video per process; OpenCV's own threads would compete with the other workers
+
+    source = os.path.join(input_folder, relative_path)
+    content_hash = file_hash(source)
+    if content_hash in known_hashes:
+        return None
+    record = {'hash': content_hash, 'source': relative_path, 'frames': 0, 'kept': 0, 'blurred': 0, 'duplicates': 0}
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        record['error'] = f"Could not open {source}"
+        return record
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_folder = os.path.join(output_folder, os.path.splitext(relative_path)[0])
+    os.makedirs(frame_folder, exist_ok=True)
+    output_prefix = os.path.join(frame_folder, os.path.splitext(os.path.basename(relative_path))[0])
+
+    reference = None  # Thumbnail of the last kept frame (or of the view that was rejected)
+    best = None  # (sharpness, frame index, frame) of the current candidate window
+    window_start = None  # Thumbnail of the first frame of the current candidate window
+    window_left = 0
+    recent_hashes = deque(maxlen=hash_window)
+    index = -1
+    while True:
+        index += 1
+        if index % analysis_stride:
+            if not capture.grab():
+                break
+            continue
+        ok, frame = capture.read()
+        if not ok:
+            break
+        frame = limit_size(frame, max_side)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.resize(gray, (thumbnail_width, max(1, gray.shape[0] * thumbnail_width // gray.shape[1])),
+                               interpolation=cv2.INTER_AREA)
+
+        if best is not None and float(cv2.absdiff(thumbnail, window_start).mean()) >= scene_threshold:
+            # The view changed inside the window: close it on its own scene's frames and start a new one here
+            reference = keep_best(best, (thumbnail.shape[1], thumbnail.shape[0]), recent_hashes, record, output_prefix, fps)
+            window_left = candidate_window
+            window_start = thumbnail
+            best = (-1.0, index, None)
+        elif best is None:
+            change = 255.0 if reference is None else float(cv2.absdiff(thumbnail, reference).mean())
+            if change < scene_threshold:
+                continue
+            window_left = candidate_window
+            window_start = thumbnail
+            best = (-1.0, index, None)
+
+        sharpness = blur_score(gray)
+        if sharpness > best[0]:
+            best = (sharpness, index, frame)
+        window_left -= 1
+        if window_left > 0:
+            continue
+
+        reference = keep_best(best, (thumbnail.shape[1], thumbnail.shape[0]), recent_hashes, record, output_prefix, fps)
+        best = None
+
+    # The video ended inside a candidate window: its sharpest frame so far still counts
+    if best is not None:
+        keep_best(best, (thumbnail.shape[1], thumbnail.shape[0]), recent_hashes, record, output_prefix, fps)
+    capture.release()
+    record['frames'] = index
+    record['seconds'] = round(index / fps, 1)
+    return record
+
+# Function to sample every new video below input_folder
+def ingest_videos(input_folder=None, output_folder=None, workers=None):
+    input_folder = input_folder or globals()['input_folder']
+    output_folder = output_folder or globals()['output_folder']
+    workers = workers or globals()['workers'] or os.cpu_count()
+    os.makedirs(output_folder, exist_ok=True)
+    ledger_path = os.path.join(output_folder, LEDGER_NAME)
+    hashes = read_ledger(ledger_path)
+
+    relative_paths = find_videos(input_folder)
+    print(f"Found {len(relative_paths)} videos, {len(hashes)} already in the ledger, using {workers} workers")
+    # Settings travel with every task, since worker processes may start from this module's defaults
+    settings = {name: globals()[name] for name in ('max_side', 'quality', 'analysis_stride', 'thumbnail_width', 'scene_threshold',
+                                                   'candidate_window', 'blur_threshold', 'hash_window', 'duplicate_distance')}
+    tasks = [(path, input_folder, output_folder, settings) for path in relative_paths]
+    totals = {'videos': 0, 'skipped': 0, 'failed': 0, 'frames': 0, 'kept': 0, 'blurred': 0, 'duplicates': 0}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(hashes,)) as executor, \
+            open(ledger_path, 'a') as ledger:
+        with instrumentation.stage('video_ingest'):
+            for record in executor.map(sample_video, tasks):
+                if record is None:
+                    totals['skipped'] += 1
+                    continue
+                if 'error' in record:
+                    totals['failed'] += 1
+                    print(record['error'])
+                    continue
+                ledger.write(json.dumps(record) + '\n')
+                ledger.flush()
+                totals['videos'] += 1
+                for key in ('frames', 'kept', 'blurred', 'duplicates'):
+                    totals[key] += record[key]
+                print(f"{record['source']}: {record['seconds']}s of video, kept {record['kept']} frames "
+                      f"({record['blurred']} blurred, {record['duplicates']} duplicates dropped)")
+
+    elapsed = time.perf_counter() - start
+    instrumentation.count('video_frames_kept', totals['kept'])
+    print(f"Sampled {totals['videos']} videos, skipped {totals['skipped']}, failed {totals['failed']} in {elapsed:.1f}s: "
+          f"{totals['kept']} of {totals['frames']} frames kept")
+    return totals
+
+if __name__ == '__main__':
+    ingest_videos()
@@ -4,18 +4,18 @@
 # The images will be moved to a specific folder named "iamges"
 
 import os
+import sys
 import shutil
 from tqdm import tqdm
 
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+
 # Define directories
 input_directory = r'D:\UniDoc\y2s1\SEGP\dataset\images\downloaded_images\clear\clear'  # Directory with polygon annotations
 output_directory = r'D:\UniDoc\y2s1\SEGP\dataset\new_yolo_dataset'  # Output directory for YOLO annotations and images
 image_directory = r'D:\UniDoc\y2s1\SEGP\dataset\images\downloaded_images\clear\clear'  # Directory with original images
-output_image_directory = os.path.join(output_directory, 'images')  # Output directory for copied images
-
-# Ensure output directories exist
-os.makedirs(output_directory, exist_ok=True)
-os.makedirs(output_image_directory, exist_ok=True)
 
 # Function to convert polygon points to bounding box
 def convert_polygon_to_bbox(polygon_points):
@@ -38,7 +38,16 @@ def convert_polygon_to_bbox(polygon_points):
     return center_x, center_y, width, height
 
 # Function to convert polygon annotations to YOLO format and copy images
-def convert_annotations_and_copy_images():
+def convert_annotations_and_copy_images(input_directory=input_directory, output_directory=output_directory,
+                                        image_directory=image_directory, output_image_directory=None):
+    # Copied images go to the "images" folder inside the output directory unless told otherwise
+    if output_image_directory is None:
+        output_image_directory = os.path.join(output_directory, 'images')
+
+    # Ensure output directories exist
+    os.makedirs(output_directory, exist_ok=True)
+    os.makedirs(output_image_directory, exist_ok=True)
+
     annotation_files = [f for f in os.listdir(input_directory) if f.endswith('.txt')]
     
     # Keep track of images that have annotations
@@ -50,14 +59,15 @@ def convert_annotations_and_copy_images():
             input_path = os.path.join(input_directory, filename)
             output_path = os.path.join(output_directory, filename)
 
-            with open(input_path, 'r') as file:
-                lines = file.readlines()
+            with instrumentation.stage('read_annotation'):
+                with open(input_path, 'r') as file:
+                    lines = file.readlines()
 
             if not lines:
                 print(f"Skipping empty file: {filename}")
                 continue
             
-            with open(output_path, 'w') as output_file:
+            with instrumentation.stage('convert_annotation'), open(output_path, 'w') as output_file:
                 for line in lines:
                     parts = line.strip().split()
                     if len(parts) < 3:  # At least class_id and a pair of coordinates are needed
@@ -79,6 +89,7 @@ def convert_annotations_and_copy_images():
             
             # Record the associated image as annotated
             annotated_images.add(os.path.splitext(filename)[0] + '.jpg')
+            instrumentation.count('annotations_converted')
         
         except Exception as e:
             print(f"Error processing file {filename}: {e}")
@@ -88,13 +99,16 @@ def convert_annotations_and_copy_images():
     for image_filename in tqdm(image_files, desc="Copying Images"):
         image_path = os.path.join(image_directory, image_filename)
         if os.path.exists(image_path):
-            shutil.copy(image_path, output_image_directory)
+            with instrumentation.stage('copy_image'):
+                shutil.copy(image_path, output_image_directory)
+            instrumentation.count('images_copied')
             if image_filename in annotated_images:
                 print(f"Copied annotated image: {image_filename}")
             else:
                 print(f"Copied image without annotation: {image_filename}")
 
-# Run the conversion and copying process
-convert_annotations_and_copy_images()
+if __name__ == '__main__':
+    # Run the conversion and copying process
+    convert_annotations_and_copy_images()
 
-print("Conversion completed. YOLO formatted annotations and associated images are saved in the output directory.")
+    print("Conversion completed. YOLO formatted annotations and associated images are saved in the output directory.")
@@ -4,9 +4,14 @@
 # from YOLO normalized format to absolute pixel values, and structures them in the COCO dataset format.
 
 import os
+import sys
 import json
 from PIL import Image
 
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+
 # Paths to your dataset
 images_folder = r"D:\UniDoc\y2s1\SEGP\dataset\yolo_dataset_splited\images\val"
 labels_folder = r"D:\UniDoc\y2s1\SEGP\dataset\yolo_dataset_splited\labels\val"
@@ -19,64 +24,72 @@ categories = [
     # Add more classes as needed
 ]
 
-# Initialize COCO structure
-coco_format = {
-    "images": [],
-    "annotations": [],
-    "categories": categories,
-}
-
-annotation_id = 0
-
-# Loop through all images and annotations
-for filename in os.listdir(images_folder):
-    if filename.endswith(('.jpg', '.png', '.jpeg')):
-        image_path = os.path.join(images_folder, filename)
-        label_path = os.path.join(labels_folder, os.path.splitext(filename)[0] + ".txt")
-
-        # Load the image to get its dimensions
-        with Image.open(image_path) as img:
-            width, height = img.size
-
-        # Add image info to COCO JSON
-        image_id = len(coco_format["images"]) + 1
-        coco_format["images"].append({
-            "id": image_id,
-            "file_name": filename,
-            "width": width,
-            "height": height
-        })
-
-        # Read the corresponding YOLO label file
-        if os.path.exists(label_path):
-            with open(label_path, "r") as file:
-                for line in file:
-                    class_id, x_center, y_center, box_width, box_height = map(float, line.strip().split())
-
-                    # Convert normalized YOLO coordinates to absolute COCO format
-                    x_center_abs = x_center * width
-                    y_center_abs = y_center * height
-                    box_width_abs = box_width * width
-                    box_height_abs = box_height * height
-
-                    # Convert YOLO format to COCO format [xmin, ymin, width, height]
-                    xmin = x_center_abs - (box_width_abs / 2)
-                    ymin = y_center_abs - (box_height_abs / 2)
-
-                    # Create annotation entry
-                    annotation = {
-                        "id": annotation_id,
-                        "image_id": image_id,
-                        "category_id": int(class_id),
-                        "bbox": [xmin, ymin, box_width_abs, box_height_abs],
-                        "area": box_width_abs * box_height_abs,
-                        "iscrowd": 0
-                    }
-                    coco_format["annotations"].append(annotation)
-                    annotation_id += 1
-
-# Save to COCO JSON file
-with open(output_json, "w") as json_file:
-    json.dump(coco_format, json_file, indent=4)
-
-print(f"COCO format annotations saved to {output_json}")
+# Function to build the COCO annotation JSON from a YOLO images/labels folder pair
+def convert_yolo_to_coco(images_folder=images_folder, labels_folder=labels_folder, output_json=output_json):
+    # Initialize COCO structure
+    coco_format = {
+        "images": [],
+        "annotations": [],
+        "categories": categories,
+    }
+
+    annotation_id = 0
+
+    # Loop through all images and annotations
+    for filename in os.listdir(images_folder):
+        if filename.endswith(('.jpg', '.png', '.jpeg')):
+            image_path = os.path.join(images_folder, filename)
+            label_path = os.path.join(labels_folder, os.path.splitext(filename)[0] + ".txt")
+
+            # Load the image to get its dimensions
+            with instrumentation.stage('read_image_size'), Image.open(image_path) as img:
+                width, height = img.size
+
+            # Add image info to COCO JSON
+            image_id = len(coco_format["images"]) + 1
+            coco_format["images"].append({
+                "id": image_id,
+                "file_name": filename,
+                "width": width,
+                "height": height
+            })
+
+            # Read the corresponding YOLO label file
+            if os.path.exists(label_path):
+                with instrumentation.stage('convert_labels'), open(label_path, "r") as file:
+                    for line in file:
+                        class_id, x_center, y_center, box_width, box_height = map(float, line.strip().split())
+
+                        # Convert normalized YOLO coordinates to absolute COCO format
+                        x_center_abs = x_center * width
+                        y_center_abs = y_center * height
+                        box_width_abs = box_width * width
+                        box_height_abs = box_height * height
+
+                        # Convert YOLO format to COCO format [xmin, ymin, width, height]
+                        xmin = x_center_abs - (box_width_abs / 2)
+                        ymin = y_center_abs - (box_height_abs / 2)
+
+                        # Create annotation entry
+                        annotation = {
+                            "id": annotation_id,
+                            "image_id": image_id,
+                            "category_id": int(class_id),
+                            "bbox": [xmin, ymin, box_width_abs, box_height_abs],
+                            "area": box_width_abs * box_height_abs,
+                            "iscrowd": 0
+                        }
+                        coco_format["annotations"].append(annotation)
+                        annotation_id += 1
+
+    # Save to COCO JSON file
+    with instrumentation.stage('write_json'), open(output_json, "w") as json_file:
+        json.dump(coco_format, json_file, indent=4)
+    instrumentation.count('images', len(coco_format["images"]))
+    instrumentation.count('annotations', len(coco_format["annotations"]))
+
+    return coco_format
+
+if __name__ == '__main__':
+    convert_yolo_to_coco()
+    print(f"COCO format annotations saved to {output_json}")
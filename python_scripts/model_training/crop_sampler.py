@@ -0,0 +1,334 @@
+# This script trains on img_size crops of the full-resolution photos instead of whole photos shrunk to img_size.
+# A 12 MP plantation photo resized to 640 shrinks a small bunch to a few pixels; a 640 crop keeps it at full size,
+# which helps small-object recall without the cost of training at 1280.
+# 1. build_cache decodes every training image once and stores it as a tiled JPEG pyramid: tile_size x tile_size JPEG
+#    tiles of the full image (level 0) and of its half-size copy (level 1), concatenated into one <name>.tiles file with
+#    an offset index (<name>.offsets.npy). A crop only decodes the tiles it overlaps, never the whole photo.
+# 2. Crops are sampled around the labeled boxes: a box is picked (small boxes more often, see small_box_bias) and the
+#    crop is placed at a random position that contains it. background_share of the crops are placed at random where no
+#    box centre lies, so the model still sees plain fronds; zoom_out_share of the crops come from level 1, covering twice
+#    the area for context on large bunches. Labels are clipped to the crop and dropped below min_visibility.
+# 3. CropDataset samples new crops every epoch (set_epoch) for custom PyTorch loops, in the batch layout of
+#    shard_dataset.py. For YOLOv5's train.py, which builds its dataset once per run, materialize writes `rounds`
+#    independent samplings into one crop dataset and train_on_crops divides the epochs by `rounds`, so the model sees
+#    as many different crops as with per-epoch resampling under one uninterrupted learning-rate schedule.
+# Validation stays on the original full images, so mAP is comparable with the other training scripts.
+
+import os
+import sys
+import json
+import math
+import subprocess
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Silence GitPython warnings/errors if Git is not available
+os.environ['GIT_PYTHON_REFRESH'] = 'quiet'
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+from common import yolo_data
+from model_training.shard_dataset import collate_fn
+
+# Define paths and sampling settings
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+data_yaml = r"D:\UniDoc\y2s1\SEGP\dataset\script_testing\yolo_dataset_splited\data.yaml"
+cache_directory = r"D:\UniDoc\y2s1\SEGP\dataset\crop_cache"
+crop_directory = r"D:\UniDoc\y2s1\SEGP\dataset\crop_dataset"
+model = 'yolov5s.pt'
+project_name = 'yolov5_training_project_crops'
+img_size = 640  # Crop side (and training input size)
+tile_size = 256
+tile_quality = 95
+pyramid_levels = 2  # Level 0 is the full image, every further level halves it
+crops_per_image = 4  # Crops sampled from every image per epoch (or per round)
+background_share = 0.2  # Share of the crops placed away from the boxes
+zoom_out_share = 0.15  # Share of the crops taken from level 1 (twice the area at half resolution)
+small_box_bias = 0.5  # Boxes are picked with weight area ** -small_box_bias (0 picks every box equally often)
+min_visibility = 0.4  # Minimum share of a box inside the crop to keep its label
+rounds = 5  # Samplings materialized for train.py
+epochs = 150
+batch_size = 16
+workers = None  # None uses every CPU core
+
+INDEX_NAME = 'index.json'
+
+# Function to build the cache key of an image: a changed file gets new tiles
+def image_key(image_path):
+    stat = os.stat(image_path)
+    return f"{os.path.basename(image_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+# Function to decode one image and write its tiled pyramid; returns the index entry of the image
+def cache_image(task):
+    import cv2
+    image_path, cache_directory, settings = task
+    globals().update(settings)
+    cv2.setNumThreads(1)  # One image per process; OpenCV's own threads would compete with the other workers
+    image = cv2.imread(image_path, cv2.IMREAD_COLOR)  # Applies the EXIF orientation, like YOLOv5's loader
+    if image is None:
+        return None
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    offsets = [0]
+    levels = []
+    with open(os.path.join(cache_directory, stem + '.tiles'), 'wb') as f:
+        for level in range(pyramid_levels):
+            if level:
+                image = cv2.resize(image, (max(1, image.shape[1] // 2), max(1, image.shape[0] // 2)), interpolation=cv2.INTER_AREA)
+            height, width = image.shape[:2]
+            rows, cols = math.ceil(height / tile_size), math.ceil(width / tile_size)
+            levels.append([height, width, rows, cols, len(offsets) - 1])
+            for row in range(rows):
+                for col in range(cols):
+                    tile = image[row * tile_size:(row + 1) * tile_size, col * tile_size:(col + 1) * tile_size]
+                    data = cv2.imencode('.jpg', tile, [cv2.IMWRITE_JPEG_QUALITY, tile_quality])[1]
+                    f.write(data.tobytes())
+                    offsets.append(offsets[-1] + len(data))
+    np.save(os.path.join(cache_directory, stem + '.offsets.npy'), np.array(offsets, dtype=np.int64))
+    return {'path': image_path, 'stem': stem, 'key': image_key(image_path), 'tile_size': tile_size, 'levels': levels}
+
+# Function to read the cache index
+def load_index(cache_directory):
+    path = os.path.join(cache_directory, INDEX_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+# Function to tile every image of a folder that is not cached yet (or has changed)
+def build_cache(image_folder=None, cache_directory=None, workers=None):
+    if image_folder is None:
+        data = yolo_data.load_data_yaml(data_yaml)
+        image_folder = yolo_data.split_images_dir(data, 'train', data_yaml)
+    cache_directory = cache_directory or globals()['cache_directory']
+    workers = workers or globals()['workers'] or os.cpu_count()
+    os.makedirs(cache_directory, exist_ok=True)
+    index = load_index(cache_directory)
+    image_paths = yolo_data.list_images(image_folder)
+    missing = [path for path in image_paths
+               if os.path.basename(path) not in index or index[os.path.basename(path)]['key'] != image_key(path)]
+    print(f"Tile cache: {len(image_paths) - len(missing)} images cached, {len(missing)} to tile")
+    settings = {name: globals()[name] for name in ('tile_size', 'tile_quality', 'pyramid_levels')}
+    with ProcessPoolExecutor(max_workers=workers) as executor, instrumentation.stage('tile_cache'):
+        for path, entry in zip(missing, executor.map(cache_image, [(path, cache_directory, settings) for path in missing])):
+            if entry is None:
+                print(f"Could not read {path}")
+                continue
+            index[os.path.basename(path)] = entry
+    if missing:
+        temp_path = os.path.join(cache_directory, INDEX_NAME + '.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(temp_path, os.path.join(cache_directory, INDEX_NAME))
+    return index
+
+# Function to read a (height, width) region of one pyramid level, decoding only the tiles it overlaps (BGR)
+def read_region(cache_directory, entry, level, x0, y0, width, height):
+    import cv2
+    size = entry['tile_size']
+    _, _, _, cols, first = entry['levels'][level]
+    offsets = np.load(os.path.join(cache_directory, entry['stem'] + '.offsets.npy'), mmap_mode='r')
+    region = np.empty((height, width, 3), dtype=np.uint8)
+    with open(os.path.join(cache_directory, entry['stem'] + '.tiles'), 'rb') as f, instrumentation.stage('decode_tiles'):
+        for row in range(y0 // size, (y0 + height - 1) // size + 1):
+            for col in range(x0 // size, (x0 + width - 1) // size + 1):
+                tile_index = first + row * cols + col
+                f.seek(int(offsets[tile_index]))
+                data = f.read(int(offsets[tile_index + 1] - offsets[tile_index]))
+                tile = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+                # Overlap of the tile and the region, in image coordinates
+                left, top = max(x0, col * size), max(y0, row * size)
+                right, bottom = min(x0 + width, col * size + tile.shape[1]), min(y0 + height, row * size + tile.shape[0])
+                region[top - y0:bottom - y0, left - x0:right - x0] = tile[top - row * size:bottom - row * size,
+                                                                          left - col * size:right - col * size]
+    return region
+
+# Function to pick crop windows (level, x0, y0, width, height) for one image
+def sample_windows(labels, entry, rng, count):
+    windows = []
+    boxes = yolo_data.xywh_to_xyxy(labels[:, 1:5]) if len(labels) else np.zeros((0, 4), dtype=np.float32)
+    areas = np.maximum(labels[:, 3] * labels[:, 4], 1e-6) if len(labels) else None
+    for _ in range(count):
+        level = 1 if len(entry['levels']) > 1 and rng.random() < zoom_out_share else 0
+        height, width = entry['levels'][level][:2]
+        crop_width, crop_height = min(img_size, width), min(img_size, height)
+        if not len(boxes) or rng.random() < background_share:
+            # Background crop: a few tries to find a window without a box centre in it
+            centres = (boxes[:, :2] + boxes[:, 2:]) / 2 * np.array([width, height])
+            for _ in range(10):
+                x0, y0 = int(rng.integers(0, width - crop_width + 1)), int(rng.integers(0, height - crop_height + 1))
+                inside = ((centres[:, 0] >= x0) & (centres[:, 0] < x0 + crop_width) &
+                          (centres[:, 1] >= y0) & (centres[:, 1] < y0 + crop_height))
+                if not inside.any():
+                    break
+        else:
+            weights = areas ** -small_box_bias
+            x1, y1, x2, y2 = boxes[rng.choice(len(boxes), p=weights / weights.sum())] * np.array([width, height, width, height])
+            positions = []
+            for low, high, side, crop_side in ((x2, x1, width, crop_width), (y2, y1, height, crop_height)):
+                # Any offset that keeps the whole box inside the crop; boxes larger than the crop are centred
+                first, last = max(0, math.ceil(low - crop_side)), min(int(high), side - crop_side)
+                if first <= last:
+                    positions.append(int(rng.integers(first, last + 1)))
+                else:
+                    positions.append(int(np.clip((low + high - crop_side) / 2, 0, side - crop_side)))
+            x0, y0 = positions
+        windows.append((level, x0, y0, crop_width, crop_height))
+    return windows
+
+# Function to move normalized labels of the whole image into a crop window, dropping boxes that are mostly outside
+def crop_labels(labels, entry, window):
+    level, x0, y0, crop_width, crop_height = window
+    if not len(labels):
+        return np.zeros((0, 5), dtype=np.float32)
+    height, width = entry['levels'][level][:2]
+    boxes = yolo_data.xywh_to_xyxy(labels[:, 1:5]) * np.array([width, height, width, height], dtype=np.float32)
+    clipped = np.clip(boxes - np.array([x0, y0, x0, y0], dtype=np.float32), 0, [crop_width, crop_height, crop_width, crop_height])
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    clipped_width, clipped_height = clipped[:, 2] - clipped[:, 0], clipped[:, 3] - clipped[:, 1]
+    keep = (clipped_width >= 2) & (clipped_height >= 2) & (clipped_width * clipped_height >= min_visibility * np.maximum(area, 1e-6))
+    clipped = clipped[keep]
+    result = np.empty((len(clipped), 5), dtype=np.float32)
+    result[:, 0] = labels[keep, 0]
+    result[:, 1] = (clipped[:, 0] + clipped[:, 2]) / 2 / crop_width
+    result[:, 2] = (clipped[:, 1] + clipped[:, 3]) / 2 / crop_height
+    result[:, 3] = (clipped[:, 2] - clipped[:, 0]) / crop_width
+    result[:, 4] = (clipped[:, 3] - clipped[:, 1]) / crop_height
+    return result
+
+# Function to load the index entries and labels of every cached image of a folder
+def load_images(image_folder, cache_directory):
+    index = load_index(cache_directory)
+    entries, labels = [], []
+    for path in yolo_data.list_images(image_folder):
+        entry = index.get(os.path.basename(path))
+        if entry is None or entry['key'] != image_key(path):
+            continue
+        entries.append(entry)
+        labels.append(yolo_data.read_labels(yolo_data.label_path_for(path)))
+    return entries, labels
+
+# Dataset that samples new box-aware crops from the tile cache every epoch
+# A DataLoader only needs __len__ and __getitem__, so it does not subclass torch's Dataset and torch stays a lazy import
+class CropDataset:
+    def __init__(self, image_folder, cache_directory, crops_per_image=4, seed=0):
+        self.cache_directory = cache_directory
+        self.crops_per_image = crops_per_image
+        self.seed = seed
+        self.epoch = 0
+        self.entries, self.labels = load_images(image_folder, cache_directory)
+
+    # Call once per epoch so every epoch gets different crops
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return len(self.entries) * self.crops_per_image
+
+    def __getitem__(self, item):
+        import cv2
+        import torch
+        image_index, crop_index = divmod(item, self.crops_per_image)
+        entry, labels = self.entries[image_index], self.labels[image_index]
+        # The windows of an image depend only on the seed, the epoch and the image, so all its crops agree
+        rng = np.random.default_rng([self.seed, self.epoch, image_index])
+        window = sample_windows(labels, entry, rng, self.crops_per_image)[crop_index]
+        crop = cv2.cvtColor(read_region(self.cache_directory, entry, *window), cv2.COLOR_BGR2RGB)
+        crop_label = crop_labels(labels, entry, window)
+        # Crops of images smaller than img_size are letterboxed to it
+        image, ratio, (pad_x, pad_y) = detector.letterbox(crop, (img_size, img_size))
+        crop_label[:, 1] = (crop_label[:, 1] * window[3] * ratio + pad_x) / img_size
+        crop_label[:, 2] = (crop_label[:, 2] * window[4] * ratio + pad_y) / img_size
+        crop_label[:, 3] *= window[3] * ratio / img_size
+        crop_label[:, 4] *= window[4] * ratio / img_size
+        return torch.from_numpy(image).permute(2, 0, 1), torch.from_numpy(crop_label), f"{entry['stem']}:{crop_index}"
+
+# Function to create a DataLoader of box-aware crops (call loader.dataset.set_epoch(epoch) before every epoch)
+def create_dataloader(image_folder, cache_directory, batch_size=16, workers=2, crops_per_image=4, seed=0):
+    import torch
+    from torch.utils.data import DataLoader
+    dataset = CropDataset(image_folder, cache_directory, crops_per_image, seed)
+    return DataLoader(dataset, batch_size=batch_size, shuffle=True, num_workers=workers, collate_fn=collate_fn,
+                      pin_memory=torch.cuda.is_available())
+
+# Function to write the crops of one image for every round; returns the longest side (pixels) of every written box
+def write_image_crops(task):
+    import cv2
+    image_index, entry, labels, cache_directory, images_out, labels_out, rounds, seed = task
+    box_sides = []
+    for round_index in range(rounds):
+        rng = np.random.default_rng([seed, round_index, image_index])
+        for crop_index, window in enumerate(sample_windows(labels, entry, rng, crops_per_image)):
+            name = f"{entry['stem']}_r{round_index}_c{crop_index}"
+            cv2.imwrite(os.path.join(images_out, name + '.jpg'), read_region(cache_directory, entry, *window),
+                        [cv2.IMWRITE_JPEG_QUALITY, tile_quality])
+            crop_label = crop_labels(labels, entry, window)
+            yolo_data.write_labels(os.path.join(labels_out, name + '.txt'), crop_label)
+            box_sides.extend(np.maximum(crop_label[:, 3] * window[3], crop_label[:, 4] * window[4]).tolist())
+    return box_sides
+
+# Function to write `rounds` samplings of crops into a YOLO dataset (validated on the original val split)
+def materialize(cache_directory=None, crop_directory=None, rounds=None, seed=0):
+    cache_directory = cache_directory or globals()['cache_directory']
+    crop_directory = crop_directory or globals()['crop_directory']
+    rounds = rounds or globals()['rounds']
+    data = yolo_data.load_data_yaml(data_yaml)
+    image_folder = yolo_data.split_images_dir(data, 'train', data_yaml)
+    build_cache(image_folder, cache_directory)
+    entries, labels = load_images(image_folder, cache_directory)
+
+    # Rebuild the train folders from scratch so crops of an earlier sampling do not stay behind
+    images_out = os.path.join(crop_directory, 'images', 'train')
+    labels_out = os.path.join(crop_directory, 'labels', 'train')
+    for folder in (images_out, labels_out):
+        os.makedirs(folder, exist_ok=True)
+        for name in os.listdir(folder):
+            os.remove(os.path.join(folder, name))
+    tasks = [(i, entry, label, cache_directory, images_out, labels_out, rounds, seed) for i, (entry, label) in enumerate(zip(entries, labels))]
+    box_sides = []
+    # cv2 releases the GIL while decoding and encoding, so threads are enough here
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor, instrumentation.stage('write_crops'):
+        for sides in executor.map(write_image_crops, tasks):
+            box_sides.extend(sides)
+
+    crop_data = dict(data)
+    crop_data['path'] = crop_directory
+    crop_data['train'] = images_out
+    crop_data['val'] = yolo_data.split_images_dir(data, 'val', data_yaml)
+    crop_yaml = os.path.join(crop_directory, 'data.yaml')
+    yolo_data.write_data_yaml(crop_yaml, crop_data)
+
+    # Box sizes the model sees: whole images shrunk to img_size against the crops
+    whole_sides = []
+    for entry, label in zip(entries, labels):
+        height, width = entry['levels'][0][:2]
+        scale = img_size / max(height, width)
+        whole_sides.extend(np.maximum(label[:, 3] * width, label[:, 4] * height) * scale)
+    for title, sides in (('Whole images', whole_sides), ('Crops', box_sides)):
+        if len(sides):
+            sides = np.array(sides)
+            print(f"{title}: median box side {np.median(sides):.0f} px, {np.mean(sides < 16) * 100:.1f}% of boxes under 16 px")
+    print(f"Wrote {len(entries) * rounds * crops_per_image} crops ({rounds} rounds) to {crop_directory}")
+    return crop_yaml
+
+# Function to train YOLOv5 on the materialized crops using CLI
+def train_on_crops(crop_yaml=None):
+    import torch
+    crop_yaml = crop_yaml or os.path.join(crop_directory, 'data.yaml')
+    command = [
+        sys.executable, os.path.join(yolov5_directory, 'train.py'),
+        '--img', str(img_size),
+        '--batch-size', str(batch_size),
+        '--epochs', str(math.ceil(epochs / rounds)),  # Every epoch already holds `rounds` samplings
+        '--data', crop_yaml,
+        '--weights', model,
+        '--project', os.path.abspath(project_name),
+        '--device', '0' if torch.cuda.is_available() else 'cpu',
+        '--cache',  # Cache dataset for faster training
+        '--workers', '2'
+    ]
+    subprocess.run(command, cwd=yolov5_directory)
+
+if __name__ == '__main__':
+    train_on_crops(materialize())
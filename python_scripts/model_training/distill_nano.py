@@ -0,0 +1,283 @@
+# This script distills the YOLOv5 Large model (yolo5_large.py) into the YOLOv5 Nano model used by the app.
+# 1. The large teacher runs once over the training images and its detections are cached on disk as compact float16
+#    arrays (one concatenated array plus per-image offsets, keyed by image name, size and modification time).
+#    Later runs only run the teacher on images that are new or changed.
+# 2. The nano student is trained in its own loop (the pattern of prune_model.fine_tune). Every batch adds two losses:
+#    YOLOv5's ComputeLoss against the ground truth, and distill_weight times a loss against the cached teacher outputs:
+#    the objectness of the cells a teacher box is assigned to is pulled towards the teacher's confidence, and the
+#    predicted box and class towards the teacher's, weighted by that confidence.
+#    The teacher was trained on this same split, so its boxes that disagree with the labels are mostly false positives;
+#    they are never written as labels, they only enter as soft targets at the teacher's (low) confidence.
+#    Augmentation is off: the cached boxes only line up with the plain letterboxed images.
+# 3. Every epoch is validated with val.py's run(); the best epoch is saved as <project_name>/<run>/weights/best.pt and
+#    evaluated on the original val split with val.py.
+# The teacher does not run during training, so each epoch costs about the same as normal nano training.
+
+import os
+import sys
+import json
+import time
+import subprocess
+import numpy as np
+from copy import deepcopy
+
+# Silence GitPython warnings/errors if Git is not available
+os.environ['GIT_PYTHON_REFRESH'] = 'quiet'
+# Set CUDA module loading to lazy to prevent DLL initialization issues
+os.environ["CUDA_MODULE_LOADING"] = "LAZY"
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+from common import yolo_data
+
+# Define training parameters
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+data_yaml = r"D:\UniDoc\y2s1\SEGP\dataset\script_testing\yolo_dataset_splited\data.yaml"  # Path to the dataset configuration file
+teacher_weights = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_large\exp\weights\best.pt"  # Trained YOLOv5 Large
+model = 'yolov5n.pt'  # YOLOv5 Nano pre-trained student
+epochs = 150  # Number of epochs for training
+batch_size = 16  # Set batch size based on GPU memory capacity
+img_size = 640
+project_name = 'yolov5_training_project_distill'  # Name of the project for saving results
+distill_directory = r"D:\UniDoc\y2s1\SEGP\dataset\script_testing\distill_dataset"  # Teacher cache
+
+# Teacher settings
+teacher_conf = 0.1  # Teacher boxes above this are cached and used as soft targets
+teacher_batch_size = 8
+distill_weight = 1.0  # Weight of the teacher loss against the ground truth loss
+
+CACHE_NAME = 'teacher_cache.npz'
+
+# Function to build the cache key of an image: a changed file gets new teacher outputs
+def image_key(image_path):
+    stat = os.stat(image_path)
+    return f"{os.path.basename(image_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+# Function to load the teacher cache as {key: (n, 6) float16 array [cx, cy, w, h, conf, cls], normalized}
+def load_teacher_cache(cache_path):
+    if not os.path.exists(cache_path):
+        return {}
+    with np.load(cache_path) as cache:
+        keys, offsets, boxes = cache['keys'], cache['offsets'], cache['boxes']
+    return {str(key): boxes[offsets[i]:offsets[i + 1]] for i, key in enumerate(keys)}
+
+# Function to save the teacher cache as one concatenated float16 array with per-image offsets
+def save_teacher_cache(cache_path, outputs):
+    keys = sorted(outputs)
+    counts = [len(outputs[key]) for key in keys]
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    boxes = np.concatenate([outputs[key] for key in keys]) if keys else np.zeros((0, 6))
+    temp_path = cache_path + '.tmp.npz'
+    np.savez(temp_path, keys=np.array(keys), offsets=offsets, boxes=boxes.astype(np.float16))
+    os.replace(temp_path, cache_path)
+
+# Function to run the teacher on every training image that is not cached yet
+def cache_teacher_outputs(image_paths, cache_path, teacher=None):
+    cached = load_teacher_cache(cache_path)
+    keys = [image_key(path) for path in image_paths]
+    missing = [(path, key) for path, key in zip(image_paths, keys) if key not in cached]
+    print(f"Teacher cache: {len(image_paths) - len(missing)} of {len(image_paths)} images cached, {len(missing)} to run")
+
+    if missing:
+        teacher = teacher or detector.load_raw_model(teacher_weights, yolov5_directory)
+        for i in range(0, len(missing), teacher_batch_size):
+            batch = missing[i:i + teacher_batch_size]
+            with instrumentation.stage('teacher'):
+                results, shapes = detector.detect_batch(teacher, [path for path, _ in batch], img_size, teacher_conf)
+            for (_, key), detections, (height, width) in zip(batch, results, shapes):
+                x1, y1, x2, y2, conf, cls = detections.T
+                cached[key] = np.column_stack([(x1 + x2) / 2 / width, (y1 + y2) / 2 / height,
+                                               (x2 - x1) / width, (y2 - y1) / height, conf, cls]).astype(np.float16)
+            print(f"Teacher processed {min(i + teacher_batch_size, len(missing))} of {len(missing)} images")
+        # Drop the entries of images that no longer exist or changed
+        save_teacher_cache(cache_path, {key: cached[key] for key in keys})
+    return {path: cached[key] for path, key in zip(image_paths, keys)}
+
+# Function to make the YOLOv5 repository importable (checkpoints pickle its model classes)
+def add_yolov5_to_path():
+    if yolov5_directory not in sys.path:
+        sys.path.insert(0, yolov5_directory)
+
+# Function to run the teacher on the training images that are not cached yet, returns the cache path
+def cache_teacher(data_yaml=None, distill_directory=None):
+    data_yaml = data_yaml or globals()['data_yaml']
+    distill_directory = distill_directory or globals()['distill_directory']
+    data = yolo_data.load_data_yaml(data_yaml)
+    image_paths = yolo_data.list_images(yolo_data.split_images_dir(data, 'train', data_yaml))
+    os.makedirs(distill_directory, exist_ok=True)
+    cache_path = os.path.join(distill_directory, CACHE_NAME)
+    outputs = cache_teacher_outputs(image_paths, cache_path)
+    with open(os.path.join(distill_directory, 'distill_summary.json'), 'w') as f:
+        json.dump({'images': len(image_paths), 'teacher_boxes': int(sum(len(boxes) for boxes in outputs.values())),
+                   'teacher_conf': teacher_conf}, f, indent=4)
+    return cache_path
+
+# Function to build the student: the pretrained checkpoint's architecture with the dataset's class count, loading every
+# pretrained weight whose shape still fits (what train.py does with --weights)
+def load_student(nc, device):
+    import torch
+    add_yolov5_to_path()
+    from models.yolo import Model
+    from utils.downloads import attempt_download
+    from utils.general import intersect_dicts
+    checkpoint = torch.load(attempt_download(model), map_location='cpu', weights_only=False)
+    pretrained = checkpoint['model'].float()
+    student = Model(pretrained.yaml, ch=3, nc=nc)
+    state = intersect_dicts(pretrained.state_dict(), student.state_dict(), exclude=['anchor'])
+    student.load_state_dict(state, strict=False)
+    print(f"Student: {len(state)} of {len(student.state_dict())} weights loaded from {model}")
+    return student.to(device)
+
+# Function to turn the cached teacher outputs of a batch into targets [image, cls, cx, cy, w, h, conf], normalized to
+# the letterboxed input like YOLOv5's own labels
+def teacher_targets(cached, paths, shapes, input_shape):
+    input_height, input_width = input_shape
+    rows = []
+    for i, (path, ((height, width), ((ratio_y, ratio_x), (pad_x, pad_y)))) in enumerate(zip(paths, shapes)):
+        boxes = cached.get(image_key(path))
+        if boxes is None or not len(boxes):
+            continue
+        boxes = boxes.astype(np.float32)
+        rows.append(np.column_stack([np.full(len(boxes), i), boxes[:, 5],
+                                     (boxes[:, 0] * width * ratio_x + pad_x) / input_width,
+                                     (boxes[:, 1] * height * ratio_y + pad_y) / input_height,
+                                     boxes[:, 2] * width * ratio_x / input_width,
+                                     boxes[:, 3] * height * ratio_y / input_height, boxes[:, 4]]))
+    return np.concatenate(rows).astype(np.float32) if rows else np.zeros((0, 7), dtype=np.float32)
+
+# Function to compute the IoU of matching rows of two xywh box tensors
+def xywh_iou(boxes1, boxes2):
+    import torch
+    inter_w = (torch.min(boxes1[:, 0] + boxes1[:, 2] / 2, boxes2[:, 0] + boxes2[:, 2] / 2)
+               - torch.max(boxes1[:, 0] - boxes1[:, 2] / 2, boxes2[:, 0] - boxes2[:, 2] / 2)).clamp(0)
+    inter_h = (torch.min(boxes1[:, 1] + boxes1[:, 3] / 2, boxes2[:, 1] + boxes2[:, 3] / 2)
+               - torch.max(boxes1[:, 1] - boxes1[:, 3] / 2, boxes2[:, 1] - boxes2[:, 3] / 2)).clamp(0)
+    inter = inter_w * inter_h
+    return inter / (boxes1[:, 2] * boxes1[:, 3] + boxes2[:, 2] * boxes2[:, 3] - inter + 1e-7)
+
+# Function to compute the loss against the teacher targets, scaled like ComputeLoss (hyp gains, times batch size)
+# The teacher boxes are assigned to anchors and cells by ComputeLoss.build_targets; their row index is passed in the
+# class column, so every match can be traced back to its teacher box, class and confidence
+def teacher_loss(compute_loss, predictions, targets, hyp):
+    import torch
+    import torch.nn.functional as F
+    device = predictions[0].device
+    conf, classes = targets[:, 6], targets[:, 1].long()
+    indexed = torch.cat([targets[:, :1], torch.arange(len(targets), device=device, dtype=torch.float32)[:, None], targets[:, 2:6]], 1)
+    source, tbox, indices, anchors = compute_loss.build_targets(predictions, indexed)
+    lbox, lobj, lcls = torch.zeros(1, device=device), torch.zeros(1, device=device), torch.zeros(1, device=device)
+    for i, p in enumerate(predictions):
+        b, a, gj, gi = indices[i]
+        tobj = torch.zeros_like(p[..., 4])
+        if len(b):
+            weight = conf[source[i]]
+            ps = p[b, a, gj, gi]
+            pxy = ps[:, :2].sigmoid() * 2 - 0.5
+            pwh = (ps[:, 2:4].sigmoid() * 2) ** 2 * anchors[i]
+            lbox += (weight * (1 - xywh_iou(torch.cat([pxy, pwh], 1), tbox[i]))).sum() / weight.sum()
+            # Objectness target: the teacher's confidence instead of 1
+            tobj[b, a, gj, gi] = weight.to(tobj.dtype)
+            if p.shape[-1] > 6:  # Class loss only with more than one class, as in ComputeLoss
+                tcls = F.one_hot(classes[source[i]], p.shape[-1] - 5).float()
+                lcls += (F.binary_cross_entropy_with_logits(ps[:, 5:], tcls, reduction='none').mean(1) * weight).sum() / weight.sum()
+        lobj += F.binary_cross_entropy_with_logits(p[..., 4], tobj) * compute_loss.balance[i]
+    return (lbox * hyp['box'] + lobj * hyp['obj'] + lcls * hyp['cls']) * predictions[0].shape[0]
+
+# Function to validate the student with val.py's run(), returns (mAP@0.5, mAP@0.5:0.95)
+def validate_student(student, data, val_loader):
+    import val as validate
+    with instrumentation.stage('validate'):
+        results, _, _ = validate.run(data=data, batch_size=batch_size * 2, imgsz=img_size, model=student.eval(),
+                                     dataloader=val_loader, half=False, plots=False)
+    return results[2], results[3]
+
+# Function to save the student in the checkpoint format detect.py, val.py and export.py load
+def save_checkpoint(student, path, epoch):
+    import torch
+    torch.save({'model': deepcopy(student).half(), 'epoch': epoch, 'optimizer': None, 'ema': None}, path)
+
+# Function to train the nano student on the ground truth plus the cached teacher outputs, returns the best.pt path
+def train_student(cache_path=None):
+    import torch
+    cache_path = cache_path or os.path.join(distill_directory, CACHE_NAME)
+    add_yolov5_to_path()
+    from utils.dataloaders import create_dataloader
+    from utils.general import check_dataset
+    from utils.loss import ComputeLoss
+    device = detector.get_device()
+    data = check_dataset(data_yaml)
+    hyp = yolo_data.load_data_yaml(os.path.join(yolov5_directory, 'data', 'hyps', 'hyp.scratch-low.yaml'))
+    # Loss gains scaled to the class count and input size, as train.py does
+    hyp['cls'] *= int(data['nc']) / 80
+    hyp['obj'] *= (img_size / 640) ** 2
+    student = load_student(int(data['nc']), device)
+    student.nc, student.names, student.hyp = int(data['nc']), data['names'], hyp
+    cached = load_teacher_cache(cache_path)
+
+    stride = max(int(student.stride.max()), 32)
+    workers = 0 if device == 'cpu' else 2
+    train_loader = create_dataloader(data['train'], img_size, batch_size, stride, hyp=hyp, augment=False,
+                                     workers=workers, prefix='train: ', shuffle=True)[0]
+    val_loader = create_dataloader(data['val'], img_size, batch_size * 2, stride, rect=True, pad=0.5,
+                                   workers=workers, prefix='val: ')[0]
+
+    compute_loss = ComputeLoss(student)
+    optimizer = torch.optim.SGD(student.parameters(), lr=hyp['lr0'], momentum=hyp['momentum'], nesterov=True)
+    # Linear decay from lr0 to lr0 * lrf over the run, like train.py
+    scheduler = torch.optim.lr_scheduler.LambdaLR(optimizer, lambda epoch: (1 - epoch / epochs) * (1 - hyp['lrf']) + hyp['lrf'])
+    run_directory = os.path.join(project_name, 'distill_' + time.strftime('%Y%m%d_%H%M%S'))
+    os.makedirs(os.path.join(run_directory, 'weights'), exist_ok=True)
+    best_path = os.path.join(run_directory, 'weights', 'best.pt')
+    best, history = -1.0, []
+    for epoch in range(epochs):
+        student.train()
+        totals = np.zeros(2)
+        for images, targets, paths, shapes in train_loader:
+            images = images.to(device).float() / 255.0
+            teacher = torch.from_numpy(teacher_targets(cached, paths, shapes, images.shape[2:])).to(device)
+            with instrumentation.stage('distill_step'):
+                predictions = student(images)
+                ground_truth_loss, _ = compute_loss(predictions, targets.to(device))
+                distill_loss = teacher_loss(compute_loss, predictions, teacher, hyp)
+                loss = ground_truth_loss + distill_weight * distill_loss
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+            totals += [ground_truth_loss.item(), distill_loss.item()]
+        scheduler.step()
+        map50, map50_95 = validate_student(student, data, val_loader)
+        totals /= max(len(train_loader), 1)
+        history.append({'epoch': epoch + 1, 'ground_truth_loss': totals[0], 'teacher_loss': totals[1],
+                        'map50': map50, 'map50_95': map50_95})
+        print(f"Epoch {epoch + 1}/{epochs}: ground truth loss {totals[0]:.4f}, teacher loss {totals[1]:.4f}, "
+              f"mAP@0.5 {map50:.3f}, mAP@0.5:0.95 {map50_95:.3f}")
+        save_checkpoint(student, os.path.join(run_directory, 'weights', 'last.pt'), epoch)
+        # Best epoch by the fitness train.py uses: 0.1 * mAP@0.5 + 0.9 * mAP@0.5:0.95
+        if 0.1 * map50 + 0.9 * map50_95 > best:
+            best = 0.1 * map50 + 0.9 * map50_95
+            save_checkpoint(student, best_path, epoch)
+        with open(os.path.join(run_directory, 'distill_history.json'), 'w') as f:
+            json.dump(history, f, indent=1)
+    return best_path
+
+# Function to evaluate the student on the original val split using CLI
+def evaluate_student(weights):
+    command = [
+        sys.executable, os.path.join(yolov5_directory, 'val.py'),
+        '--weights', weights,
+        '--data', data_yaml,
+        '--img', str(img_size),
+        '--batch-size', str(batch_size),
+        '--device', detector.cli_device(),
+    ]
+    subprocess.run(command)
+
+if __name__ == '__main__':
+    weights = train_student(cache_teacher())
+    if os.path.exists(weights):
+        evaluate_student(weights)
+    else:
+        print("Error: No weights file found for evaluation.")
+    print("Distillation training and evaluation completed!")
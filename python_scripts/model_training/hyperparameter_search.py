@@ -0,0 +1,310 @@
+# This script searches training settings (model, image size, batch size and hyperparameters such as lr0) for the
+# YOLOv5 training scripts (yolo5_*.py) or YOLOv8 (yolov8s_training.py) instead of guessing them.
+# Trials are sampled from search_space and trained as separate train.py processes, max_parallel at a time, with the
+# CPU cores split between them (cpu_budget). Every trial is launched for max_epochs, but is stopped early ASHA-style:
+# at every rung (min_epochs, min_epochs * eta, ...) its best val mAP@0.5 so far (read from the run's results.csv) is
+# compared with all trials that reached the same rung, and only the top 1/eta continue. Most poor configurations are
+# therefore stopped after a few epochs, and the compute goes to the promising ones.
+# Trials, their state and rung results are kept in a SQLite database in the search folder. Running the search again
+# resumes it: interrupted trials continue from their last.pt and finished trials are not repeated.
+# At the end the trials are ranked and the best configurations are written to summary.json.
+
+import os
+import sys
+import csv
+import json
+import math
+import time
+import random
+import sqlite3
+import subprocess
+
+# Silence GitPython warnings/errors if Git is not available
+os.environ['GIT_PYTHON_REFRESH'] = 'quiet'
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+from common import yolo_data
+
+# Define search parameters
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+data_yaml = r"D:\UniDoc\y2s1\SEGP\dataset\script_testing\yolo_dataset_splited\data.yaml"
+framework = 'yolov5'  # 'yolov5' (train.py) or 'yolov8' (ultralytics)
+search_directory = 'hyperparameter_search'
+search_space = {
+    'model': ['yolov5n.pt', 'yolov5s.pt'],
+    'img_size': [320, 416, 512, 640],
+    'batch_size': [8, 16, 32],
+    # Training hyperparameters: a list is sampled as a choice, ('log', low, high) log-uniformly, (low, high) uniformly
+    'lr0': ('log', 0.001, 0.05),
+    'momentum': (0.85, 0.95),
+    'mosaic': [0.5, 1.0],
+}
+n_trials = 24
+max_epochs = 150
+min_epochs = 5  # First rung
+eta = 3  # Keep the top 1/eta at every rung
+max_parallel = 2  # Trials trained at the same time
+cpu_budget = None  # CPU cores shared by the trials (None uses every core)
+poll_seconds = 30
+seed = 0
+
+RUN_SETTINGS = ('model', 'img_size', 'batch_size')
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY,
+    config TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    pid INTEGER,
+    epochs_done INTEGER NOT NULL DEFAULT 0,
+    best_map REAL,
+    started REAL,
+    finished REAL,
+    note TEXT
+);
+CREATE TABLE IF NOT EXISTS rungs (
+    rung INTEGER NOT NULL,
+    trial_id INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (rung, trial_id)
+);
+"""
+
+# Function to open the trial database
+def connect(search_directory):
+    os.makedirs(search_directory, exist_ok=True)
+    connection = sqlite3.connect(os.path.join(search_directory, 'trials.sqlite'), isolation_level=None)
+    connection.executescript(SCHEMA)
+    return connection
+
+# Function to draw one configuration from the search space
+def sample_config(rng):
+    config = {}
+    for name, space in search_space.items():
+        if isinstance(space, list):
+            config[name] = rng.choice(space)
+        elif space[0] == 'log':
+            config[name] = round(10 ** rng.uniform(math.log10(space[1]), math.log10(space[2])), 6)
+        else:
+            config[name] = round(rng.uniform(*space), 4)
+    return config
+
+# Function to add trials until the database holds n_trials
+def plan_trials(connection):
+    existing = connection.execute("SELECT COUNT(*) FROM trials").fetchone()[0]
+    rng = random.Random(seed + existing)
+    for _ in range(existing, n_trials):
+        connection.execute("INSERT INTO trials (config) VALUES (?)", (json.dumps(sample_config(rng)),))
+    return n_trials - existing if existing < n_trials else 0
+
+# Function to get the rung epochs: min_epochs, min_epochs * eta, ... below max_epochs
+def rung_epochs():
+    rungs, epochs = [], min_epochs
+    while epochs < max_epochs:
+        rungs.append(epochs)
+        epochs *= eta
+    return rungs
+
+# Function to find the folder of a trial's training run
+def trial_directory(search_directory, trial_id):
+    return os.path.join(os.path.abspath(search_directory), 'runs', f'trial_{trial_id:04d}')
+
+# Function to write the hyperparameter file of a YOLOv5 trial: the default hyp file with the sampled values
+def write_hyp(run_directory, config):
+    hyp = yolo_data.load_data_yaml(os.path.join(yolov5_directory, 'data', 'hyps', 'hyp.scratch-low.yaml'))
+    hyp.update({name: value for name, value in config.items() if name not in RUN_SETTINGS})
+    path = os.path.join(run_directory, 'hyp.yaml')
+    yolo_data.write_data_yaml(path, hyp)
+    return path
+
+# Function to build the training command of a trial (resume continues an interrupted run from its last.pt)
+def trial_command(config, run_directory, resume, workers):
+    last_weights = os.path.join(run_directory, 'weights', 'last.pt')
+    if framework == 'yolov8':
+        entrypoint = 'from ultralytics.cfg import entrypoint; entrypoint()'
+        if resume:
+            return [sys.executable, '-c', entrypoint, 'detect', 'train', 'resume', f'model={last_weights}']
+        hyp = [f'{name}={value}' for name, value in config.items() if name not in RUN_SETTINGS]
+        return [sys.executable, '-c', entrypoint, 'detect', 'train', f'data={data_yaml}', f"model={config['model']}",
+                f'epochs={max_epochs}', f"imgsz={config['img_size']}", f"batch={config['batch_size']}",
+                f'device={detector.cli_device()}', f'workers={workers}', f'project={os.path.dirname(run_directory)}',
+                f'name={os.path.basename(run_directory)}', 'exist_ok=True', 'plots=False'] + hyp
+
+    train_script = os.path.join(yolov5_directory, 'train.py')
+    if resume:
+        return [sys.executable, train_script, '--resume', last_weights]
+    os.makedirs(run_directory, exist_ok=True)
+    return [
+        sys.executable, train_script,
+        '--img', str(config['img_size']),
+        '--batch-size', str(config['batch_size']),
+        '--epochs', str(max_epochs),
+        '--data', data_yaml,
+        '--weights', config['model'],
+        '--hyp', write_hyp(run_directory, config),
+        '--project', os.path.dirname(run_directory),
+        '--name', os.path.basename(run_directory),
+        '--exist-ok',
+        '--device', detector.cli_device(),
+        '--workers', str(workers),
+        '--noplots',
+    ]
+
+# Function to read the val mAP@0.5 of every finished epoch from a run's results.csv
+def read_map_history(run_directory):
+    path = os.path.join(run_directory, 'results.csv')
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', newline='') as f:
+        rows = [{key.strip(): value.strip() for key, value in row.items() if key} for row in csv.DictReader(f)]
+    if not rows:
+        return []
+    # YOLOv5 writes metrics/mAP_0.5, YOLOv8 metrics/mAP50(B)
+    column = next((key for key in rows[0] if key in ('metrics/mAP_0.5', 'metrics/mAP50(B)')), None)
+    return [float(row[column]) for row in rows if column and row.get(column)]
+
+# Function to decide whether a trial continues past a rung: it must be in the top 1/eta of the rung so far
+def passes_rung(connection, rung, trial_id, value):
+    connection.execute("INSERT OR REPLACE INTO rungs VALUES (?, ?, ?)", (rung, trial_id, value))
+    values = sorted((row[0] for row in connection.execute("SELECT value FROM rungs WHERE rung = ?", (rung,))), reverse=True)
+    keep = max(1, len(values) // eta)
+    # The first trials at a rung have nothing to compare against and continue
+    return len(values) < eta or value >= values[keep - 1]
+
+# Function to stop a trial process and wait for it
+def stop_process(process):
+    process.terminate()
+    try:
+        process.wait(timeout=60)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+# Function to stop a trial process left running by an earlier, interrupted search
+def stop_stale_process(pid, run_directory):
+    try:
+        import psutil
+        process = psutil.Process(pid)
+        if any(run_directory in part for part in process.cmdline()):
+            process.terminate()
+            process.wait(timeout=60)
+    except Exception:
+        pass
+
+# Function to launch one trial
+def launch_trial(connection, search_directory, trial_id, config, resume, threads, workers):
+    run_directory = trial_directory(search_directory, trial_id)
+    os.makedirs(run_directory, exist_ok=True)
+    environment = dict(os.environ, OMP_NUM_THREADS=str(threads), MKL_NUM_THREADS=str(threads))
+    log = open(os.path.join(run_directory, 'train.log'), 'a')
+    process = subprocess.Popen(trial_command(config, run_directory, resume, workers), cwd=yolov5_directory,
+                               stdout=log, stderr=subprocess.STDOUT, env=environment)
+    log.close()
+    connection.execute("UPDATE trials SET status = 'running', pid = ?, started = COALESCE(started, ?) WHERE id = ?",
+                       (process.pid, time.time(), trial_id))
+    print(f"Trial {trial_id} {'resumed' if resume else 'started'}: {config}")
+    return process
+
+# Function to record the progress of a running trial; returns False if the trial must stop at a rung
+def check_trial(connection, trial_id, run_directory, rungs):
+    history = read_map_history(run_directory)
+    if not history:
+        return True
+    connection.execute("UPDATE trials SET epochs_done = ?, best_map = ? WHERE id = ?", (len(history), max(history), trial_id))
+    recorded = {row[0] for row in connection.execute("SELECT rung FROM rungs WHERE trial_id = ?", (trial_id,))}
+    for rung in rungs:
+        if rung <= len(history) and rung not in recorded:
+            value = max(history[:rung])
+            if not passes_rung(connection, rung, trial_id, value):
+                connection.execute("UPDATE trials SET status = 'stopped', finished = ?, note = ? WHERE id = ?",
+                                   (time.time(), f"stopped at epoch {rung} (mAP@0.5 {value:.4f})", trial_id))
+                return False
+    return True
+
+# Function to run (or resume) the search until every trial is finished or stopped
+def run_search(search_directory=None, max_parallel=None):
+    search_directory = search_directory or globals()['search_directory']
+    max_parallel = max_parallel or globals()['max_parallel']
+    connection = connect(search_directory)
+    added = plan_trials(connection)
+    cores = cpu_budget or os.cpu_count() or 1
+    threads = max(1, cores // max_parallel)
+    workers = max(1, min(4, threads // 2))
+    rungs = rung_epochs()
+    print(f"{added} new trials planned; rungs at epochs {rungs}, up to {max_epochs} epochs; "
+          f"{max_parallel} trials at a time with {threads} threads each")
+
+    # Trials that were running when the search was interrupted continue from their last checkpoint
+    interrupted = connection.execute("SELECT id, pid FROM trials WHERE status = 'running'").fetchall()
+    for trial_id, pid in interrupted:
+        stop_stale_process(pid, trial_directory(search_directory, trial_id))
+    queue = [(trial_id, True) for trial_id, _ in interrupted]
+    queue += [(row[0], False) for row in connection.execute("SELECT id FROM trials WHERE status = 'pending' ORDER BY id")]
+
+    running = {}
+    start = time.perf_counter()
+    try:
+        with instrumentation.stage('hyperparameter_search'):
+            while queue or running:
+                while queue and len(running) < max_parallel:
+                    trial_id, resume = queue.pop(0)
+                    config = json.loads(connection.execute("SELECT config FROM trials WHERE id = ?", (trial_id,)).fetchone()[0])
+                    if resume and not os.path.exists(os.path.join(trial_directory(search_directory, trial_id), 'weights', 'last.pt')):
+                        resume = False
+                    running[trial_id] = launch_trial(connection, search_directory, trial_id, config, resume, threads, workers)
+                time.sleep(poll_seconds)
+
+                for trial_id, process in list(running.items()):
+                    run_directory = trial_directory(search_directory, trial_id)
+                    if not check_trial(connection, trial_id, run_directory, rungs):
+                        stop_process(process)
+                        del running[trial_id]
+                        print(f"Trial {trial_id} stopped early")
+                        continue
+                    if process.poll() is not None:
+                        check_trial(connection, trial_id, run_directory, rungs)
+                        status = 'completed' if process.returncode == 0 else 'failed'
+                        connection.execute("UPDATE trials SET status = ?, finished = ?, note = ? WHERE id = ?",
+                                           (status, time.time(), None if status == 'completed' else f"exit code {process.returncode}", trial_id))
+                        del running[trial_id]
+                        print(f"Trial {trial_id} {status}")
+    except KeyboardInterrupt:
+        # Trials stay 'running' in the database and are resumed by the next run
+        print("Interrupted; stopping the running trials. Run the search again to resume.")
+        for process in running.values():
+            stop_process(process)
+
+    elapsed = time.perf_counter() - start
+    print(f"Search ran for {elapsed / 60:.1f} min")
+    return summarize(search_directory)
+
+# Function to rank the trials, print the best ones and write summary.json
+def summarize(search_directory=None, top=5):
+    search_directory = search_directory or globals()['search_directory']
+    connection = connect(search_directory)
+    trials = []
+    for trial_id, config, status, epochs_done, best_map, note in connection.execute(
+            "SELECT id, config, status, epochs_done, best_map, note FROM trials ORDER BY id"):
+        trials.append({'trial': trial_id, 'status': status, 'epochs': epochs_done, 'best_map50': best_map,
+                       'config': json.loads(config), 'note': note,
+                       'weights': os.path.join(trial_directory(search_directory, trial_id), 'weights', 'best.pt')})
+    # Trials that ran longer count more: a high mAP after 5 epochs says less than one after 150
+    ranked = sorted((t for t in trials if t['best_map50'] is not None), key=lambda t: (t['epochs'], t['best_map50']), reverse=True)
+
+    counts = {}
+    for trial in trials:
+        counts[trial['status']] = counts.get(trial['status'], 0) + 1
+    total_epochs = sum(t['epochs'] for t in trials)
+    print(f"\nTrials: {counts}. {total_epochs} epochs trained in total "
+          f"({total_epochs / max(len(trials) * max_epochs, 1):.0%} of training every trial to {max_epochs} epochs)")
+    print(f"{'trial':>6}{'status':>11}{'epochs':>8}{'mAP@.5':>8}  config")
+    for trial in ranked[:top]:
+        print(f"{trial['trial']:>6}{trial['status']:>11}{trial['epochs']:>8}{trial['best_map50']:>8.4f}  {trial['config']}")
+    with open(os.path.join(search_directory, 'summary.json'), 'w') as f:
+        json.dump({'best': ranked[:top], 'trials': trials}, f, indent=4)
+    return ranked[:top]
+
+if __name__ == '__main__':
+    run_search()
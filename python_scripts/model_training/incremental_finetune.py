@@ -0,0 +1,329 @@
+# This script refreshes the current model with newly labeled images instead of retraining it from yolov5s.pt.
+# 1. A replay buffer of replay_size images is chosen from the existing training split, so the model keeps what it
+#    learned on the old data:
+#      'diversity'  k-center greedy selection on backbone embeddings (global-average-pooled features of the current
+#                   model), which covers the old data as evenly as possible; embeddings are cached per image
+#      'loss'       the old images with the highest YOLOv5 loss under the current model
+# 2. An incremental dataset is built from the new images plus the replay buffer (images are hard-linked), validated
+#    on the original val split.
+# 3. YOLOv5's train.py fine-tunes from the current best.pt with a lower learning rate and stops early once val
+#    metrics stop improving for `patience` epochs.
+# 4. The new images are added to the training split (merge_new), so the next refresh can replay them.
+# Every refresh is appended to incremental_log.jsonl with its wall-clock time, epochs, best mAP and the time a full
+# retrain would take (measured by log_full_retrain(), or estimated from this run's time per image-epoch).
+
+import os
+import sys
+import json
+import time
+import datetime
+import subprocess
+import numpy as np
+
+# Silence GitPython warnings/errors if Git is not available
+os.environ['GIT_PYTHON_REFRESH'] = 'quiet'
+# Set CUDA module loading to lazy to prevent DLL initialization issues
+os.environ["CUDA_MODULE_LOADING"] = "LAZY"
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+from common import yolo_data
+
+# Define training parameters
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+data_yaml = r"D:\UniDoc\y2s1\SEGP\dataset\script_testing\yolo_dataset_splited\data.yaml"  # Existing dataset
+weights_path = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_small\exp12\weights\best.pt"  # Current model
+new_images = r"D:\UniDoc\y2s1\SEGP\dataset\new_batch\images"  # Newly labeled images (labels in the sibling labels folder)
+incremental_directory = r"D:\UniDoc\y2s1\SEGP\dataset\incremental"
+project_name = 'yolov5_training_project_incremental'
+replay_size = 1000
+replay_strategy = 'diversity'  # 'diversity' or 'loss'
+max_epochs = 50
+patience = 8  # Stop when val fitness has not improved for this many epochs
+batch_size = 16
+img_size = 640
+embedding_size = 320  # Input size for the replay embeddings (diversity)
+finetune_hyp = {'lr0': 0.002, 'warmup_epochs': 0.5}  # Changes to hyp.scratch-low.yaml for fine-tuning
+full_retrain_epochs = 150  # Epochs of a full retrain, for the time comparison
+merge_new = True
+
+EMBEDDING_CACHE = 'replay_embeddings.npz'
+LOG_NAME = 'incremental_log.jsonl'
+
+# Function to make the YOLOv5 repository importable (checkpoints pickle its model classes)
+def add_yolov5_to_path():
+    if yolov5_directory not in sys.path:
+        sys.path.insert(0, yolov5_directory)
+
+# Function to load the current checkpoint as a plain DetectionModel (backbone layers and ComputeLoss need it unwrapped)
+def load_checkpoint(weights_path):
+    import torch
+    add_yolov5_to_path()
+    checkpoint = torch.load(weights_path, map_location='cpu', weights_only=False)
+    model = (checkpoint.get('ema') or checkpoint['model']).float()
+    return model.to(detector.get_device()).eval()
+
+# Function to build the cache key of an image: a changed file gets a new embedding
+def image_key(image_path):
+    stat = os.stat(image_path)
+    return f"{os.path.basename(image_path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+# Function to compute the backbone embedding of a batch of images: features of the last backbone layer (SPPF),
+# averaged over the spatial positions and L2-normalized
+def embed_batch(model, image_paths):
+    import torch
+    batch, _ = detector.preprocess_batch(image_paths, embedding_size)
+    x = detector.to_tensor(batch, detector.model_device(model))
+    with torch.no_grad():
+        # The first ten layers of the YOLOv5 models are the backbone and run one after the other
+        for layer in model.model[:10]:
+            x = layer(x)
+    features = x.mean(dim=(2, 3)).float().cpu().numpy()
+    return features / np.maximum(np.linalg.norm(features, axis=1, keepdims=True), 1e-9)
+
+# Function to get the embeddings of the given images, reusing the cached ones
+def image_embeddings(model, image_paths, cache_path):
+    cached = {}
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cache:
+            cached = dict(zip(cache['keys'].tolist(), cache['embeddings']))
+    keys = [image_key(path) for path in image_paths]
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    print(f"Embeddings: {len(keys) - len(missing)} cached, {len(missing)} to compute")
+    with instrumentation.stage('embed'):
+        for start in range(0, len(missing), batch_size):
+            indices = missing[start:start + batch_size]
+            for i, embedding in zip(indices, embed_batch(model, [image_paths[i] for i in indices])):
+                cached[keys[i]] = embedding
+    if missing:
+        temp_path = cache_path + '.tmp.npz'
+        np.savez(temp_path, keys=np.array(keys), embeddings=np.stack([cached[key] for key in keys]))
+        os.replace(temp_path, cache_path)
+    return np.stack([cached[key] for key in keys]) if keys else np.zeros((0, 1), dtype=np.float32)
+
+# Function to pick k rows that cover all rows as evenly as possible (greedy k-center)
+# The new images are the initial centers, so the buffer favours old data the new batch does not already cover
+def k_center_greedy(embeddings, k, initial_centers=None):
+    chosen = []
+    if initial_centers is not None and len(initial_centers):
+        distance = np.full(len(embeddings), np.inf, dtype=np.float32)
+        for start in range(0, len(initial_centers), 1024):
+            block = initial_centers[start:start + 1024]
+            distance = np.minimum(distance, (2 - 2 * embeddings @ block.T).min(axis=1))
+    else:
+        chosen.append(0)
+        distance = 2 - 2 * embeddings @ embeddings[0]
+    while len(chosen) < min(k, len(embeddings)):
+        farthest = int(np.argmax(distance))
+        chosen.append(farthest)
+        # Squared distance of unit vectors: 2 - 2 cos
+        distance = np.minimum(distance, 2 - 2 * embeddings @ embeddings[farthest])
+    return chosen
+
+# Function to compute the YOLOv5 training loss of every image under the current model
+def image_losses(model, image_paths):
+    import torch
+    add_yolov5_to_path()
+    from utils.loss import ComputeLoss
+    model.hyp = yolo_data.load_data_yaml(os.path.join(yolov5_directory, 'data', 'hyps', 'hyp.scratch-low.yaml'))
+    compute_loss = ComputeLoss(model)
+    device = detector.model_device(model)
+    losses = []
+    with instrumentation.stage('replay_loss'):
+        for start in range(0, len(image_paths), batch_size):
+            paths = image_paths[start:start + batch_size]
+            batch, meta = detector.preprocess_batch(paths, img_size)
+            with torch.no_grad():
+                # In eval mode YOLOv5 returns (predictions, raw feature maps); the loss needs the feature maps
+                _, train_out = model(detector.to_tensor(batch, device))
+            for i, (path, m) in enumerate(zip(paths, meta)):
+                labels = yolo_data.read_labels(yolo_data.label_path_for(path))
+                # Labels to normalized coordinates of the letterboxed input
+                height, width = m['shape']
+                boxes = labels[:, 1:5] * np.array([width, height, width, height], dtype=np.float32) * m['ratio']
+                boxes[:, 0] += m['pad'][0]
+                boxes[:, 1] += m['pad'][1]
+                boxes /= img_size
+                targets = torch.from_numpy(np.column_stack([np.zeros(len(labels)), labels[:, :1], boxes]).astype(np.float32)).to(device)
+                loss, _ = compute_loss([p[i:i + 1] for p in train_out], targets)
+                losses.append(float(loss))
+    return np.array(losses)
+
+# Function to choose the replay buffer from the old training images
+def choose_replay(old_paths, new_paths, cache_directory):
+    if len(old_paths) <= replay_size:
+        return list(old_paths)
+    model = load_checkpoint(weights_path)
+    if replay_strategy == 'loss':
+        losses = image_losses(model, old_paths)
+        order = np.argsort(-losses)[:replay_size]
+        print(f"Replay: {replay_size} highest-loss images (loss {losses[order[-1]]:.3f} to {losses[order[0]]:.3f})")
+        return [old_paths[i] for i in sorted(order)]
+    embeddings = image_embeddings(model, list(old_paths) + list(new_paths), os.path.join(cache_directory, EMBEDDING_CACHE))
+    chosen = k_center_greedy(embeddings[:len(old_paths)], replay_size, embeddings[len(old_paths):])
+    print(f"Replay: {len(chosen)} images chosen by k-center diversity")
+    return [old_paths[i] for i in sorted(chosen)]
+
+# Function to build the incremental dataset (new images + replay buffer) and its data.yaml
+def build_incremental_dataset(new_images=None, incremental_directory=None):
+    new_images = new_images or globals()['new_images']
+    incremental_directory = incremental_directory or globals()['incremental_directory']
+    data = yolo_data.load_data_yaml(data_yaml)
+    old_paths = yolo_data.list_images(yolo_data.split_images_dir(data, 'train', data_yaml))
+    old_names = {os.path.basename(path) for path in old_paths}
+    new_paths = [path for path in yolo_data.list_images(new_images) if os.path.basename(path) not in old_names]
+    if not new_paths:
+        print(f"No new images in {new_images}")
+        return None, 0, 0
+    os.makedirs(incremental_directory, exist_ok=True)
+    replay = choose_replay(old_paths, new_paths, incremental_directory)
+
+    # Rebuild the train folders from scratch so images of the previous refresh do not stay behind
+    images_out = os.path.join(incremental_directory, 'images', 'train')
+    labels_out = os.path.join(incremental_directory, 'labels', 'train')
+    for folder in (images_out, labels_out):
+        os.makedirs(folder, exist_ok=True)
+        for name in os.listdir(folder):
+            os.remove(os.path.join(folder, name))
+    with instrumentation.stage('link_dataset'):
+        for path in new_paths + replay:
+            name = os.path.basename(path)
+            yolo_data.link_or_copy(path, os.path.join(images_out, name))
+            label_path = yolo_data.label_path_for(path)
+            if os.path.exists(label_path):
+                yolo_data.link_or_copy(label_path, os.path.join(labels_out, os.path.splitext(name)[0] + '.txt'))
+
+    incremental_data = dict(data)
+    incremental_data['path'] = incremental_directory
+    incremental_data['train'] = images_out
+    incremental_data['val'] = yolo_data.split_images_dir(data, 'val', data_yaml)
+    incremental_yaml = os.path.join(incremental_directory, 'data.yaml')
+    yolo_data.write_data_yaml(incremental_yaml, incremental_data)
+    print(f"Incremental dataset: {len(new_paths)} new + {len(replay)} replay images ({len(old_paths)} in the full train split)")
+    return incremental_yaml, new_paths, len(old_paths)
+
+# Function to write the fine-tuning hyperparameters: the default hyp file with finetune_hyp applied
+def write_finetune_hyp(incremental_directory):
+    hyp = yolo_data.load_data_yaml(os.path.join(yolov5_directory, 'data', 'hyps', 'hyp.scratch-low.yaml'))
+    hyp.update(finetune_hyp)
+    path = os.path.join(incremental_directory, 'hyp.finetune.yaml')
+    yolo_data.write_data_yaml(path, hyp)
+    return path
+
+# Function to fine-tune from the current best.pt using CLI, returns the run folder
+def fine_tune(incremental_yaml, incremental_directory):
+    name = 'refresh_' + datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+    command = [
+        sys.executable, os.path.join(yolov5_directory, 'train.py'),
+        '--img', str(img_size),
+        '--batch-size', str(batch_size),
+        '--epochs', str(max_epochs),
+        '--patience', str(patience),
+        '--data', incremental_yaml,
+        '--weights', weights_path,  # Start from the current model instead of the COCO-pretrained one
+        '--hyp', write_finetune_hyp(incremental_directory),
+        '--project', os.path.abspath(project_name),
+        '--name', name,
+        '--device', detector.cli_device(),
+        '--cache',  # Cache dataset for faster training
+        '--workers', '2'
+    ]
+    subprocess.run(command, cwd=yolov5_directory)
+    return os.path.join(os.path.abspath(project_name), name)
+
+# Function to read the epochs run and the best val mAP@0.5 from a run's results.csv
+def read_results(run_directory):
+    import csv
+    path = os.path.join(run_directory, 'results.csv')
+    if not os.path.exists(path):
+        return 0, None
+    with open(path, 'r', newline='') as f:
+        rows = [{key.strip(): value.strip() for key, value in row.items() if key} for row in csv.DictReader(f)]
+    maps = [float(row['metrics/mAP_0.5']) for row in rows if row.get('metrics/mAP_0.5')]
+    return len(rows), (max(maps) if maps else None)
+
+# Function to add the new images and labels to the training split, so later refreshes can replay them
+def merge_into_train_split(new_paths):
+    data = yolo_data.load_data_yaml(data_yaml)
+    train_images = yolo_data.split_images_dir(data, 'train', data_yaml)
+    for path in new_paths:
+        destination = os.path.join(train_images, os.path.basename(path))
+        yolo_data.link_or_copy(path, destination)
+        label_path = yolo_data.label_path_for(path)
+        if os.path.exists(label_path):
+            label_destination = yolo_data.label_path_for(destination)
+            os.makedirs(os.path.dirname(label_destination), exist_ok=True)
+            yolo_data.link_or_copy(label_path, label_destination)
+    print(f"Added {len(new_paths)} new images to {train_images}")
+
+# Function to read the refresh log
+def read_log(log_path):
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+# Function to append a record to the refresh log
+def append_log(log_path, record):
+    with open(log_path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+# Function to record the wall-clock time of a full retrain (e.g. of yolo5_small.py) as the comparison baseline
+def log_full_retrain(seconds, images, epochs=None, incremental_directory=None):
+    incremental_directory = incremental_directory or globals()['incremental_directory']
+    os.makedirs(incremental_directory, exist_ok=True)
+    append_log(os.path.join(incremental_directory, LOG_NAME), {
+        'mode': 'full', 'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'seconds': seconds, 'train_images': images, 'epochs': epochs or full_retrain_epochs})
+
+# Function to run one refresh: replay selection, fine-tuning, logging and merging
+def refresh(new_images=None, incremental_directory=None):
+    incremental_directory = incremental_directory or globals()['incremental_directory']
+    start = time.perf_counter()
+    with instrumentation.stage('build_dataset'):
+        incremental_yaml, new_paths, full_images = build_incremental_dataset(new_images, incremental_directory)
+    if incremental_yaml is None:
+        return None
+    prepare_seconds = time.perf_counter() - start
+    with instrumentation.stage('fine_tune'):
+        run_directory = fine_tune(incremental_yaml, incremental_directory)
+    seconds = time.perf_counter() - start
+    epochs, best_map = read_results(run_directory)
+    train_images = len(new_paths) + min(replay_size, full_images)
+
+    # Full retrain time: the last measured one scaled to today's dataset, else estimated from this run
+    log_path = os.path.join(incremental_directory, LOG_NAME)
+    full_runs = [record for record in read_log(log_path) if record['mode'] == 'full']
+    total_images = full_images + len(new_paths)
+    if full_runs:
+        last = full_runs[-1]
+        full_seconds = last['seconds'] * total_images / max(last['train_images'], 1) * full_retrain_epochs / last['epochs']
+        basis = 'measured'
+    else:
+        seconds_per_image_epoch = (seconds - prepare_seconds) / max(epochs * train_images, 1)
+        full_seconds = seconds_per_image_epoch * total_images * full_retrain_epochs
+        basis = 'estimated'
+    record = {
+        'mode': 'incremental', 'date': datetime.datetime.now().isoformat(timespec='seconds'), 'run': run_directory,
+        'new_images': len(new_paths), 'replay_images': train_images - len(new_paths), 'replay_strategy': replay_strategy,
+        'epochs': epochs, 'best_map50': best_map, 'seconds': round(seconds, 1), 'prepare_seconds': round(prepare_seconds, 1),
+        'full_retrain_seconds': round(full_seconds, 1), 'full_retrain_basis': basis,
+        'speedup': round(full_seconds / max(seconds, 1e-9), 2),
+    }
+    append_log(log_path, record)
+    best_weights = os.path.join(run_directory, 'weights', 'best.pt')
+    map_text = f"{best_map:.4f}" if best_map is not None else 'n/a'
+    print(f"Refresh took {seconds / 3600:.2f} h for {epochs} epochs (best mAP@0.5 {map_text}); a full retrain would take "
+          f"{full_seconds / 3600:.1f} h ({basis}), {record['speedup']:.1f}x longer")
+    if os.path.exists(best_weights):
+        print(f"New weights: {best_weights}")
+        if merge_new:
+            merge_into_train_split(new_paths)
+    else:
+        print("Error: training produced no best.pt; the new images were not merged.")
+    return record
+
+if __name__ == '__main__':
+    refresh()
@@ -0,0 +1,217 @@
+# This script prunes conv channels of a trained YOLOv5 checkpoint (nano or small) to make the on-device model faster.
+# Channels are ranked by the absolute scale of their BatchNorm layer ('bn') or the L1 norm of their conv weights ('l1'),
+# and removed structurally with torch-pruning, so the pruned layers are genuinely narrower and not just zeroed.
+# Pruning runs in equal steps until the FLOPs reach target_flops_ratio of the original; after every step the model is
+# fine-tuned for a few epochs with YOLOv5's own data loader and loss, evaluated with val.py's run(), and timed on CPU.
+# Every step is saved as a checkpoint and written to prune_report.json, so the accuracy/latency trade-off can be read
+# off the report and any step picked for deployment.
+#
+# The chosen checkpoint is exported to the TF.js graph-model bundle loaded by modelLoader.ts (model.json +
+# group1-shard1of1.bin). YOLOv5's own TF export rebuilds the network from the model yaml, which no longer matches a
+# pruned model, so the export goes ONNX (export.py) -> TensorFlow SavedModel (onnx2tf) -> TF.js (tensorflowjs_converter).
+#
+# Requires: torch-pruning (pip install torch-pruning); for the export also onnx, onnx2tf and tensorflowjs.
+
+import os
+import sys
+import json
+import time
+import subprocess
+from copy import deepcopy
+
+# Silence GitPython warnings/errors if Git is not available
+os.environ['GIT_PYTHON_REFRESH'] = 'quiet'
+# Set CUDA module loading to lazy to prevent DLL initialization issues
+os.environ["CUDA_MODULE_LOADING"] = "LAZY"
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+
+# Define pruning parameters
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+weights_path = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project\exp7\weights\best.pt"  # Trained nano model
+data_yaml = r"D:\UniDoc\y2s1\SEGP\dataset\script_testing\yolo_dataset_splited\data.yaml"
+output_directory = 'yolov5_pruning_project'
+img_size = 640
+criterion = 'bn'  # 'bn' (BatchNorm scale) or 'l1' (conv weight L1 norm)
+target_flops_ratio = 0.5  # Stop when FLOPs are at or below this fraction of the original
+max_pruning_ratio = 0.6  # Fraction of each layer's channels removed by the last step, in max_steps equal steps
+max_steps = 10
+finetune_epochs = 3  # Short fine-tune after every step
+batch_size = 16
+learning_rate = 0.001
+latency_runs = 20  # Forward passes timed on CPU per step
+
+# Function to make the YOLOv5 repository importable (checkpoints pickle its model classes)
+def add_yolov5_to_path():
+    if yolov5_directory not in sys.path:
+        sys.path.insert(0, yolov5_directory)
+
+# Function to import torch-pruning, which is only needed by this script
+def import_torch_pruning():
+    try:
+        import torch_pruning
+    except ImportError:
+        raise SystemExit("torch-pruning is not installed. Install it with: pip install torch-pruning")
+    return torch_pruning
+
+# Function to load a YOLOv5 checkpoint as a trainable float model
+def load_checkpoint(weights_path):
+    import torch
+    add_yolov5_to_path()
+    checkpoint = torch.load(weights_path, map_location='cpu', weights_only=False)
+    model = (checkpoint.get('ema') or checkpoint['model']).float()
+    for parameter in model.parameters():
+        parameter.requires_grad = True
+    return model
+
+# Function to count the multiply-accumulate operations and parameters of a model at img_size
+def count_flops(model, device='cpu'):
+    import torch
+    tp = import_torch_pruning()
+    example = torch.zeros(1, 3, img_size, img_size, device=device)
+    macs, params = tp.utils.count_ops_and_params(model, example)
+    return macs, params
+
+# Function to time single-image CPU inference, returns the median in milliseconds
+def measure_latency(model, runs=None):
+    import torch
+    runs = runs or latency_runs
+    model = deepcopy(model).cpu().eval()
+    example = torch.zeros(1, 3, img_size, img_size)
+    timings = []
+    with torch.no_grad():
+        for i in range(runs + 3):
+            start = time.perf_counter()
+            model(example)
+            if i >= 3:  # The first passes warm up the allocator
+                timings.append((time.perf_counter() - start) * 1000)
+    return sorted(timings)[len(timings) // 2]
+
+# Function to build the structured pruner for a YOLOv5 model
+def build_pruner(model, device, steps):
+    import torch
+    tp = import_torch_pruning()
+    importance = tp.importance.BNScaleImportance() if criterion == 'bn' else tp.importance.MagnitudeImportance(p=1)
+    # The Detect head's output convs define the anchor/class layout and must keep all their channels
+    ignored_layers = [model.model[-1]]
+    example = torch.zeros(1, 3, img_size, img_size, device=device)
+    return tp.pruner.MagnitudePruner(model, example, importance=importance, iterative_steps=steps,
+                                     pruning_ratio=max_pruning_ratio, ignored_layers=ignored_layers)
+
+# Function to create the YOLOv5 data loaders and hyperparameters used for fine-tuning and validation
+def create_loaders(model, device):
+    add_yolov5_to_path()
+    import yaml
+    from utils.dataloaders import create_dataloader
+    from utils.general import check_dataset
+    data = check_dataset(data_yaml)
+    with open(os.path.join(yolov5_directory, 'data', 'hyps', 'hyp.scratch-low.yaml'), 'r') as f:
+        hyp = yaml.safe_load(f)
+    stride = max(int(model.stride.max()), 32)
+    workers = 0 if device == 'cpu' else 2
+    train_loader = create_dataloader(data['train'], img_size, batch_size, stride, hyp=hyp, augment=True,
+                                     workers=workers, prefix='train: ', shuffle=True)[0]
+    val_loader = create_dataloader(data['val'], img_size, batch_size * 2, stride, rect=True, pad=0.5,
+                                   workers=workers, prefix='val: ')[0]
+    return data, hyp, train_loader, val_loader
+
+# Function to fine-tune a pruned model for a few epochs with YOLOv5's loss
+def fine_tune(model, hyp, train_loader, device, epochs):
+    import torch
+    from utils.loss import ComputeLoss
+    model.hyp = hyp
+    model.train()
+    compute_loss = ComputeLoss(model)
+    optimizer = torch.optim.SGD(model.parameters(), lr=learning_rate, momentum=hyp['momentum'], nesterov=True)
+    for epoch in range(epochs):
+        total = 0.0
+        for images, targets, _, _ in train_loader:
+            images = images.to(device).float() / 255.0
+            with instrumentation.stage('finetune_step'):
+                loss, _ = compute_loss(model(images), targets.to(device))
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+            total += loss.item()
+        print(f"  fine-tune epoch {epoch + 1}/{epochs}: loss {total / max(len(train_loader), 1):.4f}")
+    return model
+
+# Function to evaluate a model with val.py's run(), returns (mAP@0.5, mAP@0.5:0.95)
+def evaluate(model, data, val_loader):
+    add_yolov5_to_path()
+    import val as validate
+    with instrumentation.stage('validate'):
+        results, _, _ = validate.run(data=data, batch_size=batch_size * 2, imgsz=img_size, model=model.eval(),
+                                     dataloader=val_loader, half=False, plots=False)
+    return results[2], results[3]
+
+# Function to save a pruned model in the checkpoint format detect.py, val.py and export.py load
+def save_checkpoint(model, path):
+    import torch
+    torch.save({'model': deepcopy(model).half(), 'epoch': -1, 'optimizer': None, 'ema': None}, path)
+
+# Function to prune step by step until the FLOP target is reached, returns the report rows
+def prune(weights_path=None, output_directory=None):
+    weights_path = weights_path or globals()['weights_path']
+    output_directory = output_directory or globals()['output_directory']
+    os.makedirs(output_directory, exist_ok=True)
+    device = detector.get_device()
+
+    model = load_checkpoint(weights_path).to(device)
+    data, hyp, train_loader, val_loader = create_loaders(model, device)
+    base_macs, base_params = count_flops(model, device)
+    map50, map50_95 = evaluate(model, data, val_loader)
+    report = [{'step': 0, 'macs': base_macs, 'params': base_params, 'flops_ratio': 1.0, 'map50': map50,
+               'map50_95': map50_95, 'latency_ms': measure_latency(model), 'weights': weights_path}]
+    print(f"Original: {base_macs / 1e9:.2f} GMACs, mAP@0.5 {map50:.3f}, {report[0]['latency_ms']:.1f} ms")
+
+    pruner = build_pruner(model, device, max_steps)
+    for step in range(1, max_steps + 1):
+        with instrumentation.stage('prune_step'):
+            model.train()
+            pruner.step()
+        macs, params = count_flops(model, device)
+        print(f"Step {step}: {macs / base_macs:.0%} of the original FLOPs, fine-tuning...")
+        fine_tune(model, hyp, train_loader, device, finetune_epochs)
+        map50, map50_95 = evaluate(model, data, val_loader)
+        step_weights = os.path.join(output_directory, f'pruned_step{step}.pt')
+        save_checkpoint(model, step_weights)
+        report.append({'step': step, 'macs': macs, 'params': params, 'flops_ratio': macs / base_macs, 'map50': map50,
+                       'map50_95': map50_95, 'latency_ms': measure_latency(model), 'weights': step_weights})
+        with open(os.path.join(output_directory, 'prune_report.json'), 'w') as f:
+            json.dump(report, f, indent=4)
+        if macs / base_macs <= target_flops_ratio:
+            break
+
+    print_report(report)
+    return report
+
+# Function to print the report as a table
+def print_report(report):
+    print(f"{'step':>4}{'GMACs':>8}{'params M':>10}{'FLOPs':>8}{'mAP@.5':>8}{'mAP@.5:.95':>12}{'CPU ms':>9}  weights")
+    for row in report:
+        print(f"{row['step']:>4}{row['macs'] / 1e9:>8.2f}{row['params'] / 1e6:>10.2f}{row['flops_ratio']:>8.0%}"
+              f"{row['map50']:>8.3f}{row['map50_95']:>12.3f}{row['latency_ms']:>9.1f}  {row['weights']}")
+
+# Function to export a (pruned) checkpoint to the TF.js bundle used by the app
+def export_tfjs(weights, output_directory=None):
+    output_directory = output_directory or os.path.join(globals()['output_directory'], 'tfjs_model')
+    # 1. ONNX through YOLOv5's export.py, which loads the pruned checkpoint as it is
+    subprocess.run([sys.executable, os.path.join(yolov5_directory, 'export.py'), '--weights', weights,
+                    '--img', str(img_size), '--include', 'onnx', '--opset', '12'], check=True)
+    onnx_path = os.path.splitext(weights)[0] + '.onnx'
+    # 2. ONNX -> TensorFlow SavedModel with NHWC input, the layout the app feeds (expandDims of a 640x640x3 image)
+    saved_model = os.path.splitext(weights)[0] + '_saved_model'
+    subprocess.run(['onnx2tf', '-i', onnx_path, '-o', saved_model], check=True)
+    # 3. SavedModel -> TF.js graph model in a single weight shard (group1-shard1of1.bin)
+    subprocess.run(['tensorflowjs_converter', '--input_format=tf_saved_model', '--output_format=tfjs_graph_model',
+                    '--weight_shard_size_bytes=1000000000', saved_model, output_directory], check=True)
+    bundle_bytes = sum(os.path.getsize(os.path.join(output_directory, f)) for f in os.listdir(output_directory))
+    print(f"TF.js model written to {output_directory} ({bundle_bytes / 1e6:.1f} MB); copy it to assets/models")
+    return output_directory
+
+if __name__ == '__main__':
+    prune()
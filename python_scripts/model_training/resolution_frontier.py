@@ -0,0 +1,181 @@
+# This script measures how the trained checkpoints trade accuracy for speed at smaller input sizes.
+# Every checkpoint is evaluated on the val split at every size in img_sizes with YOLOv5's val.py run() (precision,
+# recall, mAP@0.5, mAP@0.5:0.95), and timed on CPU at batch size 1 (median latency and peak memory).
+# Each (checkpoint, size) pair runs in its own process so the memory numbers do not include earlier runs, and the CPU
+# latency pass runs before val.py, so the peak memory is the model's alone and not val.py's data loader and batches.
+# The results are saved as JSON and CSV, the Pareto frontier (no other point is both faster and more accurate) is
+# printed as a table, and a latency/accuracy plot is written next to them. Use it to choose img_size for the mining
+# scans (find_FPsample.py) and for the mobile export instead of assuming 640.
+
+import os
+import sys
+import csv
+import json
+import time
+import multiprocessing
+
+# Silence GitPython warnings/errors if Git is not available
+os.environ['GIT_PYTHON_REFRESH'] = 'quiet'
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Define benchmark parameters
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+data_yaml = r"D:\UniDoc\y2s1\SEGP\dataset\script_testing\yolo_dataset_splited\data.yaml"
+checkpoints = {
+    'nano': r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project\exp7\weights\best.pt",
+    'small': r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_small\exp12\weights\best.pt",
+}
+img_sizes = [320, 416, 512, 640]
+batch_size = 16
+latency_runs = 30  # Timed single-image forward passes per point
+threads = 0  # Torch CPU threads for the latency runs (0 keeps the default)
+frontier_metric = 'recall'  # Accuracy axis of the frontier: 'recall', 'map50' or 'map50_95'
+output_directory = 'resolution_frontier'
+
+# Function to read the peak memory of this process in MB
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024.0  # Bytes on macOS, KB on Linux
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1e6  # Windows
+
+# Function executed in a fresh process: evaluate one checkpoint at one input size
+# settings carries the configuration, since a spawned process re-imports this module with its default globals
+def measure_point(name, weights, img_size, settings, queue):
+    try:
+        import torch
+        yolov5_directory = settings['yolov5_directory']
+        if yolov5_directory not in sys.path:
+            sys.path.insert(0, yolov5_directory)
+        from common import detector
+
+        # Latency on CPU at batch size 1, the way the mining scans and the phone run the model
+        default_threads = torch.get_num_threads()
+        if settings['threads']:
+            torch.set_num_threads(settings['threads'])
+        model = detector.load_raw_model(weights, yolov5_directory, 'cpu')
+        stride = detector.model_stride(model)
+        size = (img_size + stride - 1) // stride * stride
+        example = torch.zeros(1, 3, size, size)
+        timings = []
+        with torch.no_grad():
+            for i in range(settings['latency_runs'] + 3):
+                start = time.perf_counter()
+                model(example)
+                if i >= 3:  # Warm-up passes are not timed
+                    timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        # The peak is read before val.py runs, which would raise it with its data loader and batch_size batches
+        peak_memory = peak_rss_mb()
+        del model
+        torch.set_num_threads(default_threads)
+
+        import val as validate
+        device = '0' if torch.cuda.is_available() else 'cpu'
+        results = validate.run(data=settings['data_yaml'], weights=weights, batch_size=settings['batch_size'], imgsz=img_size,
+                               device=device, plots=False, verbose=False)[0]
+        precision, recall, map50, map50_95 = results[:4]
+        queue.put({
+            'status': 'ok', 'checkpoint': name, 'img_size': img_size,
+            'precision': float(precision), 'recall': float(recall), 'map50': float(map50), 'map50_95': float(map50_95),
+            'latency_ms': timings[len(timings) // 2], 'latency_p90_ms': timings[int(len(timings) * 0.9) - 1],
+            'peak_rss_mb': peak_memory,
+        })
+    except Exception as e:
+        queue.put({'status': 'error', 'checkpoint': name, 'img_size': img_size, 'error': f"{type(e).__name__}: {e}"})
+
+# Function to run one point in a child process
+def run_point(name, weights, img_size):
+    settings = {'yolov5_directory': yolov5_directory, 'data_yaml': data_yaml, 'batch_size': batch_size,
+                'latency_runs': latency_runs, 'threads': threads}
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=measure_point, args=(name, weights, img_size, settings, queue))
+    process.start()
+    process.join()
+    if not queue.empty():
+        return queue.get()
+    return {'status': 'error', 'checkpoint': name, 'img_size': img_size, 'error': f"process exited with code {process.exitcode}"}
+
+# Function to mark the points no other point beats on both latency and accuracy
+def pareto_frontier(points, metric='recall'):
+    frontier = []
+    for point in points:
+        dominated = any(other is not point
+                        and other['latency_ms'] <= point['latency_ms'] and other[metric] >= point[metric]
+                        and (other['latency_ms'] < point['latency_ms'] or other[metric] > point[metric])
+                        for other in points)
+        point['pareto'] = not dominated
+        if not dominated:
+            frontier.append(point)
+    return sorted(frontier, key=lambda point: point['latency_ms'])
+
+# Function to print the results as a table, frontier points marked with *
+def print_table(points):
+    print(f"\n{'checkpoint':<12}{'size':>6}{'P':>7}{'R':>7}{'mAP@.5':>8}{'mAP@.5:.95':>12}{'CPU ms':>9}{'RSS MB':>9}")
+    for point in sorted(points, key=lambda point: point['latency_ms']):
+        print(f"{point['checkpoint']:<12}{point['img_size']:>6}{point['precision']:>7.3f}{point['recall']:>7.3f}"
+              f"{point['map50']:>8.3f}{point['map50_95']:>12.3f}{point['latency_ms']:>9.1f}{point['peak_rss_mb']:>9.0f}"
+              f"{'  *' if point['pareto'] else ''}")
+    print(f"* Pareto frontier on latency vs {frontier_metric}")
+
+# Function to plot latency against accuracy, one line per checkpoint, with the frontier highlighted
+def plot_frontier(points, frontier, output_path):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plt.figure(figsize=(8, 5))
+    for name in sorted({point['checkpoint'] for point in points}):
+        series = sorted((p for p in points if p['checkpoint'] == name), key=lambda p: p['img_size'])
+        plt.plot([p['latency_ms'] for p in series], [p[frontier_metric] for p in series], 'o-', label=name)
+        for p in series:
+            plt.annotate(str(p['img_size']), (p['latency_ms'], p[frontier_metric]), textcoords='offset points', xytext=(4, 4))
+    plt.step([p['latency_ms'] for p in frontier], [p[frontier_metric] for p in frontier], 'k--', where='post', label='Pareto frontier')
+    plt.xlabel('CPU latency per image (ms)')
+    plt.ylabel(frontier_metric)
+    plt.title('Input size: accuracy vs latency')
+    plt.legend()
+    plt.grid(alpha=0.3)
+    plt.savefig(output_path, dpi=150, bbox_inches='tight')
+    plt.close()
+
+# Function to run the whole grid and write the report
+def run_frontier(checkpoints=None, img_sizes=None, output_directory=None):
+    checkpoints = checkpoints or globals()['checkpoints']
+    img_sizes = img_sizes or globals()['img_sizes']
+    output_directory = output_directory or globals()['output_directory']
+    os.makedirs(output_directory, exist_ok=True)
+
+    points = []
+    for name, weights in checkpoints.items():
+        for img_size in img_sizes:
+            print(f"Evaluating {name} at {img_size}...")
+            result = run_point(name, weights, img_size)
+            if result['status'] != 'ok':
+                print(f"  Failed: {result['error']}")
+                continue
+            print(f"  recall {result['recall']:.3f}, mAP@0.5 {result['map50']:.3f}, {result['latency_ms']:.1f} ms")
+            points.append(result)
+    if not points:
+        print("No results.")
+        return []
+
+    frontier = pareto_frontier(points, frontier_metric)
+    print_table(points)
+    with open(os.path.join(output_directory, 'frontier.json'), 'w') as f:
+        json.dump({'metric': frontier_metric, 'data': data_yaml, 'points': points}, f, indent=4)
+    with open(os.path.join(output_directory, 'frontier.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(points[0]))
+        writer.writeheader()
+        writer.writerows(points)
+    plot_frontier(points, frontier, os.path.join(output_directory, 'frontier.png'))
+    print(f"Results saved to {output_directory}")
+    return points
+
+if __name__ == '__main__':
+    run_frontier()
@@ -0,0 +1,132 @@
+# This script reads the tar shards written by data_processing_annotation/dataset_shards.py for PyTorch training and
+# evaluation.
+# ShardDataset is read as an IterableDataset: each data-loader worker (and each process in distributed training) reads its own
+# subset of the shards sequentially, and samples are mixed with a shuffle buffer instead of random file access.
+# Images are letterboxed to img_size and labels are adjusted to the letterboxed image; collate_fn returns batches
+# in the layout YOLOv5 uses (images, targets [batch index, class, cx, cy, w, h], keys).
+# evaluate_shards runs a detector over a shard folder and reports precision and recall at an IoU threshold.
+
+import io
+import os
+import sys
+import numpy as np
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import instrumentation
+from common import detector
+from common import yolo_data
+from data_processing_annotation import dataset_shards
+
+# Define paths and evaluation settings
+shard_dir = r"D:\UniDoc\y2s1\SEGP\dataset\new_yolo_dataset\shards\val"
+weights_path = r"D:\UniDoc\y2s1\SEGP\yolov5\yolov5_training_project_small\exp12\weights\best.pt"
+yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
+img_size = 640
+batch_size = 32
+
+# Dataset that streams the samples of a shard folder
+# It does not subclass torch's IterableDataset so importing this module does not import torch; create_dataloader
+# registers it as one instead
+class ShardDataset:
+    def __init__(self, shard_dir, img_size=640, shuffle_buffer=1000, seed=0):
+        self.shard_dir = shard_dir
+        self.img_size = img_size
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        self.epoch = 0
+        self.shard_names = [shard['name'] for shard in dataset_shards.load_index(shard_dir)['shards']]
+
+    # Call once per epoch so every epoch reads the shards in a different order
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __iter__(self):
+        import torch
+        from torch.utils.data import get_worker_info
+        # Each distributed process and each of its workers gets its own shards
+        rank, world_size = 0, 1
+        if torch.distributed.is_available() and torch.distributed.is_initialized():
+            rank, world_size = torch.distributed.get_rank(), torch.distributed.get_world_size()
+        worker = get_worker_info()
+        worker_id, num_workers = (worker.id, worker.num_workers) if worker else (0, 1)
+
+        shard_names = list(self.shard_names)
+        if self.shuffle_buffer > 1:
+            np.random.RandomState(self.seed + self.epoch).shuffle(shard_names)
+        shard_names = dataset_shards.shards_for_worker(shard_names, rank * num_workers + worker_id, world_size * num_workers)
+
+        seed = self.seed + self.epoch * 1000 + rank * num_workers + worker_id
+        for key, _, image_data, label_text in dataset_shards.iter_samples(self.shard_dir, shard_names, self.shuffle_buffer, seed):
+            image, labels = load_sample(image_data, label_text, self.img_size)
+            yield torch.from_numpy(image).permute(2, 0, 1), torch.from_numpy(labels), key
+
+# Function to decode one sample, letterbox it, and move its normalized labels onto the letterboxed image
+def load_sample(image_data, label_text, img_size=640):
+    array = detector.decode_image(io.BytesIO(image_data))
+    height, width = array.shape[:2]
+    image, ratio, (pad_x, pad_y) = detector.letterbox(array, (img_size, img_size))
+    labels = np.array(dataset_shards.parse_labels(label_text), dtype=np.float32).reshape(-1, 5)
+    labels[:, 1] = (labels[:, 1] * width * ratio + pad_x) / img_size
+    labels[:, 2] = (labels[:, 2] * height * ratio + pad_y) / img_size
+    labels[:, 3] *= width * ratio / img_size
+    labels[:, 4] *= height * ratio / img_size
+    return image, labels
+
+# Function to stack samples into a YOLOv5-style batch: float images / 255, targets [batch index, class, cx, cy, w, h]
+def collate_fn(samples):
+    import torch
+    images = torch.stack([s[0] for s in samples]).float() / 255.0
+    targets = [torch.cat([torch.full((len(s[1]), 1), i, dtype=torch.float32), s[1]], 1) for i, s in enumerate(samples)]
+    return images, torch.cat(targets), [s[2] for s in samples]
+
+# Function to create a DataLoader over a shard folder
+def create_dataloader(shard_dir, img_size=640, batch_size=16, workers=2, shuffle_buffer=1000, seed=0):
+    import torch
+    from torch.utils.data import IterableDataset, DataLoader
+    # Registered as a virtual subclass so the DataLoader reads it as a stream instead of by index
+    IterableDataset.register(ShardDataset)
+    dataset = ShardDataset(shard_dir, img_size, shuffle_buffer, seed)
+    return DataLoader(dataset, batch_size=batch_size, num_workers=workers, collate_fn=collate_fn,
+                      pin_memory=torch.cuda.is_available())
+
+# Function to count true positives by greedily matching detections (highest confidence first) to ground truth boxes
+def match_detections(detections, ground_truth, iou_thres=0.5):
+    if not len(detections) or not len(ground_truth):
+        return 0
+    ious = yolo_data.box_iou(detections[:, :4], ground_truth[:, 1:5])
+    ious[detections[:, 5][:, None] != ground_truth[:, 0][None, :]] = 0  # Boxes only match within the same class
+    matched = np.zeros(len(ground_truth), dtype=bool)
+    true_positives = 0
+    for i in np.argsort(-detections[:, 4]):
+        candidates = np.where(~matched & (ious[i] >= iou_thres))[0]
+        if len(candidates):
+            matched[candidates[np.argmax(ious[i, candidates])]] = True
+            true_positives += 1
+    return true_positives
+
+# Function to evaluate a detector on a shard folder, returns precision, recall and counts
+def evaluate_shards(shard_dir=shard_dir, model=None, conf_thres=0.4, iou_thres=0.5):
+    model = model or detector.load_raw_model(weights_path, yolov5_directory)
+    totals = {'images': 0, 'detections': 0, 'ground_truth': 0, 'true_positives': 0}
+    for keys, _, images, labels in dataset_shards.iter_batches(shard_dir, batch_size):
+        results, shapes = detector.detect_batch(model, [io.BytesIO(data) for data in images], img_size, conf_thres)
+        with instrumentation.stage('match'):
+            for detections, label_text, (height, width) in zip(results, labels, shapes):
+                # Ground truth to pixel xyxy: class, x1, y1, x2, y2
+                ground_truth = np.array(dataset_shards.parse_labels(label_text), dtype=np.float32).reshape(-1, 5)
+                cx, cy, w, h = ground_truth[:, 1] * width, ground_truth[:, 2] * height, ground_truth[:, 3] * width, ground_truth[:, 4] * height
+                ground_truth = np.column_stack([ground_truth[:, 0], cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+                totals['true_positives'] += match_detections(detections, ground_truth, iou_thres)
+                totals['detections'] += len(detections)
+                totals['ground_truth'] += len(ground_truth)
+        totals['images'] += len(keys)
+
+    totals['precision'] = totals['true_positives'] / totals['detections'] if totals['detections'] else 0.0
+    totals['recall'] = totals['true_positives'] / totals['ground_truth'] if totals['ground_truth'] else 0.0
+    print(f"{totals['images']} images: precision {totals['precision']:.3f}, recall {totals['recall']:.3f} "
+          f"at IoU {iou_thres} ({totals['true_positives']} TP, {totals['detections']} detections, {totals['ground_truth']} labels)")
+    return totals
+
+if __name__ == '__main__':
+    evaluate_shards()
@@ -4,7 +4,6 @@
 # and uses the YOLOv5 CLI train.py and val.py scripts via subprocess to perform training and validation.
 # It automatically selects GPU if available and handles weight saving/loading during evaluation.
 import os
-import torch
 import subprocess
 import sys
 
@@ -13,6 +12,10 @@ os.environ['GIT_PYTHON_REFRESH'] = 'quiet'
 # Set CUDA module loading to lazy to prevent DLL initialization issues
 os.environ["CUDA_MODULE_LOADING"] = "LAZY"
 
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import detector
+
 # Define training parameters
 data_yaml = r"D:\UniDoc\y2s1\SEGP\dataset\script_testing\yolo_dataset_splited\data.yaml" # Path to the dataset configuration file
 model = 'yolov5s.pt'  # YOLOv5 Small pre-trained model
@@ -32,7 +35,7 @@ def train_yolov5():
         '--data', data_yaml,
         '--weights', model,
         '--project', project_name,
-        '--device', '0' if torch.cuda.is_available() else 'cpu',  # Ensure GPU is used if available
+        '--device', detector.cli_device(),  # Ensure GPU is used if available
         '--cache',  # Cache dataset for faster training
         '--workers', '1'  # Set number of data loader workers based on system capabilities
     ]
@@ -58,7 +61,7 @@ def evaluate_yolov5():
         '--data', data_yaml,
         '--img', str(img_size),
         '--batch-size', str(batch_size),  # Corrected from '--batch' to '--batch-size'
-        '--device', '0' if torch.cuda.is_available() else 'cpu'
+        '--device', detector.cli_device()
     ]
     subprocess.run(command)
 
@@ -67,7 +70,7 @@ if __name__ == '__main__':
     os.system('git config --global --add safe.directory D:/UniDoc/y2s1/SEGP/yolov5')
 
     # Check if GPU is available
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    device = detector.get_device()
     print(f"Using device: {device}")
 
     # Train YOLOv5
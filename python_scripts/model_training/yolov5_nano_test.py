@@ -4,11 +4,12 @@
 # and displays the resulting image using OpenCV and Matplotlib.
 
 import os
-import torch
 import subprocess
 import sys
-import cv2
-import matplotlib.pyplot as plt
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import detector
 
 # Path to YOLOv5 directory, trained weights, and dataset
 yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'  # Update to where YOLOv5 repository is located
@@ -36,7 +37,7 @@ def test_yolov5():
         '--weights', weights_path,
         '--img', str(img_size),
         '--source', image_path,  # Path to the input image or folder of images
-        '--device', '0' if torch.cuda.is_available() else 'cpu',  # Ensure GPU is used if available
+        '--device', detector.cli_device(),  # Ensure GPU is used if available
         '--conf-thres', '0.25',  # Confidence threshold for detection
         '--save-txt',  # Save detection results in text files
         '--save-conf',  # Save confidences in text files
@@ -47,6 +48,9 @@ def test_yolov5():
     subprocess.run(command, cwd=yolov5_directory)  # Set working directory to YOLOv5
 
 def show_output_image():
+    import cv2
+    import matplotlib.pyplot as plt
+
     # Path to the output image
     output_image_path = os.path.join(output_folder, os.path.basename(image_path))
     
@@ -71,7 +75,7 @@ def show_output_image():
 
 if __name__ == '__main__':
     # Check if GPU is available
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    device = detector.get_device()
     print(f"Using device: {device}")
 
     # Test YOLOv5
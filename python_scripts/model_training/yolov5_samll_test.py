@@ -4,12 +4,13 @@
 # and displays the resulting image using OpenCV and Matplotlib.
 
 import os
-import torch
 import subprocess
 import sys
-import cv2
+
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import detector
 import shutil
-import matplotlib.pyplot as plt
 
 # Path to YOLOv5 directory, trained weights, and dataset
 yolov5_directory = r'D:\UniDoc\y2s1\SEGP\yolov5'
@@ -45,7 +46,7 @@ def test_yolov5():
         '--weights', weights_path,
         '--img', str(img_size),
         '--source', image_path,
-        '--device', '0' if torch.cuda.is_available() else 'cpu',
+        '--device', detector.cli_device(),
         '--conf-thres', '0.4',  
         '--save-txt',
         '--save-conf',
@@ -94,6 +95,9 @@ def count_bounding_boxes():
 
 # Function to show the output image with detections
 def show_output_image():
+    import cv2
+    import matplotlib.pyplot as plt
+
     output_image_path = os.path.join(output_folder, os.path.basename(image_path))
     if not os.path.exists(output_image_path):
         print(f"Error: No output image found at {output_image_path}")
@@ -110,7 +114,7 @@ def show_output_image():
     plt.show()
 
 if __name__ == '__main__':
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    device = detector.get_device()
     print(f"Using device: {device}")
 
     # Test YOLOv5
@@ -5,16 +5,18 @@
 # Evaluation includes printing metrics and confusion matrix.
 
 import os
-import torch
 import subprocess
 import sys
-from ultralytics import YOLO
 
 # Silence GitPython warnings/errors if Git is not available
 os.environ['GIT_PYTHON_REFRESH'] = 'quiet'
 # Set CUDA module loading to lazy to prevent DLL initialization issues
 os.environ["CUDA_MODULE_LOADING"] = "LAZY"
 
+# Make the shared python_scripts modules importable when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common import detector
+
 # Define training parameters
 data_yaml = r"D:\UniDoc\y2s1\SEGP\dataset\script_testing\yolo_dataset_splited\data.yaml"  # Path to the dataset configuration file
 model = 'yolov8s.pt'  # YOLOv8 Small pre-trained model
@@ -26,6 +28,7 @@ weights_path = f'{project_name}/weights/best.pt'  # Path to save the best weight
 
 # Function to train YOLOv8 model using the ultralytics library
 def train_yolov8():
+    from ultralytics import YOLO
     model = YOLO('yolov8s.pt')  # Load the YOLOv8 Small pre-trained model
 
     # Train the model
@@ -34,7 +37,7 @@ def train_yolov8():
         epochs=epochs,  # Number of epochs for training
         batch=batch,  # Batch size (corrected from 'batch_size' to 'batch')
         imgsz=imgsz,  # Image size
-        device='0' if torch.cuda.is_available() else 'cpu',  # Use GPU if available
+        device=detector.cli_device(),  # Use GPU if available
         workers=2,  # Number of data loader workers
         project=project_name,  # Project name for saving results
         name='custom_model',  # Name for the experiment
@@ -44,6 +47,8 @@ def train_yolov8():
 
 # Function to evaluate YOLOv8 model using the ultralytics library
 def evaluate_yolov8():
+    from ultralytics import YOLO
+
     # Check if 'best.pt' or 'last.pt' exists
     best_weights_path = f'{project_name}/runs/train/custom_model/weights/best.pt'
     last_weights_path = f'{project_name}/runs/train/custom_model/weights/last.pt'
@@ -60,7 +65,7 @@ def evaluate_yolov8():
     model = YOLO(f'{project_name}/runs/train/custom_model/weights/{weights_file}')
 
     # Evaluate the model
-    results = model.val(data=data_yaml, imgsz=imgsz, batch=batch, device='0' if torch.cuda.is_available() else 'cpu')
+    results = model.val(data=data_yaml, imgsz=imgsz, batch=batch, device=detector.cli_device())
 
     # Print the evaluation results
     print("Evaluation Results:")
@@ -76,7 +81,7 @@ if __name__ == '__main__':
     os.system('git config --global --add safe.directory D:/UniDoc/y2s1/SEGP/yolov5')
 
     # Check if GPU is available
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    device = detector.get_device()
     print(f"Using device: {device}")
 
     # Train YOLOv8